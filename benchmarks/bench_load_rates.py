@@ -0,0 +1,68 @@
+import argparse
+import io
+import os
+import sys
+import time
+import numpy as np
+from scipy.sparse import csr_matrix
+# run from the repository without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from kmr_dataset.io import _prepare_rate_loader
+from kmr_dataset.io import load_rates
+from kmr_dataset.install import open_datafile
+
+
+def load_rates_per_line(directory=None, size='small'):
+    """
+    Per-line python parser which was used before the vectorized parser.
+    It is kept only as the reference of this benchmark
+    """
+    path, parser = _prepare_rate_loader(directory, size)
+    rows, cols, data, timestamps = [], [], [], []
+    exists = set()
+    with io.TextIOWrapper(open_datafile(path), encoding='utf-8') as f:
+        next(f)
+        for line in f:
+            i, j, v, t = parser(line)
+            key = (i, j)
+            if key in exists:
+                continue
+            rows.append(i)
+            cols.append(j)
+            data.append(v)
+            timestamps.append(t)
+            exists.add(key)
+    rates = csr_matrix((data, (rows, cols)))
+    timestamps = np.array(timestamps, dtype=np.int64)
+    return rates, timestamps
+
+def measure(func, repeat, **kwargs):
+    times = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result = func(**kwargs)
+        times.append(time.perf_counter() - begin)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--directory', type=str, default=None, help='Data directory')
+    parser.add_argument('--sizes', type=str, nargs='+', default=['small', '2m', '5m'], help='Dataset sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of repeats. Report the best')
+
+    args = parser.parse_args()
+    print('size\tnnz\tper-line (sec)\tvectorized (sec)\tspeedup')
+    for size in args.sizes:
+        try:
+            _prepare_rate_loader(args.directory, size)
+        except Exception as e:
+            print(f'{size}\tskipped: {e}')
+            continue
+        t_base, (x_base, _) = measure(load_rates_per_line, args.repeat, directory=args.directory, size=size)
+        t_vec, (x_vec, _) = measure(load_rates, args.repeat, directory=args.directory, size=size, cache=False)
+        if (x_base != x_vec).nnz > 0:
+            raise ValueError(f'Loaded matrices of {size} are different')
+        print(f'{size}\t{x_vec.nnz}\t{t_base:.3f}\t{t_vec:.3f}\t{t_base / t_vec:.2f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import argparse
+import os
+import sys
+import time
+# run from the repository without installing the package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from kmr_dataset.io import _prepare_rate_loader
+from kmr_dataset.io import load_rates
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--directory', type=str, default=None, help='Data directory')
+    parser.add_argument('--size', type=str, default='5m', help='Dataset size')
+    parser.add_argument('--n_jobs', type=int, nargs='+', default=None, help='List of number of processes')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of repeats. Report the best')
+
+    args = parser.parse_args()
+    n_jobs_list = args.n_jobs
+    if n_jobs_list is None:
+        n_cores = os.cpu_count() or 1
+        n_jobs_list = [1] + [2 ** i for i in range(1, 8) if 2 ** i <= n_cores]
+
+    # parallel parsing requires extracted rates file
+    path, _ = _prepare_rate_loader(args.directory, args.size, extract=True)
+
+    print(f'{args.size}: {path}, {os.path.getsize(path) / (1 << 20):.1f} MB')
+    print('n_jobs\ttime (sec)\tspeedup')
+    baseline = None
+    for n_jobs in n_jobs_list:
+        times = []
+        for _ in range(args.repeat):
+            begin = time.perf_counter()
+            rates, _ = load_rates(args.directory, args.size, cache=False, n_jobs=n_jobs)
+            times.append(time.perf_counter() - begin)
+        t = min(times)
+        if baseline is None:
+            baseline = t
+        print(f'{n_jobs}\t{t:.3f}\t{baseline / t:.2f}x')
+
+if __name__ == '__main__':
+    main()
@@ -53,7 +53,7 @@ def plot_cumulations(cum, line_x_indices, texts, noise_x_indices, titles):
 def plot_cumulation(cum, line_x_indices, texts, title):
     log_max = np.log(cum.shape[0]+1)
     x_samples = np.linspace(0, log_max, int(log_max*20))
-    sample_indices = np.array(np.exp(x_samples) - 1, dtype=np.int)
+    sample_indices = np.array(np.exp(x_samples) - 1, dtype=np.int64)
     sample_indices = sample_indices[np.where(sample_indices < cum.shape[0])[0]]
     x_samples = x_samples[:sample_indices.shape[0]]
     cum_samples = cum[sample_indices]
@@ -111,13 +111,18 @@ def describe_stats(x, row_name='user', col_name='item', data_name=''):
            - num of nonzero : 12167619
            - sparsity : 0.9999773996700032
            - sparsity (compatified) : 0.9997755130273684
+
+    For detailed statistics (degree distributions, rate histogram, time span, Gini),
+    use ``kmr_dataset.stats.describe``
     """
     n_rows, n_cols = x.shape
-    rows, cols = x.nonzero()
-    nnz = rows.shape[0]
-    sparsity = 1 - nnz / ((rows.max() + 1) * (cols.max() + 1))
-    unique_rows = np.unique(rows)
-    unique_cols = np.unique(cols)
+    # O(nnz) counts from the csr structure, without materializing (row, col) pairs
+    row_counts = np.diff(x.indptr)
+    col_counts = np.bincount(x.indices, minlength=n_cols)
+    nnz = int(row_counts.sum())
+    unique_rows = np.flatnonzero(row_counts)
+    unique_cols = np.flatnonzero(col_counts)
+    sparsity = 1 - nnz / ((unique_rows[-1] + 1) * (unique_cols[-1] + 1))
     n_unique_rows = unique_rows.shape[0]
     n_unique_cols = unique_cols.shape[0]
     sparsity_unique = 1 - nnz / (n_unique_rows * n_unique_cols)
@@ -132,6 +137,15 @@ def describe_stats(x, row_name='user', col_name='item', data_name=''):
  - sparsity : {sparsity}
  - sparsity (compatified) : {sparsity_unique}
          """)
+    return {
+        f'n_{row_name}': n_rows,
+        f'n_{col_name}': n_cols,
+        f'n_unique_{row_name}': n_unique_rows,
+        f'n_unique_{col_name}': n_unique_cols,
+        'nnz': nnz,
+        'sparsity': float(sparsity),
+        'sparsity_compacted': float(sparsity_unique)
+    }
 
 def to_gridplot(figures):
     n_rows = math.ceil(len(figures)/2)
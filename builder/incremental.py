@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import pickle
+
+
+def file_hash(path, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def _atomic_write(path, write, mode):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, mode) as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class Manifest:
+    """
+    Size, mtime and sha1 of source files.
+    A file is unchanged if its size and mtime are same, or if its hash is same.
+    The hash is computed only when size or mtime is changed
+
+    Usage
+    -----
+        >>> manifest = Manifest.load('manifest.json')
+        >>> manifest.is_changed(path)
+        >>> manifest.update(path)
+        >>> manifest.save('manifest.json')
+    """
+    def __init__(self, entries=None):
+        # path -> [size, mtime_ns, sha1]
+        self.entries = entries if entries is not None else {}
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        _atomic_write(path, lambda f: json.dump(self.entries, f), 'w')
+
+    def is_changed(self, path):
+        entry = self.entries.get(path)
+        if entry is None:
+            return True
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime_ns) == (entry[0], entry[1]):
+            return False
+        if stat.st_size != entry[0]:
+            return True
+        # touched but maybe not modified
+        if file_hash(path) != entry[2]:
+            return True
+        entry[1] = stat.st_mtime_ns
+        return False
+
+    def update(self, path):
+        stat = os.stat(path)
+        self.entries[path] = [stat.st_size, stat.st_mtime_ns, file_hash(path)]
+
+    def remove(self, path):
+        self.entries.pop(path, None)
+
+
+class SourceState:
+    """
+    Manifest and parsed results of source files of a build step.
+    It is stored as `{state_dir}/{name}-manifest.json` and `{state_dir}/{name}-state.pkl`
+
+    Attributes
+    ----------
+    manifest : Manifest
+    parsed : dict
+        {source path: parsed result}. A build step may store the location of the parsed result
+        instead, for example its checkpoint file
+    extra : dict
+        Additional state of the build step, for example ``IndexTable``
+    """
+    def __init__(self, state_dir, name):
+        self.manifest_path = f'{state_dir}/{name}-manifest.json'
+        self.state_path = f'{state_dir}/{name}-state.pkl'
+        os.makedirs(state_dir, exist_ok=True)
+        self.manifest = Manifest.load(self.manifest_path)
+        self.parsed = {}
+        self.extra = {}
+        if os.path.exists(self.state_path):
+            with open(self.state_path, 'rb') as f:
+                state = pickle.load(f)
+            self.parsed, self.extra = state['parsed'], state['extra']
+
+    def diff(self, paths):
+        """
+        Returns
+        -------
+        new_paths : list of str
+            Paths which are not in the state
+        changed_paths : list of str
+            Paths which are modified after last build
+        removed_paths : list of str
+            Paths which are in the state but not in ``paths``
+        """
+        new_paths, changed_paths = [], []
+        for path in paths:
+            if path not in self.parsed:
+                new_paths.append(path)
+            elif self.manifest.is_changed(path):
+                changed_paths.append(path)
+        path_set = set(paths)
+        removed_paths = [path for path in self.parsed if path not in path_set]
+        return new_paths, changed_paths, removed_paths
+
+    def update(self, parsed, removed_paths=()):
+        for path, value in parsed.items():
+            self.parsed[path] = value
+            self.manifest.update(path)
+        for path in removed_paths:
+            self.parsed.pop(path, None)
+            self.manifest.remove(path)
+
+    def save(self):
+        # state first. A path in manifest but not in state is treated as new
+        state = {'parsed': self.parsed, 'extra': self.extra}
+        _atomic_write(self.state_path, lambda f: pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL), 'wb')
+        self.manifest.save(self.manifest_path)
+
+
+def parse_sources(paths, parse, state_dir=None, name=None):
+    """
+    Arguments
+    ---------
+    paths : list of str
+        Source file paths
+    parse : callable
+        parse(path) returns parsed result of a file
+    state_dir : str or None
+        If not None, only new or changed files are parsed and the others are reused
+    name : str
+        Name of build step. It is used as state file name
+
+    Returns
+    -------
+    parsed : list
+        Parsed results in the order of ``paths``
+    """
+    if state_dir is None:
+        return [parse(path) for path in paths]
+    state = SourceState(state_dir, name)
+    new_paths, changed_paths, removed_paths = state.diff(paths)
+    print(f'{name}: {len(new_paths)} new, {len(changed_paths)} changed, {len(removed_paths)} removed files')
+    state.update({path: parse(path) for path in new_paths + changed_paths}, removed_paths)
+    state.save()
+    return [state.parsed[path] for path in paths]
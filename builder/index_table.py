@@ -0,0 +1,272 @@
+import hashlib
+import numpy as np
+
+
+class GrowableArray:
+    """
+    Array which grows by doubling its capacity. ``values`` is a view of filled part
+    """
+    def __init__(self, dtype, shape=(), fill_value=0, capacity=1024):
+        self.shape = shape
+        self.fill_value = fill_value
+        self.data = np.full((capacity,) + shape, fill_value, dtype=dtype)
+        self.size = 0
+
+    def _reserve(self, size):
+        if size <= self.data.shape[0]:
+            return
+        capacity = max(size, 2 * self.data.shape[0])
+        data = np.full((capacity,) + self.shape, self.fill_value, dtype=self.data.dtype)
+        data[:self.size] = self.data[:self.size]
+        self.data = data
+
+    def extend(self, values):
+        begin = self.size
+        self._reserve(begin + len(values))
+        self.data[begin: begin + len(values)] = values
+        self.size += len(values)
+        return begin, self.size
+
+    def resize(self, size):
+        """
+        Grow to ``size``. New elements are ``fill_value``
+        """
+        self._reserve(size)
+        self.size = max(self.size, size)
+
+    @property
+    def values(self):
+        return self.data[:self.size]
+
+
+class IndexTable:
+    """
+    Duplicated user remover.
+
+    A user is a duplicate of an inserted user if their sets of (comment idx, timestamp) are exactly same.
+    Each set is stored as a sorted key array in one concatenated buffer, and is hashed into
+    a 64 bit fingerprint. A fingerprint match is confirmed by comparing the key arrays,
+    therefore hash collisions do not make false duplicates.
+
+    Comment indices are stored in sorted runs to count similar users, which share
+    at least one comment with an inserted user. New comments are buffered in a set
+    and flushed to a sorted run when it has ``buffer_size`` comments.
+    Runs of similar sizes are merged, so the number of runs is logarithmic.
+
+    Usage
+    -----
+        >>> table = IndexTable()
+        >>> table.insert(0, [1, 2], {(1, 100), (2, 200)})
+        >>> table.check([1, 2], {(1, 100), (2, 200)})
+        $ (True, True)
+        >>> table.check([2, 3], {(2, 200), (3, 300)})
+        $ (True, False)
+        >>> table.stats()
+    """
+    def __init__(self, buffer_size=1 << 18):
+        self.buffer_size = buffer_size
+        # fingerprint -> user idx, or tuple of user idxs if distinct sets collide
+        self.fingerprints = {}
+        # sorted (comment idx, timestamp) of each user, concatenated
+        self.keys = GrowableArray(np.int64, shape=(2,))
+        # key range of each user. begin = -1 means the user is not inserted or removed
+        self.begins = GrowableArray(np.int64, fill_value=-1)
+        self.ends = GrowableArray(np.int64, fill_value=-1)
+        # sorted runs of (comment idx, user idx) and buffered comments which are not in runs.
+        # buffered comments belong to alive users, because ``remove`` flushes the buffer
+        self.runs = []
+        self.buffer = set()
+        self.buffer_comments = []
+        self.buffer_owners = []
+        self.n_buffered = 0
+        self.n_removed = 0
+        # keys and fingerprint of last ``check``, reused in ``insert``
+        self._last = None
+        # duplicate statistics
+        self.n_checked = 0
+        self.n_similars = 0
+        self.n_duplicates = 0
+        self.duplicate_counts = {}
+
+    def __len__(self):
+        return int((self.begins.values >= 0).sum())
+
+    def __repr__(self):
+        return f'IndexTable(#users={len(self)}, #comments={self.keys.size}, #runs={len(self.runs)})'
+
+    @staticmethod
+    def to_keys(primary_key):
+        """
+        Sorted (comment idx, timestamp) array of a set of primary keys
+        """
+        keys = np.array(sorted(primary_key), dtype=np.int64)
+        return keys.reshape(-1, 2)
+
+    @staticmethod
+    def fingerprint(keys):
+        return int.from_bytes(hashlib.blake2b(keys.tobytes(), digest_size=8).digest(), 'little')
+
+    def _alive(self, user_idxs):
+        user_idxs = np.asarray(user_idxs, dtype=np.int64)
+        return self.begins.values[user_idxs] >= 0
+
+    def _find_same(self, keys, fingerprint):
+        candidates = self.fingerprints.get(fingerprint, ())
+        if not isinstance(candidates, tuple):
+            candidates = (candidates,)
+        for u in candidates:
+            begin, end = self.begins.values[u], self.ends.values[u]
+            if end - begin == keys.shape[0] and np.array_equal(self.keys.values[begin:end], keys):
+                return u
+        return None
+
+    def _keys_and_fingerprint(self, primary_key):
+        if self._last is not None and self._last[0] is primary_key:
+            return self._last[1], self._last[2]
+        keys = self.to_keys(primary_key)
+        fingerprint = self.fingerprint(keys)
+        self._last = (primary_key, keys, fingerprint)
+        return keys, fingerprint
+
+    def _is_similar(self, comment_idxs):
+        if not self.buffer.isdisjoint(comment_idxs):
+            return True
+        query = np.asarray(comment_idxs, dtype=np.int64)
+        for comments, owners in self.runs:
+            left = np.searchsorted(comments, query, side='left')
+            right = np.searchsorted(comments, query, side='right')
+            found = right > left
+            if not found.any():
+                continue
+            if self.n_removed == 0:
+                return True
+            # owners of matched comments
+            counts = (right - left)[found]
+            positions = np.repeat(left[found] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            if self._alive(owners[positions]).any():
+                return True
+        return False
+
+    def check(self, comment_idxs, primary_key):
+        """
+        Arguments
+        ---------
+        comment_idxs : list of int
+        primary_key : set of tuple
+            {(comment idx, timestamp), ...}
+
+        Returns
+        -------
+        similar : Boolean
+            True if some users share a comment with the user
+        duplicated : Boolean
+            True if a user has exactly same primary key
+        """
+        keys, fingerprint = self._keys_and_fingerprint(primary_key)
+        same = self._find_same(keys, fingerprint)
+        self.n_checked += 1
+        if same is not None:
+            self.n_similars += 1
+            self.n_duplicates += 1
+            self.duplicate_counts[same] = self.duplicate_counts.get(same, 0) + 1
+            return True, True
+        similar = self._is_similar(comment_idxs)
+        self.n_similars += similar
+        return similar, False
+
+    def duplicate_of(self, primary_key):
+        """
+        Returns the inserted user who has exactly same primary key, or None.
+        It does not change the statistics of ``check``
+        """
+        return self._find_same(*self._keys_and_fingerprint(primary_key))
+
+    def insert(self, user_idx, comment_idxs, primary_key):
+        """
+        user_idx : int
+        comment_idxs : tuple of int
+        primary_key : set of tuple (comment idx, timestamp)
+        """
+        if user_idx < self.begins.size and self.begins.values[user_idx] >= 0:
+            self.remove(user_idx)
+        keys, fingerprint = self._keys_and_fingerprint(primary_key)
+        self._last = None
+        begin, end = self.keys.extend(keys)
+        self.begins.resize(user_idx + 1)
+        self.ends.resize(user_idx + 1)
+        self.begins.values[user_idx] = begin
+        self.ends.values[user_idx] = end
+
+        value = self.fingerprints.get(fingerprint)
+        if value is None:
+            self.fingerprints[fingerprint] = user_idx
+        else:
+            value = value if isinstance(value, tuple) else (value,)
+            self.fingerprints[fingerprint] = value + (user_idx,)
+
+        self.buffer.update(comment_idxs)
+        self.buffer_comments.append(np.asarray(comment_idxs, dtype=np.int64))
+        self.buffer_owners.append(np.full(len(comment_idxs), user_idx, dtype=np.int32))
+        self.n_buffered += len(comment_idxs)
+        if self.n_buffered >= self.buffer_size:
+            self.flush()
+
+    def remove(self, user_idx):
+        """
+        Remove the user. It is used when the comment file of the user is changed.
+        The key and comment arrays are not compacted, but the user is ignored in check
+        """
+        if user_idx >= self.begins.size or self.begins.values[user_idx] < 0:
+            return
+        self.flush()
+        self._last = None
+        begin, end = self.begins.values[user_idx], self.ends.values[user_idx]
+        fingerprint = self.fingerprint(self.keys.values[begin:end])
+        value = self.fingerprints.get(fingerprint)
+        value = tuple(u for u in (value if isinstance(value, tuple) else (value,)) if u != user_idx)
+        if not value:
+            del self.fingerprints[fingerprint]
+        else:
+            self.fingerprints[fingerprint] = value if len(value) > 1 else value[0]
+        self.begins.values[user_idx] = -1
+        self.ends.values[user_idx] = -1
+        self.n_removed += 1
+
+    def flush(self):
+        """
+        Move buffered comments to a sorted run, and merge the runs of similar sizes
+        """
+        if not self.buffer_comments:
+            return
+        comments = np.concatenate(self.buffer_comments)
+        owners = np.concatenate(self.buffer_owners)
+        self.buffer = set()
+        self.buffer_comments = []
+        self.buffer_owners = []
+        self.n_buffered = 0
+        while self.runs and self.runs[-1][0].shape[0] <= 2 * comments.shape[0]:
+            last_comments, last_owners = self.runs.pop()
+            comments = np.concatenate([last_comments, comments])
+            owners = np.concatenate([last_owners, owners])
+        order = np.argsort(comments, kind='stable')
+        self.runs.append((comments[order], owners[order]))
+
+    def stats(self):
+        """
+        Returns
+        -------
+        stats : dict
+            Number of checked, similar and duplicated users,
+            the number of inserted users and comments, and the users who have the most duplicates
+        """
+        top = sorted(self.duplicate_counts.items(), key=lambda x: -x[1])[:10]
+        return {
+            'n_checked': self.n_checked,
+            'n_similars': self.n_similars,
+            'n_duplicates': self.n_duplicates,
+            'n_users': len(self),
+            'n_comments': self.keys.size,
+            'most_duplicated_users': top,
+            'nbytes': int(self.keys.data.nbytes + self.begins.data.nbytes + self.ends.data.nbytes
+                          + sum(c.nbytes + o.nbytes for c, o in self.runs))
+        }
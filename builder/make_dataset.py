@@ -13,6 +13,17 @@ def main():
     parser.add_argument('--volume_unit', type=int, default=1000000, help='Volume unit')
     parser.add_argument('--debug', dest='debug', action='store_true')
     parser.add_argument('--only_rate', dest='only_rate', action='store_true', help='Make only rates.csv')
+    parser.add_argument('--n_jobs', type=int, default=1, help='Number of processes to parse user comments. -1 means all cores')
+    parser.add_argument('--incremental', dest='incremental', action='store_true',
+        help='Parse only new or changed files. Build state is stored in {dataset_dir}/build_state. '
+             'Published users keep their indices, and new users are appended')
+    parser.add_argument('--memory_budget', type=int, default=None,
+        help='Memory budget of rows in MB. If given, rates are built with external memory sort')
+    parser.add_argument('--spill_dir', type=str, default=None, help='Directory of temporal spill files')
+    parser.add_argument('--columnar', dest='columnar', action='store_true', help='Write binary columnar rates.npz')
+    parser.add_argument('--release', dest='release', action='store_true',
+        help='Write zip archives (meta.zip, rates-{size}.zip) in same pass')
+    parser.add_argument('--checkpoint_dir', type=str, default=None, help='Directory of parsed shard checkpoints to resume')
 
     args = parser.parse_args()
     data_dir = args.data_dir
@@ -21,6 +32,13 @@ def main():
     volume = args.volume_unit
     debug = args.debug
     only_rate = args.only_rate
+    n_jobs = args.n_jobs
+    checkpoint_dir = args.checkpoint_dir
+    state_dir = f'{dataset_dir}/build_state' if args.incremental else None
+    memory_budget = args.memory_budget * (1 << 20) if args.memory_budget is not None else None
+    spill_dir = args.spill_dir
+    columnar = args.columnar
+    release = args.release
 
     if not os.path.exists(dataset_dir):
         os.makedirs(dataset_dir)
@@ -37,10 +55,16 @@ def main():
         )
 
     if not only_rate:
-        make_meta(data_dir, movie_indices, dataset_dir)
-        make_directing(data_dir, movie_indices, dataset_dir)
-        make_casting(data_dir, movie_indices, dataset_dir)
-    make_rates(data_dir, debug, min_count, dataset_dir, volume)
+        meta_zip_path = None
+        if release:
+            meta_zip_path = f'{dataset_dir}/meta.zip'
+            if os.path.exists(meta_zip_path):
+                os.remove(meta_zip_path)
+        make_meta(data_dir, movie_indices, dataset_dir, state_dir, meta_zip_path)
+        make_directing(data_dir, movie_indices, dataset_dir, state_dir, meta_zip_path)
+        make_casting(data_dir, movie_indices, dataset_dir, state_dir, meta_zip_path)
+    make_rates(data_dir, debug, min_count, dataset_dir, volume, n_jobs, checkpoint_dir, state_dir,
+        memory_budget, spill_dir, columnar, release)
 
 if __name__ == '__main__':
     main()
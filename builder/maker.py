@@ -1,16 +1,30 @@
 import os
 import json
+import pickle
+import shutil
 import numpy as np
 from collections import Counter
+from collections import defaultdict
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from glob import glob
+from itertools import islice
+from incremental import SourceState
+from index_table import IndexTable
+from incremental import parse_sources
 from utils import initialize_usermapper
 from utils import save_usermapper
 from utils import save_rows
+from utils import BulkWriter
 from utils import load_usermapper
 from utils import load_list_of_dict
 from utils import mask_user
 from utils import to_unix_time
+from spill import RowSpiller
+from spill import merge_runs
+from spill import sort_runs
 
 
 def normalize_text(text):
@@ -19,33 +33,85 @@ def normalize_text(text):
     text = text.replace('\n', ' ')
     return text.strip()
 
-def make_rates(data_dir, debug, min_count, dataset_dir, volume=1000000):
-    data, users, _ = load_comments(data_dir, debug)
-
-    def save(user_idxs, movie_idxs, idxs, rates, timestamps, texts, users, dataname):
-        if not os.path.exists(f'{dataset_dir}/{dataname}'):
-            os.makedirs(f'{dataset_dir}/{dataname}')
-
-        rates_dump = tuple(zip(user_idxs, movie_idxs, rates, timestamps))
-        rates_path = f'{dataset_dir}/{dataname}/rates.csv'
-        save_rows(rates_dump, rates_path, 'user,movie,rate,time', ',')
-
-        texts_dump = tuple(zip(user_idxs, movie_idxs, rates, texts))
-        texts_path = f'{dataset_dir}/{dataname}/texts.txt'
-        save_rows(texts_dump, texts_path, 'user\tmovie\trate\ttext', '\t')
-
-        userlist_path = f'{dataset_dir}/{dataname}/userlist'
-        with open(userlist_path, 'w', encoding='utf-8') as f:
-            for user in users:
+class DatasetWriter:
+    """
+    Writer of `rates.csv`, `texts.txt`, `idxs` and `userlist` of a dataset.
+
+    Arguments
+    ---------
+    dataset_dir : str
+        Dataset directory
+    dataname : str
+        Dataset name, for example `kmrd-2m`
+    userlist : list
+        Users in the order of user index
+    columnar : Boolean
+        If True, write binary columnar `rates.npz` which `kmr_dataset` loaders read directly
+    release : Boolean
+        If True, write `rates-{size}.zip` of which member is `rates-{size}.csv` in same pass
+    """
+    def __init__(self, dataset_dir, dataname, userlist, columnar=False, release=False):
+        directory = f'{dataset_dir}/{dataname}'
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(f'{directory}/userlist', 'w', encoding='utf-8') as f:
+            for user in userlist:
                 f.write(f'{user}\n')
 
-        idxs_path = f'{dataset_dir}/{dataname}/idxs'
-        with open(idxs_path, 'w', encoding='utf-8') as f:
-            f.write('comment_idx\n')
-            for idx in idxs:
-                f.write(f'{idx}\n')
+        zip_path, arcname = None, None
+        if release:
+            size = dataname[len('kmrd-'):]
+            zip_path, arcname = f'{directory}/rates-{size}.zip', f'rates-{size}.csv'
+            if os.path.exists(zip_path):
+                os.remove(zip_path)
+        npz_path = f'{directory}/rates.npz'
+        if not columnar:
+            # loaders prefer npz file, so the npz of previous build must not be kept
+            if os.path.exists(npz_path):
+                os.remove(npz_path)
+            npz_path = None
+        self.rates = BulkWriter(f'{directory}/rates.csv', 'user,movie,rate,time', ',',
+            zip_path=zip_path, arcname=arcname, npz_path=npz_path)
+        self.texts = BulkWriter(f'{directory}/texts.txt', 'user\tmovie\trate\ttext', '\t')
+        self.idxs = BulkWriter(f'{directory}/idxs', 'comment_idx', ',')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, user_idxs, movie_idxs, idxs, rates, timestamps, texts):
+        user_idxs = np.asarray(user_idxs, dtype=np.int64)
+        movie_idxs = np.asarray(movie_idxs, dtype=np.int64)
+        rates = np.asarray(rates, dtype=np.int64)
+        self.rates.write_columns([user_idxs, movie_idxs, rates, np.asarray(timestamps, dtype=np.int64)])
+        self.texts.write_columns([user_idxs, movie_idxs, rates, texts])
+        self.idxs.write_columns([np.asarray(idxs, dtype=np.int64)])
+
+    def close(self):
+        for writer in (self.rates, self.texts, self.idxs):
+            writer.close()
+
+def make_rates(data_dir, debug, min_count, dataset_dir, volume=1000000,
+    n_jobs=1, checkpoint_dir=None, state_dir=None, memory_budget=None, spill_dir=None,
+    columnar=False, release=False):
+    if memory_budget is not None:
+        return make_rates_external(data_dir, debug, min_count, dataset_dir, volume,
+            n_jobs, checkpoint_dir, state_dir, memory_budget, spill_dir, columnar, release)
+
+    previous = None
+    if state_dir is not None:
+        data, users, _ = load_comments_incremental(data_dir, debug, state_dir, n_jobs)
+        previous = load_published_userlist(state_dir)
+    else:
+        data, users, _ = load_comments(data_dir, debug, n_jobs, checkpoint_dir)
 
-    data_filtered, userlist_filtered, data_full, userlist_full = split_by_min_count(data, min_count)
+    def save(user_idxs, movie_idxs, idxs, rates, timestamps, texts, users, dataname):
+        with DatasetWriter(dataset_dir, dataname, users, columnar, release) as writer:
+            writer.write(user_idxs, movie_idxs, idxs, rates, timestamps, texts)
+
+    data_filtered, userlist_filtered, data_full, userlist_full = split_by_min_count(data, min_count, previous)
 
     dataname = f'kmrd-{int(len(data_filtered) / volume)}m'
     user_idxs, movie_idxs, idxs, rates, timestamps, texts = zip(*data_filtered)
@@ -56,18 +122,329 @@ def make_rates(data_dir, debug, min_count, dataset_dir, volume=1000000):
     user_idxs, movie_idxs, idxs, rates, timestamps, texts = zip(*data_full)
     save(user_idxs, movie_idxs, idxs, rates, timestamps, texts, userlist_full, dataname)
     print(f'saved full dataset, {dataname} to {dataset_dir}')
+    if state_dir is not None:
+        save_published_userlist(state_dir, userlist_full)
+
+def make_rates_external(data_dir, debug, min_count, dataset_dir, volume=1000000,
+    n_jobs=1, checkpoint_dir=None, state_dir=None, memory_budget=1 << 30, spill_dir=None,
+    columnar=False, release=False):
+    """
+    External memory version of ``make_rates``. It makes same files.
+
+    1. Parsed rows are spilled to disk while the rates of each user are counted
+    2. Users are re-indexed, and rows are sorted in runs of which size is at most ``memory_budget``
+    3. Sorted runs are merged, and the filtered and full datasets are written in one pass
+
+    Arguments
+    ---------
+    memory_budget : int
+        Bytes of rows which are kept in memory at once
+    spill_dir : str or None
+        Directory of temporal spill files. Default is `{dataset_dir}/spill`
+    """
+    if spill_dir is None:
+        spill_dir = f'{dataset_dir}/spill'
+    spiller = RowSpiller(spill_dir)
+    previous = None
+    if state_dir is not None:
+        load_comments_incremental(data_dir, debug, state_dir, n_jobs, data=spiller)
+        previous = load_published_userlist(state_dir)
+    else:
+        load_comments(data_dir, debug, n_jobs, checkpoint_dir, data=spiller)
+    spiller.close()
+
+    user_size = spiller.user_size
+    user_mapper, user_large = make_user_mapper(user_size, min_count, previous)
+    userlist_full = [u for u, _ in sorted(user_mapper.items(), key=lambda x:x[1])]
+    userlist_filtered = [u for u in userlist_full if u in user_large]
+    # new user idx -> user idx of filtered dataset, or -1
+    filtered_index = np.full(len(userlist_full), -1, dtype=np.int64)
+    filtered_index[[user_mapper[u] for u in userlist_filtered]] = np.arange(len(userlist_filtered))
+    n_full = spiller.n_rows
+    n_filtered = sum(user_size[u] for u in user_large)
 
-def load_comments(data_dir, debug):
+    def transform_idx(row):
+        return (user_mapper[row[0]], row[1], row[2], row[3], row[4], row[5])
 
-    def parse_time(yymmdd):
-        return int(datetime.strptime(yymmdd, '%y.%m.%d').timestamp())
+    run_paths = sort_runs(spiller.path, transform_idx, spill_dir, memory_budget)
+    os.remove(spiller.path)
+    print(f'sorted rows in {len(run_paths)} runs')
+
+    filtered_name = f'kmrd-{int(n_filtered / volume)}m'
+    full_name = f'kmrd-{int(n_full / volume)}m'
+    full_writer = DatasetWriter(dataset_dir, full_name, userlist_full, columnar, release)
+    # if the names are same, full dataset overwrites filtered one as in ``make_rates``
+    filtered_writer = None
+    if filtered_name != full_name:
+        filtered_writer = DatasetWriter(dataset_dir, filtered_name, userlist_filtered, columnar, release)
+
+    # rows are sorted by new user index, and filtered user indices are in same order
+    rows = merge_runs(run_paths)
+    while True:
+        block = list(islice(rows, 100000))
+        if not block:
+            break
+        columns = list(zip(*block))
+        full_writer.write(*columns)
+        users = filtered_index[np.asarray(columns[0], dtype=np.int64)]
+        selected = np.flatnonzero(users >= 0)
+        if filtered_writer is not None and selected.shape[0] > 0:
+            filtered_writer.write(users[selected], *[[column[i] for i in selected.tolist()] for column in columns[1:]])
+
+    full_writer.close()
+    if filtered_writer is not None:
+        filtered_writer.close()
+    for path in run_paths:
+        os.remove(path)
+    if not os.listdir(spill_dir):
+        os.rmdir(spill_dir)
 
+    percent = 100 * n_filtered / n_full
+    print(f'\nfiltered data size is {percent:.4}% of full data size')
+    print(f'#rows of filtered = {n_filtered}, #users = {len(userlist_filtered)}')
+    print(f'#rows of full = {n_full}, #users = {len(userlist_full)}')
+    print(f'saved filtered dataset, {filtered_name} to {dataset_dir}')
+    print(f'saved full dataset, {full_name} to {dataset_dir}')
+    if state_dir is not None:
+        save_published_userlist(state_dir, userlist_full)
+
+def load_published_userlist(state_dir):
+    """
+    Returns the user idxs of the full dataset of previous incremental build, in published order.
+    None if it is the first build
+    """
+    path = f'{state_dir}/userlist'
+    if not os.path.exists(path):
+        return None
+    return [int(user) for user in load_usermapper(path)]
+
+def save_published_userlist(state_dir, userlist):
+    save_usermapper({user: idx for idx, user in enumerate(userlist)}, f'{state_dir}/userlist')
+
+@lru_cache(maxsize=None)
+def parse_time(yymmdd):
+    # the number of distinct dates is small, so cache strptime results
+    return int(datetime.strptime(yymmdd, '%y.%m.%d').timestamp())
+
+def parse_user_file(path):
+    """
+    Arguments
+    ---------
+    path : str
+        JSON-lines comment file of a user. File name is the user name
+
+    Returns
+    -------
+    name : int
+        User name
+    comments : list of tuple
+        (comment idx, movie idx, rate, timestamp, text)
+    n_exceptions : int
+        Number of comments which are failed to parse
+
+    If the file cannot be read, it returns None
+    """
+    try:
+        name = int(path.split('/')[-1])
+        comments = load_list_of_dict(path)
+    except Exception as e:
+        return None
+
+    comments_ = []
+    n_exceptions = 0
+    for comment in comments:
+        try:
+            idx = int(comment['idx'])
+            movie_idx = int(comment['movie_idx'])
+            rate = int(comment['score'])
+            timestamp = parse_time(comment['written_at'])
+            text = comment['text']
+            comments_.append((idx, movie_idx, rate, timestamp, text))
+        except Exception as e:
+            n_exceptions += 1
+    return name, comments_, n_exceptions
+
+def file_stats(paths):
+    """
+    (path, size, mtime_ns) of each file. Size and mtime are None if the file does not exist
+    """
+    stats = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stats.append((path, stat.st_size, stat.st_mtime_ns))
+        except OSError:
+            stats.append((path, None, None))
+    return stats
+
+def parse_shard(paths, checkpoint_path=None):
+    """
+    Parse user files and save the result to ``checkpoint_path`` if it is given.
+    The checkpoint consists of two pickles, ``file_stats(paths)`` and the parsed shard,
+    so its validity is checked without loading the parsed comments
+    """
+    # stat before parsing, so a file modified while parsing makes the checkpoint stale
+    stats = file_stats(paths) if checkpoint_path is not None else None
+    parsed = [parse_user_file(path) for path in paths]
+    if checkpoint_path is not None:
+        tmp_path = f'{checkpoint_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(stats, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(parsed, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, checkpoint_path)
+    return parsed
+
+def shard_checkpoint_path(checkpoint_dir, i):
+    return f'{checkpoint_dir}/shard-{i:06}.pkl'
+
+def read_shard_checkpoint(checkpoint_path):
+    """
+    Returns (paths, parsed shard) of the checkpoint
+    """
+    with open(checkpoint_path, 'rb') as f:
+        stats, parsed = pickle.load(f), pickle.load(f)
+    return [path for path, _, _ in stats], parsed
+
+def is_shard_checkpoint(checkpoint_path, paths):
+    """
+    Returns True if the checkpoint exists and was made from same ``paths``
+    of which sizes and mtimes are not changed. It reads only the header of the checkpoint
+    """
+    if checkpoint_path is None or not os.path.exists(checkpoint_path):
+        return False
+    try:
+        with open(checkpoint_path, 'rb') as f:
+            return pickle.load(f) == file_stats(paths)
+    except Exception as e:
+        return False
+
+def load_shard_checkpoint(checkpoint_path, paths):
+    """
+    Returns parsed shard if the checkpoint exists and was made from same ``paths``
+    of which sizes and mtimes are not changed, else None
+    """
+    if checkpoint_path is None or not os.path.exists(checkpoint_path):
+        return None
+    try:
+        with open(checkpoint_path, 'rb') as f:
+            if pickle.load(f) != file_stats(paths):
+                return None
+            return pickle.load(f)
+    except Exception as e:
+        return None
+
+def iter_parsed_shards(paths, n_jobs=1, checkpoint_dir=None, shard_size=5000):
+    """
+    Parse user files in shards and yield the parsed shards in the order of ``paths``.
+    Finished shards are stored in ``checkpoint_dir`` and reused when it is re-run,
+    therefore a crashed build resumes from the finished shards.
+
+    At most ``n_jobs`` shards are parsed ahead of the consumer, and a checkpoint is loaded
+    only when its shard is yielded, so memory is bounded by about ``n_jobs + 1`` shards
+
+    Arguments
+    ---------
+    paths : list of str
+        User comment file paths
+    n_jobs : int
+        Number of processes. If it is None, 0 or negative, use all cores
+    checkpoint_dir : str or None
+        Directory of shard checkpoints. If None, it does not checkpoint.
+        A checkpoint is reused only if its files have same sizes and mtimes
+    shard_size : int
+        Number of files in a shard
+
+    Yields
+    ------
+    parsed : list
+        List of ``parse_user_file`` results of a shard
+    """
+    shards = [paths[b: b + shard_size] for b in range(0, len(paths), shard_size)]
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        checkpoint_paths = [shard_checkpoint_path(checkpoint_dir, i) for i in range(len(shards))]
+    else:
+        checkpoint_paths = [None] * len(shards)
+
+    if n_jobs is None or n_jobs <= 0:
+        n_jobs = os.cpu_count() or 1
+
+    restored = [is_shard_checkpoint(cp, shard) for cp, shard in zip(checkpoint_paths, shards)]
+    n_restored = sum(restored)
+    if n_restored > 0:
+        print(f'Resume from {n_restored} / {len(shards)} finished shards')
+    n_stales = sum(1 for cp, valid in zip(checkpoint_paths, restored) if not valid and cp and os.path.exists(cp))
+    if n_stales > 0:
+        print(f'{n_stales} checkpoints are stale, because their files are changed. The shards are parsed again')
+
+    def restore(i):
+        parsed = load_shard_checkpoint(checkpoint_paths[i], shards[i])
+        # the checkpoint may be removed or broken after checking its header
+        return parsed if parsed is not None else parse_shard(shards[i], checkpoint_paths[i])
+
+    if n_jobs == 1:
+        for i, shard in enumerate(shards):
+            yield restore(i) if restored[i] else parse_shard(shard, checkpoint_paths[i])
+        return
+
+    pending = iter([i for i in range(len(shards)) if not restored[i]])
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        running = deque()
+
+        def submit():
+            while len(running) < n_jobs:
+                i = next(pending, None)
+                if i is None:
+                    return
+                running.append((i, executor.submit(parse_shard, shards[i], checkpoint_paths[i])))
+
+        # merge in the order of shards, not in the order of completion
+        for i in range(len(shards)):
+            submit()
+            if restored[i]:
+                yield restore(i)
+            else:
+                # the future is dropped when it is popped, so it does not hold the yielded shard
+                yield running.popleft()[1].result()
+
+def user_comment_paths(data_dir, debug):
     paths = glob(f'{data_dir}/user_comments/*/*') + glob(f'{data_dir}/user_comments/*')
-    paths = [path for path in paths if os.path.isfile(path)]
+    # sort paths, because user index depends on the order and glob order differs by file system
+    paths = sorted(path for path in paths if os.path.isfile(path))
     if debug:
         paths = paths[:30]
-
-    data, users = [], []
+    return paths
+
+def load_comments(data_dir, debug, n_jobs=1, checkpoint_dir=None, shard_size=5000, data=None):
+    """
+    Arguments
+    ---------
+    data_dir : str
+        Raw data directory which has `user_comments`
+    debug : Boolean
+        If True, it loads only 30 users
+    n_jobs : int
+        Number of processes to parse user files.
+        User indices are same regardless of ``n_jobs`` because shards are merged in path order
+    checkpoint_dir : str or None
+        Directory to store parsed shards. Re-run with same directory resumes from finished shards
+    shard_size : int
+        Number of user files in a shard
+    data : list-like or None
+        Sink of rows which has `append`, for example ``RowSpiller``. If None, rows are stored in list
+
+    Returns
+    -------
+    data : list of tuple
+        (user idx, movie idx, comment idx, rate, timestamp, text)
+    users : list of int
+        User names. ``users[user idx]`` is the name
+    duplicated_checker : IndexTable
+    """
+    paths = user_comment_paths(data_dir, debug)
+
+    data = [] if data is None else data
+    users = []
     duplicated_checker = IndexTable()
 
     n_exceptions = 0
@@ -76,74 +453,235 @@ def load_comments(data_dir, debug):
     user_idx = 0
     n_paths = len(paths)
 
-    for i, path in enumerate(paths):
-        if (i > 0) and (i % 1000 == 0):
-            percent = 100 * (i+1) / n_paths
-            n_data = len(data)
-            message = '\rScanning {:.4}%, rates={}, users={}, simialrs={}, duplicated={}, exception={}    '
-            message = message.format(percent, n_data, user_idx, n_similars, n_duplicateds, n_exceptions)
-            print(message, end='')
-
-        try:
-            name = int(path.split('/')[-1])
-            comments = load_list_of_dict(path)
-        except Exception as e:
-            continue
+    i = 0
+    for parsed_shard in iter_parsed_shards(paths, n_jobs, checkpoint_dir, shard_size):
+        for parsed in parsed_shard:
+            i += 1
+            if i % 1000 == 0:
+                percent = 100 * i / n_paths
+                n_data = len(data)
+                message = '\rScanning {:.4}%, rates={}, users={}, simialrs={}, duplicated={}, exception={}    '
+                message = message.format(percent, n_data, user_idx, n_similars, n_duplicateds, n_exceptions)
+                print(message, end='')
+
+            if parsed is None:
+                continue
+            name, comments_, n_exceptions_ = parsed
+            n_exceptions += n_exceptions_
 
-        comments_ = []
-        for comment in comments:
-            try:
-                idx = int(comment['idx'])
-                movie_idx = int(comment['movie_idx'])
-                rate = int(comment['score'])
-                timestamp = parse_time(comment['written_at'])
-                text = comment['text']
-                comments_.append((idx, movie_idx, rate, timestamp, text))
-            except Exception as e:
-                n_exceptions += 1
-
-        if len(comments_) == 0:
-            continue
+            if len(comments_) == 0:
+                continue
 
-        # check duplicated user
-        comment_idxs = [idx for idx, _, _, _, _ in comments_]
-        primary_key = {(idx, timestamp) for idx, _, _, timestamp, _ in comments_}
-#         primary_key = {idx for idx, _, _, timestamp, _ in comments_}
-        similar_users = {u for idx in comment_idxs for u in duplicated_checker.comment_to_user.get(idx, [])}
-
-        if similar_users:
-            n_similars += 1
-            exist = False
-            for u in similar_users:
-                if primary_key == duplicated_checker.user_to_comments[u]:
-                    exist = True
-                    break
-            if exist:
+            # check duplicated user
+            comment_idxs = [idx for idx, _, _, _, _ in comments_]
+            primary_key = {(idx, timestamp) for idx, _, _, timestamp, _ in comments_}
+            similar, duplicated = duplicated_checker.check(comment_idxs, primary_key)
+            n_similars += similar
+            if duplicated:
                 n_duplicateds += 1
                 continue
 
-        user_idx = len(users)
-        users.append(name)
-        for idx, movie_idx, rate, timestamp, text in comments_:
-            data.append((user_idx, movie_idx, idx, rate, timestamp, text))
+            user_idx = len(users)
+            users.append(name)
+            for idx, movie_idx, rate, timestamp, text in comments_:
+                data.append((user_idx, movie_idx, idx, rate, timestamp, text))
 
-        duplicated_checker.insert(user_idx, comment_idxs, primary_key)
+            duplicated_checker.insert(user_idx, comment_idxs, primary_key)
 
-        if user_idx < 3:
-            print('In duplicated user check')
-            print(f'primary key = {primary_key}')
-            print(f'comment to user = {duplicated_checker.comment_to_user}\n')
+            if user_idx < 3:
+                print('In duplicated user check')
+                print(f'primary key = {primary_key}')
+                print(f'duplicated user checker = {duplicated_checker}\n')
 
     n_data = len(data)
     suffix = ' ' * 40
     print(f'\rScanning has been finished. Found {n_data} rates{suffix}')
     print(f'Number of exceptions = {n_exceptions}')
     print(f'Number of similar users = {n_similars}, duplicated users = {n_duplicateds}')
+    print(f'Duplicated user checker: {duplicated_checker.stats()}')
 
     return data, users, duplicated_checker
 
-def split_by_min_count(data, min_count):
-    user_size = Counter(row[0] for row in data)
+def load_comments_incremental(data_dir, debug, state_dir, n_jobs=1, data=None, shard_size=5000):
+    """
+    Incremental version of ``load_comments``. It parses only new or changed user files,
+    and reuses the user list and ``IndexTable`` stored in ``state_dir``.
+    Existing users keep their user indices, and new users are appended.
+    The first run with empty ``state_dir`` returns same result with ``load_comments``
+
+    The state keeps only the fingerprints of user files and the location of their parsed comments.
+    Parsed files of each run are stored as shard checkpoints in `{state_dir}/comments/run-{k}/`,
+    and the comments of unchanged files are read from there. Shards which are not referenced
+    by any file are removed.
+
+    The user indices returned here are stable over runs. ``make_rates`` keeps the order of
+    published users of previous incremental build, and appends new users (``make_user_mapper``).
+    The published `userlist` holds these user indices, not the user names
+
+    Arguments
+    ---------
+    data_dir : str
+        Raw data directory which has `user_comments`
+    debug : Boolean
+        If True, it loads only 30 users
+    state_dir : str
+        Directory of manifest and state files
+    n_jobs : int
+        Number of processes to parse user files
+    data : list-like or None
+        Sink of rows. See ``load_comments``
+    shard_size : int
+        Number of user files in a shard
+
+    Returns
+    -------
+    data, users, duplicated_checker
+        See ``load_comments``
+    """
+    paths = user_comment_paths(data_dir, debug)
+    # state.parsed is {path: (shard checkpoint path, position in the shard)}
+    state = SourceState(state_dir, 'comments')
+    users = state.extra.get('users', [])
+    # path -> user idx. The files of duplicated users are not included
+    path_to_user = state.extra.get('path_to_user', {})
+    duplicated_checker = state.extra.get('index_table', IndexTable())
+    # path -> user idx of which the file was rejected as a duplicate
+    duplicates = state.extra.get('duplicates', {})
+    n_runs = state.extra.get('n_runs', 0)
+    shard_dir = f'{state_dir}/comments'
+
+    new_paths, changed_paths, removed_paths = state.diff(paths)
+    print(f'Found {len(new_paths)} new, {len(changed_paths)} changed, {len(removed_paths)} removed user files')
+
+    # remove stale comments from duplicated user checker. Their user indices are kept
+    stale_users = set()
+    for path in changed_paths + removed_paths:
+        duplicates.pop(path, None)
+        user_idx = path_to_user.get(path)
+        if user_idx is not None:
+            duplicated_checker.remove(user_idx)
+            stale_users.add(user_idx)
+
+    # the duplicates of stale users are checked again as if they were new files
+    recheck_paths = [path for path, user_idx in duplicates.items() if user_idx in stale_users]
+    for path in recheck_paths:
+        del duplicates[path]
+    if recheck_paths:
+        print(f'Check {len(recheck_paths)} duplicated user files again')
+
+    target_paths = sorted(new_paths + changed_paths + recheck_paths)
+    locations = {}
+    run_dir = None
+    if target_paths:
+        # checkpoints of a crashed run may be made from older files of same paths
+        run_dir = f'{shard_dir}/run-{n_runs:06}'
+        shutil.rmtree(run_dir, ignore_errors=True)
+        n_runs += 1
+
+    n_exceptions = 0
+    n_duplicateds = 0
+    n_similars = 0
+    i = 0
+    for shard_idx, parsed_shard in enumerate(iter_parsed_shards(target_paths, n_jobs, run_dir, shard_size)):
+        for position, parsed in enumerate(parsed_shard):
+            path = target_paths[i]
+            i += 1
+            locations[path] = (shard_checkpoint_path(run_dir, shard_idx), position)
+            # an existing user keeps the user index only if the file is still a valid user
+            user_idx = path_to_user.pop(path, None)
+            if parsed is None:
+                continue
+            name, comments_, n_exceptions_ = parsed
+            n_exceptions += n_exceptions_
+            if len(comments_) == 0:
+                continue
+
+            comment_idxs = [idx for idx, _, _, _, _ in comments_]
+            primary_key = {(idx, timestamp) for idx, _, _, timestamp, _ in comments_}
+            similar, duplicated = duplicated_checker.check(comment_idxs, primary_key)
+            n_similars += similar
+            if duplicated:
+                # unlike ``load_comments``, an existing user is kept even if the duplicate has smaller path
+                duplicates[path] = duplicated_checker.duplicate_of(primary_key)
+                n_duplicateds += 1
+                continue
+            if user_idx is None:
+                user_idx = len(users)
+                users.append(name)
+            path_to_user[path] = user_idx
+            duplicated_checker.insert(user_idx, comment_idxs, primary_key)
+
+    state.update(locations, removed_paths)
+    for path in removed_paths:
+        path_to_user.pop(path, None)
+    state.extra = {'users': users, 'path_to_user': path_to_user, 'duplicates': duplicates,
+                   'index_table': duplicated_checker, 'n_runs': n_runs}
+    state.save()
+    remove_unreferenced_shards(shard_dir, {checkpoint_path for checkpoint_path, _ in state.parsed.values()})
+
+    # read each shard once. In the first run, rows are in the order of ``load_comments``
+    positions = defaultdict(list)
+    for path, user_idx in path_to_user.items():
+        checkpoint_path, position = state.parsed[path]
+        positions[checkpoint_path].append((position, path, user_idx))
+
+    data = [] if data is None else data
+    for checkpoint_path in sorted(positions):
+        shard_paths, parsed_shard = read_shard_checkpoint(checkpoint_path)
+        for position, path, user_idx in sorted(positions[checkpoint_path]):
+            if shard_paths[position] != path:
+                raise ValueError(f'{checkpoint_path} does not have parsed comments of {path}. Remove {state_dir} and rebuild')
+            if parsed_shard[position] is None:
+                continue
+            for idx, movie_idx, rate, timestamp, text in parsed_shard[position][1]:
+                data.append((user_idx, movie_idx, idx, rate, timestamp, text))
+        del parsed_shard
+
+    print(f'Found {len(data)} rates of {len(users)} users')
+    print(f'Number of exceptions = {n_exceptions} (new or changed files)')
+    print(f'Number of similar users = {n_similars}, duplicated users = {n_duplicateds} (new or changed files)')
+    print(f'Duplicated user checker: {duplicated_checker.stats()}')
+
+    return data, users, duplicated_checker
+
+def remove_unreferenced_shards(shard_dir, referenced):
+    """
+    Remove files in `{shard_dir}/run-*/` which are not in ``referenced``,
+    and the empty run directories
+    """
+    for run_dir in glob(f'{shard_dir}/run-*'):
+        # including temporal files of a crashed run
+        for checkpoint_path in glob(f'{run_dir}/*'):
+            if checkpoint_path not in referenced:
+                os.remove(checkpoint_path)
+        if not os.listdir(run_dir):
+            os.rmdir(run_dir)
+
+def make_user_mapper(user_size, min_count, previous=None):
+    """
+    Re-index users. The users who have ``min_count`` or more rates come first, in descending order of size.
+
+    If ``previous`` is given, the users keep the order of previous build and new users are appended
+    in above order, so published user indices are stable over incremental builds.
+    The users of previous build who have no rate any more are removed, and the users after them
+    are shifted. In this case, the users who have ``min_count`` or more rates are not always first
+
+    Arguments
+    ---------
+    user_size : dict
+        {user idx: number of rates}
+    min_count : int
+        User min count of filtered dataset
+    previous : list of int or None
+        User idxs in the order of previous full dataset. See ``load_published_userlist``
+
+    Returns
+    -------
+    user_mapper : dict
+        {user idx: new user idx}
+    user_large : set
+        Users who have ``min_count`` or more rates
+    """
     user_large = {u for u, c in user_size.items() if c >= min_count}
     user_small = {u for u, c in user_size.items() if c < min_count}
     print(f'{len(user_large)} users >= {min_count}, {len(user_small)} users < {min_count}')
@@ -151,17 +689,37 @@ def split_by_min_count(data, min_count):
     def sort_by_size(userset, user_size):
         return sorted(userset, key=lambda u:-user_size[u])
 
-    user_mapper = {u:idx for idx, u in enumerate(sort_by_size(user_large, user_size))}
-    b = len(user_mapper)
-    user_mapper.update({u:idx+b for idx, u in enumerate(sort_by_size(user_small, user_size))})
+    kept = []
+    if previous is not None:
+        kept = [u for u in previous if u in user_size]
+        user_large = user_large - set(kept)
+        user_small = user_small - set(kept)
+    order = kept + sort_by_size(user_large, user_size) + sort_by_size(user_small, user_size)
+    user_mapper = {u:idx for idx, u in enumerate(order)}
+    user_large = {u for u, c in user_size.items() if c >= min_count}
+    return user_mapper, user_large
+
+def split_by_min_count(data, min_count, previous=None):
+    """
+    Re-index users with ``make_user_mapper``. The users of filtered dataset are in same order
+    with the full dataset
+
+    Returns
+    -------
+    data_filtered, userlist_filtered, data_full, userlist_full
+        Rows of which user idx is re-indexed, and the user idxs of ``data`` in new order
+    """
+    user_size = Counter(row[0] for row in data)
+    user_mapper, user_large = make_user_mapper(user_size, min_count, previous)
+    userlist_full = [u for u, _ in sorted(user_mapper.items(), key=lambda x:x[1])]
+    userlist_filtered = [u for u in userlist_full if u in user_large]
+    filtered_mapper = {u:idx for idx, u in enumerate(userlist_filtered)}
 
-    def transform_idx(row):
-        return (user_mapper[row[0]], row[1], row[2], row[3], row[4], row[5])
+    def transform_idx(row, mapper):
+        return (mapper[row[0]], row[1], row[2], row[3], row[4], row[5])
 
-    data_filtered = [transform_idx(row) for row in data if row[0] in user_large]
-    data_full = [transform_idx(row) for row in data]
-    userlist_full = [u for u, _ in sorted(user_mapper.items(), key=lambda x:x[1])]
-    userlist_filtered = userlist_full[:b]
+    data_filtered = [transform_idx(row, filtered_mapper) for row in data if row[0] in user_large]
+    data_full = [transform_idx(row, user_mapper) for row in data]
 
     data_filtered = sorted(data_filtered)
     data_full = sorted(data_full)
@@ -175,31 +733,27 @@ def split_by_min_count(data, min_count):
     return data_filtered, userlist_filtered, data_full, userlist_full
 
 
-class IndexTable:
-    "duplicated user remover"
-    def __init__(self):
-        self.comment_to_user = dict()
-        self.user_to_comments = dict()
-
-    def insert(self, user_idx, comment_idxs, primary_key):
-        """
-        user_idx : int
-        comment_idxs : tuple of int
-        primary_key : list of tuple (comment idx, timestamp)
-        """
-        for cidx in comment_idxs:
-            # insert user to `comment to user`
-            userset = self.comment_to_user.get(cidx, set())
-            userset.add(user_idx)
-            self.comment_to_user[cidx] = userset
-        # insert comments to `user to comments`
-        self.user_to_comments[user_idx] = primary_key
-
-
 ######################
 ## making directing ##
 
-def make_directing(data_dir, movie_indices, dataset_dir):
+def parse_directors_file(path):
+    """
+    Returns list of (people idx, (korean name, english name))
+    """
+    rows = load_list_of_dict(path)
+    directors = []
+    for row in rows:
+        # load data
+        people_idx = row['id']
+        # exception: (no link director)
+        if isinstance(people_idx, list) and (not people_idx):
+            continue
+        people_idx = int(people_idx)
+        name = (row['k_name'], row.get('e_name', ''))
+        directors.append((people_idx, name))
+    return directors
+
+def make_directing(data_dir, movie_indices, dataset_dir, state_dir=None, zip_path=None):
     people_dictionary_path = f'{dataset_dir}/peoples.txt'
     directings_path = f'{dataset_dir}/directings.csv'
 
@@ -215,25 +769,13 @@ def make_directing(data_dir, movie_indices, dataset_dir):
     # (movie idx, people idx)
     directings = []
 
-    n_movies = len(movie_indices)
-    for i, movie_idx in enumerate(movie_indices):
+    movie_indices = [idx for idx in movie_indices if os.path.exists(f'{data_dir}/directors/{idx}')]
+    paths = [f'{data_dir}/directors/{idx}' for idx in movie_indices]
+    parsed = parse_sources(paths, parse_directors_file, state_dir, 'directors')
 
-        path = f'{data_dir}/directors/{movie_idx}'
-        if not os.path.exists(path):
-            continue
-
-        rows = load_list_of_dict(path)
-
-        for row in rows:
-            # load data
-            people_idx = row['id']
-            # exception: (no link director)
-            if isinstance(people_idx, list) and (not people_idx):
-                continue
-            people_idx = int(people_idx)
-            name = (row['k_name'], row.get('e_name', ''))
-
-            # append
+    n_movies = len(movie_indices)
+    for i, (movie_idx, directors) in enumerate(zip(movie_indices, parsed)):
+        for people_idx, name in directors:
             people_dictionary[people_idx] = name
             directings.append((movie_idx, people_idx))
 
@@ -242,16 +784,41 @@ def make_directing(data_dir, movie_indices, dataset_dir):
             n_peoples = len(people_dictionary)
             n_directings = len(directings)
             print(f'\rScanning {percent:.4}%: {n_peoples} peoples & {n_directings} directings from {n_movies} movies', end='')
+    n_peoples = len(people_dictionary)
+    n_directings = len(directings)
     print(f'\rScanning has been finished. Found {n_peoples} peoples & {n_directings} directings from {n_movies} movies\n')
 
-    save_rows(directings, directings_path, 'movie,people', ',')
+    save_rows(directings, directings_path, 'movie,people', ',', zip_path=zip_path)
     people_dictionary = [(idx, names[0], names[1]) for idx, names in sorted(people_dictionary.items())]
+    # peoples.txt is completed and archived in make_casting
     save_rows(people_dictionary, people_dictionary_path, 'people\tkorean\toriginal', '\t')
 
 ####################
 ## making casting ##
 
-def make_casting(data_dir, movie_indices, dataset_dir):
+def parse_actors_file(path):
+    """
+    Returns list of (people idx, (korean name, english name), credit order, leading, role)
+    """
+    rows = load_list_of_dict(path)
+    actors = []
+    for row in rows:
+        # load data
+        people_idx = row['id']
+        # exception: (no link director)
+        if isinstance(people_idx, list) and (not people_idx):
+            continue
+        people_idx = int(people_idx)
+        name = (row['k_name'], row.get('e_name', ''))
+        leading = 1 if row['part'].strip() == '주연' else 0
+        role = row.get('role', '').strip()
+        if role[-2:] == ' 역':
+            role = role[:-2].strip()
+        order = row.get('casting_order', row.get('cating_order', -1))
+        actors.append((people_idx, name, order, leading, role))
+    return actors
+
+def make_casting(data_dir, movie_indices, dataset_dir, state_dir=None, zip_path=None):
     people_dictionary_path = f'{dataset_dir}/peoples.txt'
     castings_path = f'{dataset_dir}/castings.csv'
     roles_paths = f'{dataset_dir}/roles.txt'
@@ -270,30 +837,13 @@ def make_casting(data_dir, movie_indices, dataset_dir):
                 idx, kor, eng = row[:-1].split('\t')
                 people_dictionary[int(idx)] = (kor, eng)
 
-    n_movies = len(movie_indices)
-    for i, movie_idx in enumerate(movie_indices):
+    movie_indices = [idx for idx in movie_indices if os.path.exists(f'{data_dir}/actors/{idx}')]
+    paths = [f'{data_dir}/actors/{idx}' for idx in movie_indices]
+    parsed = parse_sources(paths, parse_actors_file, state_dir, 'actors')
 
-        path = f'{data_dir}/actors/{movie_idx}'
-        if not os.path.exists(path):
-            continue
-
-        rows = load_list_of_dict(path)
-
-        for row in rows:
-            # load data
-            people_idx = row['id']
-            # exception: (no link director)
-            if isinstance(people_idx, list) and (not people_idx):
-                continue
-            people_idx = int(people_idx)
-            name = (row['k_name'], row.get('e_name', ''))
-            leading = 1 if row['part'].strip() == '주연' else 0
-            role = row.get('role', '').strip()
-            if role[-2:] == ' 역':
-                role = role[:-2].strip()
-            order = row.get('casting_order', row.get('cating_order', -1))
-
-            # append
+    n_movies = len(movie_indices)
+    for i, (movie_idx, actors) in enumerate(zip(movie_indices, parsed)):
+        for people_idx, name, order, leading, role in actors:
             people_dictionary[people_idx] = name
             castings.append((movie_idx, people_idx, order, leading))
             roles.append((movie_idx, people_idx, role))
@@ -303,17 +853,43 @@ def make_casting(data_dir, movie_indices, dataset_dir):
             n_peoples = len(people_dictionary)
             n_castings = len(castings)
             print(f'\rScanning {percent:.4}%: {n_peoples} peoples & {n_castings} castings from {n_movies} movies', end='')
+    n_peoples = len(people_dictionary)
+    n_castings = len(castings)
     print(f'\rScanning has been finished. Found {n_peoples} peoples & {n_castings} castings from {n_movies} movies\n')
 
-    save_rows(castings, castings_path, 'movie,people,order,leading', ',')
-    save_rows(roles, roles_paths, 'movie\tpeople\trole', '\t')
+    save_rows(castings, castings_path, 'movie,people,order,leading', ',', zip_path=zip_path)
+    save_rows(roles, roles_paths, 'movie\tpeople\trole', '\t', zip_path=zip_path)
     people_dictionary = [(idx, names[0], names[1]) for idx, names in sorted(people_dictionary.items())]
-    save_rows(people_dictionary, people_dictionary_path, 'people\tkorean\toriginal', '\t')
+    save_rows(people_dictionary, people_dictionary_path, 'people\tkorean\toriginal', '\t', zip_path=zip_path)
 
 #################
 ## making meta ##
 
-def make_meta(data_dir, movie_indices, dataset_dir):
+def parse_meta_file(path):
+    """
+    Returns
+    -------
+    movie : tuple
+        (title, title eng, year, grade)
+    genres : list of str
+    dates : list of str
+    countries : list of str
+    """
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    title = normalize_text(data['title'])
+    title_eng = normalize_text(data.get('e_title', ''))
+    grade = data.get('grade', '')
+    genres = data.get('genres', [])
+    dates = data.get('open_date', [])
+    year = '-'
+    if dates:
+        year = dates[-1][:4]
+    countries = data.get('countries', [])
+    return (title, title_eng, year, grade), genres, dates, countries
+
+def make_meta(data_dir, movie_indices, dataset_dir, state_dir=None, zip_path=None):
     genres_path = f'{dataset_dir}/genres.csv'
     dates_path = f'{dataset_dir}/dates.csv'
     countries_path = f'{dataset_dir}/countries.csv'
@@ -329,24 +905,12 @@ def make_meta(data_dir, movie_indices, dataset_dir):
     # (movie idx, title, title eng, year, grade)
     movies = []
 
-    for i, movie_idx in enumerate(movie_indices):
-        inpath = f'{data_dir}/meta/{movie_idx}.json'
-        if not os.path.exists(inpath):
-            continue
-        with open(inpath, encoding='utf-8') as f:
-            data = json.load(f)
-
-        title = normalize_text(data['title'])
-        title_eng = normalize_text(data.get('e_title', ''))
-        grade = data.get('grade', '')
-        genres_i = data.get('genres', [])
-        dates_i = data.get('open_date', [])
-        year = '-'
-        if dates_i:
-            year = dates_i[-1][:4]
-        countries_i = data.get('countries', [])
-
-        movies.append((movie_idx, title, title_eng, year, grade))
+    existing_indices = [idx for idx in movie_indices if os.path.exists(f'{data_dir}/meta/{idx}.json')]
+    paths = [f'{data_dir}/meta/{idx}.json' for idx in existing_indices]
+    parsed = parse_sources(paths, parse_meta_file, state_dir, 'meta')
+
+    for i, (movie_idx, (movie, genres_i, dates_i, countries_i)) in enumerate(zip(existing_indices, parsed)):
+        movies.append((movie_idx,) + tuple(movie))
         for g in genres_i:
             genres.append((movie_idx, g))
         for d in dates_i:
@@ -355,11 +919,11 @@ def make_meta(data_dir, movie_indices, dataset_dir):
             countries.append((movie_idx, c))
 
         if i % 5000 == 0:
-            percent = 100 * (i+1) / n_movies
-            print(f'\rScanning metadata: {percent:.4}% from {i+1} / {n_movies} movies', end='')
+            percent = 100 * (i+1) / len(existing_indices)
+            print(f'\rScanning metadata: {percent:.4}% from {i+1} / {len(existing_indices)} movies', end='')
     print(f'\rScanning metadata was finished with {n_movies} movies{" "*20}\n')
 
-    save_rows(genres, genres_path, 'movie,genre', ',')
-    save_rows(dates, dates_path, 'movie,date', ',')
-    save_rows(countries, countries_path, 'movie,country', ',')
-    save_rows(movies, movies_path, 'movie\ttitle\ttitle_eng\tyear\tgrade', '\t')
+    save_rows(genres, genres_path, 'movie,genre', ',', zip_path=zip_path)
+    save_rows(dates, dates_path, 'movie,date', ',', zip_path=zip_path)
+    save_rows(countries, countries_path, 'movie,country', ',', zip_path=zip_path)
+    save_rows(movies, movies_path, 'movie\ttitle\ttitle_eng\tyear\tgrade', '\t', zip_path=zip_path)
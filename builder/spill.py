@@ -0,0 +1,117 @@
+import heapq
+import os
+import pickle
+import sys
+from collections import Counter
+
+
+def estimate_row_bytes(row):
+    """
+    Rough memory usage of a row tuple. Text dominates the size
+    """
+    return 200 + sys.getsizeof(row[-1])
+
+def write_batches(rows, f, batch_size=4096):
+    for b in range(0, len(rows), batch_size):
+        pickle.dump(rows[b: b + batch_size], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def iter_rows(path):
+    """
+    Yield rows of a spill file which consists of pickled batches
+    """
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                batch = pickle.load(f)
+            except EOFError:
+                return
+            yield from batch
+
+
+class RowSpiller:
+    """
+    List-like sink of comment rows. It writes rows to disk in batches
+    and counts the number of rows of each user.
+
+    Usage
+    -----
+        >>> spiller = RowSpiller('spill/')
+        >>> data, users, _ = load_comments(data_dir, debug, data=spiller)
+        >>> spiller.close()
+        >>> spiller.user_size
+    """
+    def __init__(self, spill_dir, batch_size=4096):
+        os.makedirs(spill_dir, exist_ok=True)
+        self.spill_dir = spill_dir
+        self.path = f'{spill_dir}/rows.pkl'
+        self.batch_size = batch_size
+        self.batch = []
+        self.n_rows = 0
+        self.user_size = Counter()
+        self.f = open(self.path, 'wb')
+
+    def __len__(self):
+        return self.n_rows
+
+    def append(self, row):
+        self.batch.append(row)
+        self.user_size[row[0]] += 1
+        self.n_rows += 1
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            pickle.dump(self.batch, self.f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.batch = []
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+
+def sort_runs(rows_path, transform, spill_dir, memory_budget):
+    """
+    Transform rows and write them as sorted runs of which memory usage is less than ``memory_budget``
+
+    Arguments
+    ---------
+    rows_path : str
+        Spill file of ``RowSpiller``
+    transform : callable
+        transform(row) returns transformed row
+    spill_dir : str
+        Directory of run files
+    memory_budget : int
+        Bytes
+
+    Returns
+    -------
+    run_paths : list of str
+    """
+    run_paths = []
+    rows, n_bytes = [], 0
+
+    def write_run(rows):
+        path = f'{spill_dir}/run-{len(run_paths):05}.pkl'
+        rows.sort()
+        with open(path, 'wb') as f:
+            write_batches(rows, f)
+        run_paths.append(path)
+
+    for row in iter_rows(rows_path):
+        row = transform(row)
+        rows.append(row)
+        n_bytes += estimate_row_bytes(row)
+        if n_bytes >= memory_budget:
+            write_run(rows)
+            rows, n_bytes = [], 0
+    if rows:
+        write_run(rows)
+    return run_paths
+
+def merge_runs(run_paths):
+    """
+    Yield rows of sorted runs in sorted order. It keeps only one batch of each run in memory
+    """
+    return heapq.merge(*[iter_rows(path) for path in run_paths])
@@ -1,7 +1,10 @@
 import json
 import os
+import zipfile
+import numpy as np
 from collections import defaultdict
 from datetime import datetime
+from itertools import islice
 
 
 def to_unix_time(time_strf):
@@ -102,7 +105,282 @@ def load_list_of_dict(path):
         objs = [json.loads(obj.strip()) for obj in f]
     return objs
 
-def save_rows(rows, path, header, delimiter):
+def _int_matrix(values):
+    """
+    Returns
+    -------
+    matrix : numpy.ndarray
+        uint8 (n, width) matrix of right-aligned decimal digits. Empty cells are 0
+    lengths : numpy.ndarray
+        Number of bytes of each value
+    """
+    values = np.asarray(values, dtype=np.int64)
+    n = values.shape[0]
+    negative = values < 0
+    # abs of int64 min overflows, but it does not appear in the dataset
+    remain = np.abs(values)
+    if n > 0 and remain.max() < (1 << 32):
+        # uint32 division is faster
+        remain = remain.astype(np.uint32)
+    width = len(str(int(remain.max()))) + 1 if n > 0 else 1
+    matrix = np.zeros((n, width), dtype=np.uint8)
+    lengths = np.zeros(n, dtype=np.int64)
+    for k in range(width - 1):
+        present = remain > 0 if k > 0 else np.ones(n, dtype=bool)
+        remain, digit = np.divmod(remain, 10)
+        matrix[:, width - 1 - k] = np.where(present, digit + ord('0'), 0)
+        lengths += present
+    rows = np.flatnonzero(negative)
+    lengths[rows] += 1
+    matrix[rows, width - lengths[rows]] = ord('-')
+    return matrix, lengths
+
+def _format_int_columns(columns, delimiter, newline=False):
+    """
+    Format consecutive integer columns as delimited segment of each row
+    """
+    n = len(columns[0])
+    delimiter = np.frombuffer(delimiter.encode('utf-8'), dtype=np.uint8)
+    matrices, lengths = [], np.zeros(n, dtype=np.int64)
+    for i, column in enumerate(columns):
+        if i > 0:
+            matrices.append(np.broadcast_to(delimiter, (n, delimiter.shape[0])))
+            lengths += delimiter.shape[0]
+        matrix, lengths_ = _int_matrix(column)
+        matrices.append(matrix)
+        lengths += lengths_
+    if newline:
+        matrices.append(np.full((n, 1), ord('\n'), dtype=np.uint8))
+        lengths += 1
+    matrix = np.hstack(matrices)
+    return matrix[matrix != 0], lengths
+
+def _is_int_column(values):
+    return isinstance(values, np.ndarray) and values.dtype.kind in 'iu'
+
+def _to_column(values):
+    """
+    Integer columns become int64 array for vectorized formatting, the others are kept as list
+    """
+    if isinstance(values, np.ndarray):
+        return values
+    # bool is subclass of int, but it is formatted as True / False
+    if set(map(type, values)) == {int}:
+        try:
+            return np.asarray(values, dtype=np.int64)
+        except OverflowError:
+            pass
+    return values
+
+def format_rows(rows, delimiter):
+    """
+    Format rows with ``str`` of each value, and returns the delimited lines as one bytes
+    """
+    return ''.join([delimiter.join(map(str, row)) + '\n' for row in rows]).encode('utf-8')
+
+def format_block(columns, delimiter):
+    """
+    Arguments
+    ---------
+    columns : list of numpy.ndarray or list
+        Columns of same length
+    delimiter : str
+        Column separator
+
+    Returns
+    -------
+    block : bytes
+        Delimited lines. If every column is integer array, they are formatted with NumPy.
+        Else, the values are formatted with ``str``
+    """
+    if len(columns[0]) == 0:
+        return b''
+    if all(_is_int_column(c) for c in columns):
+        flat, _ = _format_int_columns(columns, delimiter, newline=True)
+        return flat.tobytes()
+    columns = [c.tolist() if isinstance(c, np.ndarray) else c for c in columns]
+    return format_rows(zip(*columns), delimiter)
+
+
+class BulkWriter:
+    """
+    Buffered writer of delimited rows. It writes the lines in large blocks,
+    and formats the blocks of integer columns with NumPy. In the same pass, it can write
+
+    - zip archive member of the file, without writing and copying the file again
+    - binary columnar `.npz` file of integer columns, which `kmr_dataset` loaders read directly
+
+    Arguments
+    ---------
+    path : str or None
+        Text file path. If None, only zip member or npz file is written
+    header : str
+        Column names
+    delimiter : str
+        Column separator
+    zip_path : str or None
+        If not None, write the file to the zip archive as ``arcname`` too.
+        The archive is opened with append mode, so remove stale archive before rebuilding
+    arcname : str or None
+        Member name in zip archive. Default is the file name of ``path``
+    npz_path : str or None
+        If not None, store integer columns as {column name: array} in npz file.
+        The columns are spilled to temporal files next to ``npz_path`` while writing,
+        and the npz file is assembled from them when closed
+    buffer_size : int
+        Bytes of block to write at once
+
+    Usage
+    -----
+        >>> with BulkWriter('rates.csv', 'user,movie,rate,time', ',', npz_path='rates.npz') as writer:
+        >>>     writer.write_columns([users, movies, rates, timestamps])
+
+        >>> with BulkWriter('castings.csv', 'movie,people,order,leading', ',', zip_path='meta.zip') as writer:
+        >>>     writer.write_rows(castings)
+    """
+    def __init__(self, path, header, delimiter, zip_path=None, arcname=None,
+        npz_path=None, buffer_size=1 << 22):
+
+        self.delimiter = delimiter
+        self.names = header.split(delimiter)
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.n_buffered = 0
+        self.files = []
+        if path is not None:
+            self.files.append(open(path, 'wb'))
+        self.zf = None
+        if zip_path is not None:
+            if arcname is None:
+                arcname = os.path.basename(path)
+            self.zf = zipfile.ZipFile(zip_path, 'a', compression=zipfile.ZIP_DEFLATED)
+            self.files.append(self.zf.open(arcname, 'w', force_zip64=True))
+        self.npz_path = npz_path
+        # only the columns which are integer in every block are stored in npz.
+        # The spill file of a column is closed and removed when a non-integer block is written
+        self.npz_spills = [None for _ in self.names]
+        self.npz_dtypes = [[] for _ in self.names]
+        self.npz_sizes = [0 for _ in self.names]
+        if npz_path is not None:
+            self.npz_spills = [open(self._spill_path(i), 'wb') for i in range(len(self.names))]
+        self._write(f'{header}\n'.encode('utf-8'))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write(self, block):
+        self.buffer.append(block)
+        self.n_buffered += len(block)
+        if self.n_buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        block = b''.join(self.buffer)
+        for f in self.files:
+            f.write(block)
+        self.buffer = []
+        self.n_buffered = 0
+
+    def write_columns(self, columns):
+        """
+        Arguments
+        ---------
+        columns : list of numpy.ndarray or list
+            Columns of same length
+        """
+        columns = [_to_column(c) for c in columns]
+        if self.npz_path is not None:
+            if len(columns) != len(self.names):
+                raise ValueError(f'npz output requires {len(self.names)} columns of header, but {len(columns)}')
+            for i, column in enumerate(columns):
+                if self.npz_spills[i] is None:
+                    continue
+                if _is_int_column(column):
+                    column.astype(np.int64, copy=False).tofile(self.npz_spills[i])
+                    self.npz_dtypes[i].append(column.dtype)
+                    self.npz_sizes[i] += column.shape[0]
+                else:
+                    self._discard_spill(i)
+        self._write(format_block(columns, self.delimiter))
+
+    def write_rows(self, rows, block_rows=100000):
+        """
+        Arguments
+        ---------
+        rows : iterable of tuple
+        block_rows : int
+            Number of rows which are formatted at once
+        """
+        rows = iter(rows)
+        while True:
+            block = list(islice(rows, block_rows))
+            if not block:
+                break
+            if self.npz_path is not None:
+                # npz requires columns
+                self.write_columns(list(zip(*block)))
+            else:
+                self._write(format_rows(block, self.delimiter))
+
+    def close(self):
+        self.flush()
+        for f in self.files:
+            f.close()
+        self.files = []
+        if self.zf is not None:
+            self.zf.close()
+            self.zf = None
+        if self.npz_path is not None:
+            try:
+                self._write_npz()
+            finally:
+                for i in range(len(self.names)):
+                    self._discard_spill(i)
+            self.npz_path = None
+
+    def _spill_path(self, i):
+        return f'{self.npz_path}.{i}.{os.getpid()}.tmp'
+
+    def _discard_spill(self, i):
+        if self.npz_spills[i] is not None:
+            self.npz_spills[i].close()
+            self.npz_spills[i] = None
+            os.remove(self._spill_path(i))
+
+    def _write_npz(self, chunk_size=1 << 20):
+        """
+        Assemble the npz file from spilled int64 columns. Each member is written
+        with ``.npy`` header and the column data in chunks, as ``np.savez`` does
+        """
+        for f in self.npz_spills:
+            if f is not None:
+                f.close()
+        tmp_path = f'{self.npz_path}.{os.getpid()}.tmp'
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for i, name in enumerate(self.names):
+                if self.npz_spills[i] is None:
+                    continue
+                dtype = np.result_type(*self.npz_dtypes[i]) if self.npz_dtypes[i] else np.dtype(np.int64)
+                if dtype.kind not in 'iu':
+                    # mixed int64 and uint64 blocks
+                    dtype = np.dtype(np.int64)
+                header = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                          'shape': (self.npz_sizes[i],)}
+                with zf.open(f'{name}.npy', 'w', force_zip64=True) as member, open(self._spill_path(i), 'rb') as spill:
+                    np.lib.format.write_array_header_1_0(member, header)
+                    while True:
+                        chunk = np.fromfile(spill, dtype=np.int64, count=chunk_size)
+                        if chunk.shape[0] == 0:
+                            break
+                        member.write(chunk.astype(dtype, copy=False).tobytes())
+        os.replace(tmp_path, self.npz_path)
+
+def save_rows(rows, path, header, delimiter, zip_path=None, arcname=None, npz_path=None):
     """
     Arguments
     ---------
@@ -120,11 +398,12 @@ def save_rows(rows, path, header, delimiter):
         Column names
     delimiter : str
         Column separator
+    zip_path : str or None
+        If not None, write the file to the zip archive in same pass. See ``BulkWriter``
+    arcname : str or None
+        Member name in zip archive. Default is the file name of ``path``
+    npz_path : str or None
+        If not None, store integer columns to binary columnar npz file
     """
-    def row_to_str(row, delimiter=','):
-        return delimiter.join([str(v) for v in row])
-
-    with open(path, 'w', encoding='utf-8') as f:
-        f.write(f'{header}\n')
-        for row in rows:
-            f.write(f'{row_to_str(row, delimiter=delimiter)}\n')
+    with BulkWriter(path, header, delimiter, zip_path, arcname, npz_path) as writer:
+        writer.write_rows(rows)
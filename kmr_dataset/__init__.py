@@ -1,6 +1,12 @@
 __version__ = '1.0.1'
 __author__ = 'lovit'
 
+from .idmap import IdMap
 from .io import get_paths
+from .io import iter_rates
 from .io import load_histories
+from .io import load_history_index
+from .io import load_item_features
+from .io import load_meta
 from .io import load_rates
+from .io import load_texts
@@ -0,0 +1,23 @@
+def _iter_blocks(f, block_size=1 << 22, n_bytes=None):
+    """
+    Yield bytes blocks of ``f`` which always end at a line boundary.
+    If ``n_bytes`` is not None, read at most ``n_bytes`` bytes from current position
+    """
+    remain = b''
+    while True:
+        if n_bytes is None:
+            block = f.read(block_size)
+        else:
+            block = f.read(min(block_size, n_bytes))
+            n_bytes -= len(block)
+        if not block:
+            break
+        block = remain + block
+        end = block.rfind(b'\n') + 1
+        if end == 0:
+            remain = block
+            continue
+        remain = block[end:]
+        yield block[:end]
+    if remain.strip():
+        yield remain
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import shutil
+import warnings
+import numpy as np
+from .install import _FileLock
+
+
+CACHE_VERSION = 2
+
+def get_cache_dir(cache_dir=None):
+    """
+    Arguments
+    ---------
+    cache_dir : str or None
+        Cache directory. If None, use environment variable ``KMRD_CACHE_DIR``.
+        If it is not set, use ``~/.cache/kmr_dataset``
+
+    Returns
+    -------
+    cache_dir : str
+        Absolute path of cache directory
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get('KMRD_CACHE_DIR', '~/.cache/kmr_dataset')
+    return os.path.abspath(os.path.expanduser(cache_dir))
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Returns sha1 hex digest of the file
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _read_meta(entry):
+    try:
+        with open(f'{entry}/source.json', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_meta(entry, meta):
+    tmp = f'{entry}/source.json.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp, f'{entry}/source.json')
+
+def _is_valid(meta, sources):
+    """
+    Check the cached sources are same with current sources.
+    mtime is refreshed in ``meta`` if only mtime is changed but the contents are same
+    """
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return False
+    cached = meta.get('sources', [])
+    if [item.get('path') for item in cached] != sources:
+        return False
+    for item, source in zip(cached, sources):
+        stat = _source_stat(source)
+        if item.get('size') != stat['size']:
+            return False
+        if item.get('mtime_ns') == stat['mtime_ns']:
+            continue
+        # touched or copied, but the contents may be same
+        if item.get('sha1') != file_hash(source):
+            return False
+        item['mtime_ns'] = stat['mtime_ns']
+    return True
+
+def open_entry(source, cache_dir=None, name=None):
+    """
+    Arguments
+    ---------
+    source : str or list of str
+        Source file path(s). Cache entry is identified by their absolute paths
+    cache_dir : str or None
+        Cache directory. See ``get_cache_dir``
+    name : str or None
+        Prefix of cache entry name. If None, use the file name of first source
+
+    Returns
+    -------
+    entry : str or None
+        Cache entry directory of the source files.
+        Stale entry is cleared if the size, mtime and hash of any source file are changed.
+        The entry is validated and cleared under inter-process lock file `{entry}.lock`.
+        It returns None if the cache directory is not writable
+
+    Usage
+    -----
+        >>> entry = open_entry('datafile/kmrd-small/rates.csv')
+        >>> arrays = load_arrays(entry, ['users', 'movies'])
+    """
+    if isinstance(source, str):
+        source = [source]
+    sources = [os.path.abspath(path) for path in source]
+    if name is None:
+        name = os.path.splitext(os.path.basename(sources[0]))[0]
+    digest = hashlib.sha1('\n'.join(sources).encode('utf-8')).hexdigest()[:12]
+    entry = f'{get_cache_dir(cache_dir)}/{name}-{digest}'
+
+    try:
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        # processes which open same entry at once must not remove the entry of each other
+        with _FileLock(f'{entry}.lock'):
+            return _validate_entry(entry, sources)
+    except OSError as e:
+        warnings.warn(f'Cache is disabled. Failed to create cache entry {entry}: {e}')
+        return None
+
+def _validate_entry(entry, sources):
+    """
+    Returns the entry after clearing it if it is stale. The caller holds the lock of the entry
+    """
+    meta = _read_meta(entry)
+    mtimes = None if meta is None else [item.get('mtime_ns') for item in meta.get('sources', [])]
+    if _is_valid(meta, sources):
+        if mtimes != [item['mtime_ns'] for item in meta['sources']]:
+            try:
+                _write_meta(entry, meta)
+            except OSError:
+                pass
+        return entry
+
+    shutil.rmtree(entry, ignore_errors=True)
+    os.makedirs(entry, exist_ok=True)
+    items = []
+    for path in sources:
+        item = {'path': path, 'sha1': file_hash(path)}
+        item.update(_source_stat(path))
+        items.append(item)
+    _write_meta(entry, {'version': CACHE_VERSION, 'sources': items})
+    return entry
+
+def load_arrays(entry, names, mmap_mode=None):
+    """
+    Arguments
+    ---------
+    entry : str or None
+        Cache entry directory
+    names : list of str
+        Array names
+    mmap_mode : str or None
+        If not None, arrays are loaded as ``numpy.memmap``. See ``numpy.load``
+
+    Returns
+    -------
+    arrays : list of numpy.ndarray or None
+        It returns None if any of the arrays is not cached
+    """
+    if entry is None:
+        return None
+    paths = [f'{entry}/{name}.npy' for name in names]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    try:
+        return [np.load(path, mmap_mode=mmap_mode, allow_pickle=False) for path in paths]
+    except (OSError, ValueError):
+        return None
+
+def save_arrays(entry, arrays):
+    """
+    Arguments
+    ---------
+    entry : str or None
+        Cache entry directory. If None, do nothing
+    arrays : dict of numpy.ndarray
+        {name: array}. Each array is stored as raw ``{name}.npy`` file
+
+    Returns
+    -------
+    flag : Boolean
+        It returns True if all arrays are stored
+    """
+    if entry is None:
+        return False
+    try:
+        for name, array in arrays.items():
+            # write to temporal file first, then other processes never read half-written array
+            tmp = f'{entry}/{name}.{os.getpid()}.tmp.npy'
+            np.save(tmp, np.ascontiguousarray(array), allow_pickle=False)
+            os.replace(tmp, f'{entry}/{name}.npy')
+    except OSError as e:
+        warnings.warn(f'Failed to write cache to {entry}: {e}')
+        return False
+    return True
+
+class ArrayAppender:
+    """
+    Writer of 1-D array ``{entry}/{name}.npy`` which is appended chunk by chunk,
+    therefore the whole array is never in memory. The chunks are written to
+    a temporal raw file, and it becomes `.npy` file when ``close`` is called
+
+    Usage
+    -----
+        >>> appender = ArrayAppender(entry, 'movies', np.int32)
+        >>> for chunk in chunks:
+        >>>     appender.append(chunk)
+        >>> appender.close()
+    """
+    def __init__(self, entry, name, dtype):
+        self.path = f'{entry}/{name}.npy'
+        self.raw_path = f'{entry}/{name}.{os.getpid()}.tmp.raw'
+        self.dtype = np.dtype(dtype)
+        self.size = 0
+        self.f = open(self.raw_path, 'wb')
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self.f.write(values.tobytes())
+        self.size += values.shape[0]
+
+    def close(self):
+        self.f.close()
+        tmp = f'{os.path.splitext(self.path)[0]}.{os.getpid()}.tmp.npy'
+        header = {'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False, 'shape': (self.size,)}
+        with open(tmp, 'wb') as f, open(self.raw_path, 'rb') as raw:
+            np.lib.format.write_array_header_1_0(f, header)
+            shutil.copyfileobj(raw, f, 1 << 22)
+        os.remove(self.raw_path)
+        os.replace(tmp, self.path)
+
+    def discard(self):
+        self.f.close()
+        if os.path.exists(self.raw_path):
+            os.remove(self.raw_path)
+
+def encode_strings(strings):
+    """
+    Arguments
+    ---------
+    strings : list of str
+        Strings to store in binary cache
+
+    Returns
+    -------
+    data : numpy.ndarray
+        uint8 array of concatenated UTF-8 bytes
+    offsets : numpy.ndarray
+        int64 array. ``data[offsets[i]:offsets[i+1]]`` is the i-th string
+    """
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return data, offsets
+
+def decode_strings(data, offsets):
+    """
+    Inverse of ``encode_strings``. It returns numpy.ndarray of str objects
+    """
+    raw = data.tobytes()
+    offsets = offsets.tolist()
+    strings = np.empty(len(offsets) - 1, dtype=object)
+    strings[:] = [raw[b:e].decode('utf-8') for b, e in zip(offsets, offsets[1:])]
+    return strings
@@ -0,0 +1,176 @@
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy.sparse import issparse
+from .sampling import _contains
+from .sampling import _sorted_keys
+
+
+METRICS = ('recall', 'precision', 'ndcg', 'map')
+
+def _score_block(scores, users):
+    """
+    Dense float64 score matrix of the users. The block is a copy, so it can be masked in place
+    """
+    if callable(scores):
+        block = scores(users)
+    else:
+        block = scores[users]
+    if issparse(block):
+        block = block.toarray()
+    return np.array(block, dtype=np.float64)
+
+def _mask_seen(block, train, users):
+    """
+    Set the scores of train items to -inf with the csr structure of ``train``
+    """
+    begins, ends = train.indptr[users], train.indptr[users + 1]
+    counts = ends - begins
+    rows = np.repeat(np.arange(users.shape[0]), counts)
+    positions = np.repeat(begins - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    block[rows, train.indices[positions]] = -np.inf
+
+def top_k(block, k):
+    """
+    Arguments
+    ---------
+    block : numpy.ndarray
+        Score matrix of shape (n_users, n_items)
+    k : int
+        Number of items to select
+
+    Returns
+    -------
+    items : numpy.ndarray
+        (n_users, k) item indices in descending order of score
+    valid : numpy.ndarray
+        (n_users, k) Boolean. False if the item is masked (score is -inf)
+    """
+    k = min(k, block.shape[1])
+    items = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(block, items, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    items = np.take_along_axis(items, order, axis=1)
+    valid = np.take_along_axis(top_scores, order, axis=1) > -np.inf
+    return items, valid
+
+def _evaluate_block(scores, train, test_keys, n_relevants, users, k, mask_seen, recommended, lock):
+    block = _score_block(scores, users)
+    if block.shape != (users.shape[0], train.shape[1]):
+        raise ValueError(f'Score block must be of shape {(users.shape[0], train.shape[1])}, but {block.shape}')
+    if mask_seen:
+        _mask_seen(block, train, users)
+    items, valid = top_k(block, k)
+    del block
+
+    n_items = train.shape[1]
+    hits = valid & _contains(test_keys, n_items, np.repeat(users, items.shape[1]), items.ravel()).reshape(items.shape)
+    n_relevant = n_relevants[users]
+    n_hits = hits.sum(axis=1)
+    discounts = 1 / np.log2(np.arange(2, items.shape[1] + 2))
+    ideal = np.cumsum(discounts)[np.minimum(n_relevant, items.shape[1]) - 1]
+    precisions = np.cumsum(hits, axis=1) / np.arange(1, items.shape[1] + 1)
+    per_user = {
+        'recall': n_hits / n_relevant,
+        'precision': n_hits / k,
+        'ndcg': (hits * discounts).sum(axis=1) / ideal,
+        'map': (precisions * hits).sum(axis=1) / np.minimum(n_relevant, k),
+    }
+    counts = np.bincount(items[valid], minlength=n_items)
+    with lock:
+        recommended += counts
+    return per_user
+
+def evaluate(train, test, scores, k=10, users=None, mask_seen=True, block_size=None,
+    max_block_bytes=1 << 28, n_jobs=1, return_per_user=False):
+    """
+    Top-k ranking evaluation over user blocks
+
+    Arguments
+    ---------
+    train : scipy.sparse.csr_matrix
+        (user, item) train matrix. Its items are excluded from recommendation if ``mask_seen``
+    test : scipy.sparse.csr_matrix
+        (user, item) test matrix of same shape. Every element is relevant
+    scores : callable or array-like
+        If callable, scores(users) returns (len(users), n_items) score matrix of the user indices.
+        Else, a (n_users, n_items) numpy.ndarray, numpy.memmap or sparse matrix
+    k : int
+        Length of recommendation list
+    users : numpy.ndarray or None
+        Users to evaluate. If None, the users who have test items
+    mask_seen : Boolean
+        If True, train items are masked before selecting top-k
+    block_size : int or None
+        Number of users of a block. If None, it is set so that a float64 score block
+        is smaller than ``max_block_bytes``
+    max_block_bytes : int
+        Memory cap of a score block. Peak memory is about ``n_jobs`` blocks
+    n_jobs : int
+        Number of threads. NumPy releases the GIL in scoring, masking and selection
+    return_per_user : Boolean
+        If True, return per-user metrics too
+
+    Returns
+    -------
+    result : dict
+        Mean of recall, precision, NDCG and MAP at k over the users,
+        catalog coverage (ratio of recommended items) and popularity bias
+        (average train count of recommended items, divided by average train count of items)
+    per_user : dict of numpy.ndarray
+        Metrics of each user in ``users``. It is returned only when ``return_per_user=True``
+
+    Usage
+    -----
+        >>> from kmr_dataset.evaluation import evaluate
+        >>> from kmr_dataset.split import leave_last_k_out
+        >>> train, train_ts, test, test_ts = leave_last_k_out(rates, timestamps, k=1)
+        >>> evaluate(train, test, lambda users: user_factors[users] @ item_factors.T, k=10, n_jobs=4)
+        $ {'recall': 0.12, 'precision': 0.012, 'ndcg': 0.061, 'map': 0.043, 'coverage': 0.31, ...}
+    """
+    if train.shape != test.shape:
+        raise ValueError(f'train and test must be of same shape, but {train.shape} and {test.shape}')
+    if k < 1:
+        raise ValueError(f'k must be positive, but {k}')
+    train, test = train.tocsr(), test.tocsr()
+    n_items = train.shape[1]
+    n_relevants = np.diff(test.indptr)
+    if users is None:
+        users = np.flatnonzero(n_relevants)
+    else:
+        users = np.asarray(users, dtype=np.int64)
+        users = users[n_relevants[users] > 0]
+    if block_size is None:
+        block_size = max(1, max_block_bytes // (8 * max(n_items, 1)))
+    test_keys = _sorted_keys(test)
+    # number of recommendations of each item
+    recommended = np.zeros(n_items, dtype=np.int64)
+    lock = threading.Lock()
+
+    def run(begin):
+        block_users = users[begin: begin + block_size]
+        return _evaluate_block(scores, train, test_keys, n_relevants, block_users, k, mask_seen, recommended, lock)
+
+    begins = range(0, users.shape[0], block_size)
+    if n_jobs is not None and n_jobs > 1:
+        with ThreadPoolExecutor(n_jobs) as executor:
+            results = list(executor.map(run, begins))
+    else:
+        results = [run(begin) for begin in begins]
+
+    per_user = {name: np.concatenate([r[name] for r in results]) if results else np.zeros(0)
+                for name in METRICS}
+    popularity = np.bincount(train.indices, minlength=n_items)
+    n_recommended = recommended.sum()
+    result = {name: float(values.mean()) if values.shape[0] else 0.0 for name, values in per_user.items()}
+    result['coverage'] = float((recommended > 0).sum() / n_items) if n_items else 0.0
+    if n_recommended > 0 and popularity.sum() > 0:
+        result['popularity'] = float((recommended @ popularity) / n_recommended / popularity.mean())
+    else:
+        result['popularity'] = 0.0
+    result['n_users'] = int(users.shape[0])
+    result['k'] = k
+    if return_per_user:
+        per_user['user'] = users
+        return result, per_user
+    return result
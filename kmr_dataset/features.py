@@ -0,0 +1,94 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse import vstack
+
+
+available_features = ('genre', 'country', 'actor', 'director')
+
+def _align_rows(matrix, movie_map, movie_ids):
+    """
+    Select the rows of ``matrix`` in the order of ``movie_ids``.
+    The movies which are not in ``movie_map`` become empty rows
+    """
+    index = movie_map.transform(movie_ids).astype(np.int64)
+    # append an empty row for unknown movies
+    empty = csr_matrix((1, matrix.shape[1]), dtype=matrix.dtype)
+    matrix = vstack([matrix, empty], format='csr')
+    index[index < 0] = matrix.shape[0] - 1
+    return matrix[index]
+
+def _actor_weights(meta, leading_weight=1.0, order_decay=1.0, max_order=None):
+    """
+    Weight of each element of ``meta.castings``
+
+        weight = (leading_weight if leading else 1) * order_decay ** (order - 1)
+
+    Unknown credit order (-1) is not decayed
+    """
+    orders = meta.casting_orders.astype(np.float64)
+    weights = np.where(meta.casting_leadings > 0, leading_weight, 1.0)
+    known = orders > 0
+    weights[known] *= np.power(order_decay, orders[known] - 1)
+    if max_order is not None:
+        weights[known & (orders > max_order)] = 0
+    return weights.astype(np.float32)
+
+def item_features(meta, movie_ids, features=('genre', 'country', 'actor'),
+    leading_weight=1.0, order_decay=1.0, max_order=None):
+    """
+    Arguments
+    ---------
+    meta : Meta
+        Metadata from ``load_meta``
+    movie_ids : numpy.ndarray
+        Movie id of each row. Use ``numpy.arange(rates.shape[1])`` for ``load_rates``,
+        and ``movie_map.ids`` for ``load_rates(compact=True)``
+    features : tuple of str
+        Feature names. Choose among ['genre', 'country', 'actor', 'director']
+    leading_weight : float
+        Weight of leading role actors in actor feature
+    order_decay : float
+        Actor feature is multiplied by ``order_decay ** (credit order - 1)``.
+        1.0 means no decay
+    max_order : int or None
+        If not None, actors whose credit order is larger than ``max_order`` are removed
+
+    Returns
+    -------
+    matrices : dict of scipy.sparse.csr_matrix
+        {feature name: (movie, feature) matrix}. The i-th row corresponds ``movie_ids[i]``
+    names : dict of numpy.ndarray
+        {feature name: column names}. Genre and country names, or people ids of actor and director
+
+    Usage
+    -----
+        >>> rates, timestamps = load_rates(size='small')
+        >>> meta = load_meta(size='small')
+        >>> matrices, names = item_features(meta, np.arange(rates.shape[1]))
+        >>> matrices['genre'].shape[0] == rates.shape[1]
+        $ True
+    """
+    unknown = [name for name in features if name not in available_features]
+    if unknown:
+        raise ValueError(f'Unknown features {unknown}. Choose among {available_features}')
+
+    movie_ids = np.asarray(movie_ids)
+    matrices, names = {}, {}
+    for name in features:
+        if name == 'genre':
+            matrix, columns = meta.genres, meta.genre_names
+        elif name == 'country':
+            matrix, columns = meta.countries, meta.country_names
+        elif name == 'actor':
+            castings = meta.castings
+            weights = _actor_weights(meta, leading_weight, order_decay, max_order)
+            matrix = csr_matrix((weights, castings.indices, castings.indptr), shape=castings.shape)
+            matrix.eliminate_zeros()
+            columns = meta.people_map.ids
+        else:
+            if meta.directings.nnz == 0:
+                raise ValueError('director feature requires directings.csv in the data directory')
+            matrix, columns = meta.directings, meta.people_map.ids
+        matrices[name] = _align_rows(matrix, meta.movie_map, movie_ids)
+        names[name] = columns
+    return matrices, names
@@ -0,0 +1,205 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from .idmap import IdMap
+from .split import _row_indices
+
+
+def _apply(rates, timestamps, mask, user_map=None, item_map=None):
+    """
+    Keep the elements of ``mask`` and remove empty rows and columns
+
+    Returns
+    -------
+    rates : scipy.sparse.csr_matrix
+        Re-indexed matrix
+    timestamps : numpy.ndarray
+        Corresponding rates.data
+    user_map : IdMap
+        Map between user identifier and new row index.
+        If input ``user_map`` is given, identifiers are the original identifiers of it.
+        Else, identifiers are the row indices of input ``rates``
+    item_map : IdMap
+        Map between item identifier and new column index
+    """
+    rows = _row_indices(rates)[mask]
+    cols = rates.indices[mask]
+    kept_rows = np.flatnonzero(np.bincount(rows, minlength=rates.shape[0]))
+    kept_cols = np.flatnonzero(np.bincount(cols, minlength=rates.shape[1]))
+    row_index = IdMap(kept_rows).index
+    col_index = IdMap(kept_cols).index
+
+    idx_dtype = rates.indices.dtype
+    indptr = np.zeros(kept_rows.shape[0] + 1, dtype=idx_dtype)
+    np.cumsum(np.bincount(row_index[rows], minlength=kept_rows.shape[0]), out=indptr[1:])
+    # the maps are monotonic, so the indices of each row are still sorted
+    indices = col_index[cols].astype(idx_dtype, copy=False)
+    shape = (kept_rows.shape[0], kept_cols.shape[0])
+    filtered = csr_matrix((rates.data[mask], indices, indptr), shape=shape)
+
+    user_map = user_map.subset(kept_rows) if user_map is not None else IdMap(kept_rows)
+    item_map = item_map.subset(kept_cols) if item_map is not None else IdMap(kept_cols)
+    return filtered, np.asarray(timestamps)[mask], user_map, item_map
+
+def _degree_mask(rates, mask, rows, min_user, min_item, max_user=None):
+    user_count = np.bincount(rows[mask], minlength=rates.shape[0])
+    item_count = np.bincount(rates.indices[mask], minlength=rates.shape[1])
+    keep_user = user_count >= min_user
+    if max_user is not None:
+        keep_user &= user_count <= max_user
+    keep_item = item_count >= min_item
+    return mask & keep_user[rows] & keep_item[rates.indices]
+
+def filter_min_count(rates, timestamps, min_user=1, min_item=1, user_map=None, item_map=None):
+    """
+    Remove the users who rated less than ``min_user`` items and the items which are rated
+    by less than ``min_item`` users, in one pass. Counts are computed on input matrix
+
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, item) = rate
+    timestamps : numpy.ndarray
+        UNIX time, corresponding rates.data
+    min_user : int
+        Minimum number of rates per user
+    min_item : int
+        Minimum number of rates per item
+    user_map : IdMap or None
+        Map of input rows, for example from ``load_rates(compact=True)``
+    item_map : IdMap or None
+        Map of input columns
+
+    Returns
+    -------
+    rates, timestamps, user_map, item_map
+        Re-indexed matrix, its timestamps and maps from identifiers to new indices
+
+    Usage
+    -----
+        >>> from kmr_dataset.filtering import filter_min_count
+        >>> rates, timestamps, user_map, item_map = filter_min_count(rates, timestamps, 5, 5)
+    """
+    rows = _row_indices(rates)
+    mask = np.ones(rates.nnz, dtype=bool)
+    mask = _degree_mask(rates, mask, rows, min_user, min_item)
+    return _apply(rates, timestamps, mask, user_map, item_map)
+
+def k_core(rates, timestamps, k_user=5, k_item=5, max_iter=None, user_map=None, item_map=None):
+    """
+    Iteratively remove the users with less than ``k_user`` rates and the items with less than
+    ``k_item`` rates until every remaining user and item satisfies the condition
+
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, item) = rate
+    timestamps : numpy.ndarray
+        UNIX time, corresponding rates.data
+    k_user : int
+        Minimum number of rates per user
+    k_item : int
+        Minimum number of rates per item
+    max_iter : int or None
+        Maximum number of iterations. If None, iterate until convergence
+    user_map : IdMap or None
+        Map of input rows
+    item_map : IdMap or None
+        Map of input columns
+
+    Returns
+    -------
+    rates, timestamps, user_map, item_map
+        See ``filter_min_count``
+
+    Usage
+    -----
+        >>> from kmr_dataset.filtering import k_core
+        >>> rates, timestamps, user_map, item_map = k_core(rates, timestamps, 10, 10)
+    """
+    rows = _row_indices(rates)
+    mask = np.ones(rates.nnz, dtype=bool)
+    n_iter = 0
+    while max_iter is None or n_iter < max_iter:
+        n_before = int(mask.sum())
+        mask = _degree_mask(rates, mask, rows, k_user, k_item)
+        n_iter += 1
+        if int(mask.sum()) == n_before:
+            break
+    return _apply(rates, timestamps, mask, user_map, item_map)
+
+def filter_heavy_users(rates, timestamps, max_count=None, top_ratio=None, user_map=None, item_map=None):
+    """
+    Remove heavy users
+
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, item) = rate
+    timestamps : numpy.ndarray
+        UNIX time, corresponding rates.data
+    max_count : int or None
+        Remove the users who rated more than ``max_count`` items
+    top_ratio : float or None
+        Remove the top ``top_ratio`` users by the number of rates
+    user_map : IdMap or None
+        Map of input rows
+    item_map : IdMap or None
+        Map of input columns
+
+    Returns
+    -------
+    rates, timestamps, user_map, item_map
+        See ``filter_min_count``
+
+    Usage
+    -----
+        >>> rates, timestamps, user_map, item_map = filter_heavy_users(rates, timestamps, top_ratio=0.01)
+    """
+    counts = np.diff(rates.indptr)
+    keep_user = np.ones(rates.shape[0], dtype=bool)
+    if max_count is not None:
+        keep_user &= counts <= max_count
+    if top_ratio is not None:
+        n_tops = int(top_ratio * np.count_nonzero(counts))
+        if n_tops > 0:
+            # stable order, then the tie is broken by user index
+            tops = np.argsort(-counts, kind='stable')[:n_tops]
+            keep_user[tops] = False
+    mask = keep_user[_row_indices(rates)]
+    return _apply(rates, timestamps, mask, user_map, item_map)
+
+def filter_time_window(rates, timestamps, begin=None, end=None, user_map=None, item_map=None):
+    """
+    Keep the rates of which begin <= time < end. None means unbounded
+
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, item) = rate
+    timestamps : numpy.ndarray
+        UNIX time, corresponding rates.data
+    begin : int or None
+        UNIX time
+    end : int or None
+        UNIX time
+    user_map : IdMap or None
+        Map of input rows
+    item_map : IdMap or None
+        Map of input columns
+
+    Returns
+    -------
+    rates, timestamps, user_map, item_map
+        See ``filter_min_count``
+
+    Usage
+    -----
+        >>> rates, timestamps, user_map, item_map = filter_time_window(rates, timestamps, begin=1483196400)
+    """
+    timestamps = np.asarray(timestamps)
+    mask = np.ones(rates.nnz, dtype=bool)
+    if begin is not None:
+        mask &= timestamps >= begin
+    if end is not None:
+        mask &= timestamps < end
+    return _apply(rates, timestamps, mask, user_map, item_map)
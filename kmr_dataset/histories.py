@@ -0,0 +1,302 @@
+import numpy as np
+from collections.abc import Mapping
+from collections.abc import Sequence
+from .cache import ArrayAppender
+from .cache import load_arrays
+from .cache import save_arrays
+
+
+HISTORY_INDEX_NAMES = ('users', 'indptr', 'movies', 'rates', 'times')
+
+
+class History(Sequence):
+    """
+    Rating history of a user. It is a view of the arrays of ``Histories``
+
+    Attributes
+    ----------
+    movies : numpy.ndarray
+        Movie indices
+    rates : numpy.ndarray
+        Rates
+    times : numpy.ndarray
+        UNIX time
+
+    Usage
+    -----
+        >>> history = histories[0]
+        >>> for movie, rate, time in history:
+        >>>     # do something
+        >>> history.movies
+        $ array([10003, 10004, 10018, ...], dtype=int32)
+    """
+    __slots__ = ('movies', 'rates', 'times')
+
+    def __init__(self, movies, rates, times):
+        self.movies = movies
+        self.rates = rates
+        self.times = times
+
+    def __len__(self):
+        return self.movies.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return History(self.movies[index], self.rates[index], self.times[index])
+        return (int(self.movies[index]), int(self.rates[index]), int(self.times[index]))
+
+    def __iter__(self):
+        return zip(self.movies.tolist(), self.rates.tolist(), self.times.tolist())
+
+    def __eq__(self, other):
+        if isinstance(other, (History, list, tuple)):
+            return len(self) == len(other) and all(a == tuple(b) for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f'History({self.tolist()})'
+
+    def tolist(self):
+        """
+        Returns
+        -------
+        history : list of tuple
+            [(item, rate, time), (item, rate, time), ...]
+        """
+        return list(self)
+
+
+class Histories(Mapping):
+    """
+    Array-backed user histories. It behaves as read-only dict of ``History``
+
+        {
+            user: [(item, rate, time), (item, rate, time), ...],
+            user: [(item, rate, time), (item, rate, time), ...],
+            ...
+        }
+
+    History of ``users[i]`` is stored in ``movies[indptr[i]:indptr[i+1]]``,
+    and so on for ``rates`` and ``times``
+
+    Arguments
+    ---------
+    users : numpy.ndarray
+        Sorted unique user indices
+    indptr : numpy.ndarray
+        Offsets of each user's history. Its length is ``len(users) + 1``
+    movies : numpy.ndarray
+        Movie indices
+    rates : numpy.ndarray
+        Rates
+    times : numpy.ndarray
+        UNIX time
+
+    Usage
+    -----
+        >>> histories = Histories.from_columns(users, movies, rates, times)
+        >>> histories[0]
+        $ History([(10003, 7, 1494128040), (10004, 7, 1467529800), ...])
+        >>> for user, history in histories.items():
+        >>>     # do something
+    """
+    def __init__(self, users, indptr, movies, rates, times):
+        self.users = users
+        self.indptr = indptr
+        self.movies = movies
+        self.rates = rates
+        self.times = times
+        n_users = users.shape[0]
+        # user indices are usually 0, 1, ..., n-1. Then searching can be skipped
+        self._contiguous = (n_users == 0) or (users[0] == 0 and users[-1] == n_users - 1)
+
+    @classmethod
+    def from_columns(cls, users, movies, rates, times):
+        """
+        Arguments
+        ---------
+        users, movies, rates, times : numpy.ndarray
+            Column arrays of rates file. The order of rows in each user is kept
+
+        Returns
+        -------
+        histories : Histories
+        """
+        if users.shape[0] > 1 and np.any(users[1:] < users[:-1]):
+            order = np.argsort(users, kind='stable')
+            users, movies, rates, times = users[order], movies[order], rates[order], times[order]
+        unique_users, counts = np.unique(users, return_counts=True)
+        indptr = np.zeros(unique_users.shape[0] + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(unique_users, indptr, movies, rates, times)
+
+    def _position(self, user):
+        try:
+            user = int(user)
+        except (TypeError, ValueError):
+            return -1
+        if self._contiguous:
+            return user if 0 <= user < self.users.shape[0] else -1
+        i = np.searchsorted(self.users, user)
+        if i < self.users.shape[0] and self.users[i] == user:
+            return int(i)
+        return -1
+
+    def __getitem__(self, user):
+        i = self._position(user)
+        if i < 0:
+            raise KeyError(user)
+        b, e = self.indptr[i], self.indptr[i + 1]
+        return History(self.movies[b:e], self.rates[b:e], self.times[b:e])
+
+    def __contains__(self, user):
+        return self._position(user) >= 0
+
+    def __iter__(self):
+        return iter(self.users.tolist())
+
+    def __len__(self):
+        return self.users.shape[0]
+
+    def __repr__(self):
+        return f'Histories(#users={len(self)}, #rates={self.movies.shape[0]})'
+
+    @property
+    def nbytes(self):
+        """
+        Memory usage of arrays in bytes
+        """
+        arrays = (self.users, self.indptr, self.movies, self.rates, self.times)
+        return sum(array.nbytes for array in arrays)
+
+    def to_dict(self):
+        """
+        Returns
+        -------
+        histories : dict of list of tuple
+            Same format with previous ``load_histories``
+        """
+        return {user: history.tolist() for user, history in self.items()}
+
+
+class HistoryIndex(Histories):
+    """
+    On-disk user history index. The arrays of ``Histories`` are stored as `.npy` files
+    and are loaded as ``numpy.memmap``, therefore a lookup reads only the rows of the user
+    and memory usage does not depend on the size of dataset.
+
+    It is built in one pass over the blocks of rates file sorted by user,
+    which the builder writes. See ``load_history_index``
+
+    Usage
+    -----
+        >>> index = HistoryIndex.open(entry)
+        >>> index.get(0)
+        $ History([(10003, 7, 1494128040), (10004, 7, 1467529800), ...])
+        >>> index.get_many([0, 5, 7])
+        $ [History([...]), None, History([...])]
+    """
+    @classmethod
+    def open(cls, entry):
+        """
+        Returns
+        -------
+        index : HistoryIndex or None
+            It returns None if the index is not stored in ``entry``
+        """
+        arrays = load_arrays(entry, HISTORY_INDEX_NAMES, mmap_mode='r')
+        if arrays is None:
+            return None
+        # plain ndarray views of the memory maps are sliced faster than numpy.memmap
+        return cls(*[np.asarray(array) for array in arrays])
+
+    @classmethod
+    def build(cls, blocks, entry):
+        """
+        Arguments
+        ---------
+        blocks : iterable of tuple
+            (users, movies, rates, times) column arrays of rates file in file order
+        entry : str
+            Directory to store the index
+
+        Returns
+        -------
+        index : HistoryIndex or None
+            It returns None if the rows are not sorted by user
+        """
+        appenders = [ArrayAppender(entry, name, dtype) for name, dtype
+                     in zip(HISTORY_INDEX_NAMES[2:], (np.int32, np.int32, np.int64))]
+        run_users, run_counts = [], []
+        last = None
+        for users, movies, rates, times in blocks:
+            n = users.shape[0]
+            if n == 0:
+                continue
+            if (last is not None and users[0] < last) or np.any(users[1:] < users[:-1]):
+                for appender in appenders:
+                    appender.discard()
+                return None
+            last = users[-1]
+            starts = np.concatenate([[0], np.flatnonzero(users[1:] != users[:-1]) + 1])
+            run_users.append(users[starts])
+            run_counts.append(np.diff(np.append(starts, n)))
+            for appender, values in zip(appenders, (movies, rates, times)):
+                appender.append(values)
+        for appender in appenders:
+            appender.close()
+
+        # a user may continue over the boundary of blocks
+        users = np.concatenate(run_users) if run_users else np.zeros(0, dtype=np.int32)
+        counts = np.concatenate(run_counts) if run_counts else np.zeros(0, dtype=np.int64)
+        unique_users, inverse = np.unique(users, return_inverse=True)
+        indptr = np.zeros(unique_users.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(inverse, weights=counts, minlength=unique_users.shape[0]).astype(np.int64),
+                  out=indptr[1:])
+        # indptr is stored at last, so the index exists only when it is completely built
+        save_arrays(entry, {'users': unique_users, 'indptr': indptr})
+        return cls.open(entry)
+
+    def arrays(self):
+        """
+        Returns
+        -------
+        arrays : dict of numpy.ndarray
+            Index arrays to store
+        """
+        return {name: getattr(self, name) for name in HISTORY_INDEX_NAMES}
+
+    def _positions(self, users):
+        users = np.asarray(users, dtype=np.int64)
+        n_users = self.users.shape[0]
+        if self._contiguous:
+            return np.where((users >= 0) & (users < n_users), users, -1)
+        positions = np.minimum(np.searchsorted(self.users, users), max(n_users - 1, 0))
+        found = (n_users > 0) & (self.users[positions] == users)
+        return np.where(found, positions, -1)
+
+    def get_many(self, users):
+        """
+        Arguments
+        ---------
+        users : list of int
+            User indices
+
+        Returns
+        -------
+        histories : list of History
+            History of each user. None if the user does not exist
+        """
+        positions = self._positions(users).tolist()
+        indptr = self.indptr
+        histories = []
+        for i in positions:
+            if i < 0:
+                histories.append(None)
+                continue
+            b, e = indptr[i], indptr[i + 1]
+            histories.append(History(self.movies[b:e], self.rates[b:e], self.times[b:e]))
+        return histories
+
+    def __repr__(self):
+        return f'HistoryIndex(#users={len(self)}, #rates={self.movies.shape[0]})'
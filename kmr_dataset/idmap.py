@@ -0,0 +1,94 @@
+import numpy as np
+
+
+class IdMap:
+    """
+    Mapping between original identifiers and dense indices 0, 1, ..., n-1
+
+    Arguments
+    ---------
+    ids : numpy.ndarray
+        Sorted unique original identifiers. ``ids[index]`` is the original identifier
+
+    Attributes
+    ----------
+    ids : numpy.ndarray
+        Inverse map, index -> original identifier
+    index : numpy.ndarray
+        Forward map, original identifier -> index. -1 if the identifier is not included
+
+    Usage
+    -----
+        >>> rates, timestamps, user_map, movie_map = load_rates(size='small', compact=True)
+        >>> movie_map.ids[:3]
+        $ array([10001, 10002, 10003], dtype=int32)
+        >>> movie_map.transform([10003, 10001])
+        $ array([2, 0])
+        >>> movie_map.inverse_transform([2, 0])
+        $ array([10003, 10001], dtype=int32)
+    """
+    def __init__(self, ids):
+        self.ids = np.asarray(ids)
+        n_index = int(self.ids.max()) + 1 if self.ids.shape[0] else 0
+        index_dtype = np.int32 if self.ids.shape[0] <= np.iinfo(np.int32).max else np.int64
+        self.index = np.full(n_index, -1, dtype=index_dtype)
+        self.index[self.ids] = np.arange(self.ids.shape[0], dtype=index_dtype)
+
+    @classmethod
+    def from_values(cls, values):
+        """
+        Make IdMap of unique values
+        """
+        return cls(np.unique(np.asarray(values)))
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    def __repr__(self):
+        return f'IdMap(n={len(self)})'
+
+    def transform(self, ids):
+        """
+        Arguments
+        ---------
+        ids : array-like of int
+            Original identifiers
+
+        Returns
+        -------
+        indices : numpy.ndarray
+            Dense indices. -1 for unknown identifiers
+        """
+        ids = np.asarray(ids)
+        known = (ids >= 0) & (ids < self.index.shape[0])
+        indices = np.full(ids.shape, -1, dtype=self.index.dtype)
+        indices[known] = self.index[ids[known]]
+        return indices
+
+    def inverse_transform(self, indices):
+        """
+        Arguments
+        ---------
+        indices : array-like of int
+            Dense indices
+
+        Returns
+        -------
+        ids : numpy.ndarray
+            Original identifiers
+        """
+        return self.ids[np.asarray(indices)]
+
+    def subset(self, indices):
+        """
+        Arguments
+        ---------
+        indices : array-like of int
+            Sorted dense indices to keep
+
+        Returns
+        -------
+        idmap : IdMap
+            Mapping between original identifiers of kept indices and new dense indices
+        """
+        return IdMap(self.ids[np.asarray(indices)])
@@ -1,60 +1,232 @@
 import os
+import shutil
+import threading
 import zipfile
 
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
 
 installpath = os.path.abspath(os.path.dirname(__file__))
 patch_urls = {}
 
-def _check_install(paths, size):
+def _get_extract_dir(extract_dir=None):
+    if extract_dir is None:
+        extract_dir = os.environ.get('KMRD_EXTRACT_DIR', None)
+    if extract_dir is None:
+        return None
+    return os.path.abspath(os.path.expanduser(extract_dir))
+
+def _archive_of(path):
+    """
+    Returns zip archive path which includes the data file.
+    `rates-{size}.csv` is in `rates-{size}.zip`, and the others are in `meta.zip`
+    """
+    dirname, name = os.path.split(path)
+    stem = os.path.splitext(name)[0]
+    if stem.startswith('rates'):
+        return f'{dirname}/{stem}.zip'
+    return f'{dirname}/meta.zip'
+
+def _find_member(archive, name):
+    with zipfile.ZipFile(archive) as zf:
+        for member in zf.namelist():
+            if member.split('/')[-1] == name:
+                return member
+    raise ValueError(f'Reinstall KMRD package. {name} is not found in {archive}')
+
+def _check_install(paths, size, extract=True, extract_dir=None):
+    """
+    Arguments
+    ---------
+    paths : list of str
+        Data file paths
+    size : str
+        Dataset size
+    extract : Boolean
+        If True, extract the files which are not found from zip archives.
+        Else, only check that the files or their zip archives exist
+    extract_dir : str or None
+        Directory to extract. If None, use environment variable ``KMRD_EXTRACT_DIR``.
+        If it is not set, extract next to the zip archives
+
+    Returns
+    -------
+    paths : list of str
+        Paths of the data files. If the file is extracted to ``extract_dir``,
+        or it has already been extracted there, that path is returned
+    """
     if size == 'small':
         for path in paths:
             if not os.path.exists(path):
                 name = path.split("/")[-1]
                 raise ValueError(f'Reinstall KMRD package. {name} is not found')
-        return True
+        return paths
 
-    metazip_path = f'{installpath}/datafile/kmrd/meta.zip'
-    ratezip_path = f'{installpath}/datafile/kmrd/rates-{size}.zip'
+    extract_dir = _get_extract_dir(extract_dir)
+    resolved = []
     for path in paths:
-        if not os.path.exists(path):
-            if path.split('/')[-1][:5] == 'rates':
-                if not os.path.exists(metazip_path):
-                    raise ValueError(f'Reinstall KMRD package. meta.zip is not found')
-                unzip(ratezip_path, f'{installpath}/datafile/kmrd/')
-                print(f'Unzipped rates-{size}.zip')
-            else:
-                if not os.path.exists(ratezip_path):
-                    raise ValueError(f'Reinstall KMRD package. rates-{size}.zip is not found')
-                unzip(metazip_path, f'{installpath}/datafile/kmrd/')
-                print('Unzipped meta.zip')
+        dirname, name = os.path.split(path)
+        extracted = f'{extract_dir}/{name}' if extract_dir is not None else path
+        if os.path.exists(path) or os.path.exists(extracted):
+            resolved.append(path if os.path.exists(path) else extracted)
+            continue
+        archive = _archive_of(path)
+        if not os.path.exists(archive):
+            raise ValueError(f'Reinstall KMRD package. {os.path.basename(archive)} is not found')
+        if not extract:
+            resolved.append(path)
+            continue
+        n_extracted = unzip(archive, os.path.dirname(extracted))
+        if not os.path.exists(extracted):
+            raise ValueError(f'Reinstall KMRD package. {name} is not found in {os.path.basename(archive)}')
+        # the processes which waited for the other process do not extract anything
+        if n_extracted > 0:
+            print(f'Unzipped {os.path.basename(archive)}')
+        resolved.append(extracted)
+    return resolved
+
+def open_datafile(path):
+    """
+    Arguments
+    ---------
+    path : str
+        Data file path. If the file is not extracted yet,
+        the member of zip archive is read directly without extracting
+
+    Returns
+    -------
+    f : file object
+        Binary mode readable file object
+
+    Usage
+    -----
+        >>> with open_datafile('datafile/kmrd/rates-5m.csv') as f:
+        >>>     header = f.readline()
+    """
+    if os.path.exists(path):
+        return open(path, 'rb')
+    archive = _archive_of(path)
+    if not os.path.exists(archive):
+        name = path.split('/')[-1]
+        raise ValueError(f'Reinstall KMRD package. {name} is not found')
+    member = _find_member(archive, os.path.basename(path))
+    # the archive is closed when the member file object is closed
+    with zipfile.ZipFile(archive) as zf:
+        return zf.open(member)
+
+def exists_datafile(path):
+    """
+    Returns True if the data file is extracted or it is included in its zip archive
+    """
+    if os.path.exists(path):
+        return True
+    archive = _archive_of(path)
+    if not os.path.exists(archive):
+        return False
+    try:
+        _find_member(archive, os.path.basename(path))
+    except ValueError:
+        return False
     return True
 
+def source_of(path):
+    """
+    Returns the existing file which contains the data: the data file itself or its zip archive
+    """
+    if os.path.exists(path):
+        return path
+    return _archive_of(path)
+
+class _FileLock:
+    """
+    Inter-process exclusive lock on ``path``. It also excludes the other threads
+    because each acquisition opens its own file description
+    """
+    def __init__(self, path):
+        self.path = path
+        self._f = None
+
+    def __enter__(self):
+        self._f = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._f.fileno(), fcntl.LOCK_EX)
+        else:
+            self._f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        return self
+
+    def __exit__(self, *args):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._f.fileno(), fcntl.LOCK_UN)
+            else:
+                self._f.seek(0)
+                msvcrt.locking(self._f.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._f.close()
+            self._f = None
+
+def _member_target(destination, member):
+    parts = [part for part in member.replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or '..' in parts or os.path.isabs(member):
+        raise ValueError(f'Unsafe member path {member} in zip archive')
+    return os.path.join(destination, *parts)
+
 def unzip(source, destination):
     """
+    Extract all files of zip archive. It is safe when several threads or processes
+    extract the same archive at the same time. Only one of them extracts the files
+    and the others wait and reuse the result. Each file is written to temporal file
+    first and renamed atomically, so a half-written file is never visible.
+
     Arguments
     ---------
     source : str
         zip file address. It doesn't matter absolute path or relative path
     destination :
         Directory path of unzip
+
     Returns
     -------
-    flag : Boolean
-        It return True if downloading success else return False
+    n_extracted : int
+        Number of files extracted by this call. It is 0 if all files have already been
+        extracted, for example by the other process. It raises an exception if extracting fails
     """
 
-    abspath = os.path.abspath(destination)
-    dirname = os.path.dirname(abspath)
-    if not os.path.exists(dirname):
-        os.makedirs(dirname)
+    destination = os.path.abspath(destination)
+    os.makedirs(destination, exist_ok=True)
 
-    try:
-        downloaded = zipfile.ZipFile(source)
-        downloaded.extractall(destination)
-        return True
-    except Exception as e:
-        print(e)
-        return False
+    name = os.path.basename(source)
+    n_extracted = 0
+    with _FileLock(f'{destination}/.{name}.lock'):
+        with zipfile.ZipFile(source) as zf:
+            members = [info for info in zf.infolist() if not info.is_dir()]
+            for info in members:
+                target = _member_target(destination, info.filename)
+                # extracted by the other process
+                if os.path.exists(target) and os.path.getsize(target) == info.file_size:
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                tmp = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+                try:
+                    with zf.open(info) as src, open(tmp, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, 1 << 20)
+                    os.replace(tmp, target)
+                    n_extracted += 1
+                finally:
+                    if os.path.exists(tmp):
+                        os.remove(tmp)
+    return n_extracted
 
 def download_a_file(url, fname):
     """
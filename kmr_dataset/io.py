@@ -1,12 +1,31 @@
 import os
+import warnings
 import numpy as np
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
 from glob import glob
 from scipy.sparse import csr_matrix
+from .blocks import _iter_blocks
+from .cache import load_arrays
+from .cache import open_entry
+from .cache import save_arrays
+from .features import item_features
+from .histories import Histories
+from .histories import HistoryIndex
+from .idmap import IdMap
+from .meta import Meta
+from .meta import parse_meta
+from .texts import TextStore
 from .install import _check_install
+from .install import exists_datafile
+from .install import open_datafile
+from .install import source_of
 
 
 installpath = os.path.abspath(os.path.dirname(__file__))
+RATE_DTYPE = np.dtype([('user', np.int32), ('movie', np.int32), ('rate', np.int32), ('time', np.int64)])
 
 def _check_size(size, force=False):
     if force:
@@ -39,7 +58,7 @@ def _get_paths_large(directory, size):
     return paths
 
 
-def get_paths(directory=None, size='small', force=False):
+def get_paths(directory=None, size='small', force=False, extract_dir=None):
     """
     Arguments
     ---------
@@ -50,6 +69,10 @@ def get_paths(directory=None, size='small', force=False):
         Or you can set ``force`` as True if you have same formed dataset
     force : Boolean
         If you have same fomed dataset, set ``directory`` and ``force=True``
+    extract_dir : str or None
+        Directory where the files of zip archives are extracted.
+        If None, use environment variable ``KMRD_EXTRACT_DIR``.
+        If it is not set, extract next to the zip archives
 
     Returns
     -------
@@ -71,10 +94,12 @@ def get_paths(directory=None, size='small', force=False):
     else:
         paths = _get_paths_large(directory, size)
 
-    _check_install(paths, size)
-    return paths
+    return _check_install(paths, size, extract_dir=extract_dir)
+
+def _is_parallel(n_jobs):
+    return n_jobs is not None and (n_jobs > 1 or n_jobs < 0)
 
-def _prepare_rate_loader(directory, size):
+def _prepare_rate_loader(directory, size, extract_dir=None, extract=False):
     _check_size(size)
 
     directory = _initialize_dir(directory, size)
@@ -83,14 +108,445 @@ def _prepare_rate_loader(directory, size):
     else:
         path = f'{directory}/rates-{size}.csv'
 
-    _check_install([path], size)
-
     def parser(line):
         return [int(col) for col in line.strip().split(',')]
 
+    # binary columnar rates made by the builder is preferred to text file
+    columnar_path = _columnar_path(path)
+    if columnar_path is not None:
+        return columnar_path, parser
+
+    # the loaders read the rates directly from zip archive if it is not extracted.
+    # parallel parsing requires extracted file, so it is extracted if ``extract`` is True
+    if extract:
+        try:
+            return _check_install([path], size, extract=True, extract_dir=extract_dir)[0], parser
+        except OSError as e:
+            warnings.warn(f'Failed to extract {os.path.basename(path)}: {e}. It is parsed from zip archive with one process')
+    path = _check_install([path], size, extract=False, extract_dir=extract_dir)[0]
     return path, parser
 
-def load_rates(directory=None, size='small'):
+def _columnar_path(path):
+    """
+    Binary columnar rates file, `rates-{size}.npz` next to `rates-{size}.csv`.
+    Returns None if it does not exist or it is older than the text file (or its zip archive)
+    """
+    columnar_path = f'{os.path.splitext(path)[0]}.npz'
+    if not os.path.exists(columnar_path):
+        return None
+    source = source_of(path)
+    if os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(columnar_path):
+        return None
+    return columnar_path
+
+def _read_rate_npz(path):
+    """
+    Read (users, movies, rates, timestamps) column arrays from npz file
+    of which keys are `user`, `movie`, `rate` and `time`
+    """
+    with np.load(path) as arrays:
+        missing = [name for name in RATE_DTYPE.names if name not in arrays.files]
+        if missing:
+            raise ValueError(f'{path} does not have columns {missing}')
+        return tuple(arrays[name].astype(RATE_DTYPE[name], copy=False) for name in RATE_DTYPE.names)
+
+def _parse_rate_block(block):
+    """
+    Arguments
+    ---------
+    block : bytes
+        Lines of `user,movie,rate,time` rows without header.
+        All columns must be non-negative integer
+
+    Returns
+    -------
+    users : numpy.ndarray
+        int32 array
+    movies : numpy.ndarray
+        int32 array
+    rates : numpy.ndarray
+        int32 array
+    timestamps : numpy.ndarray
+        int64 array
+    """
+    buf = np.frombuffer(block, dtype=np.uint8)
+    if b'\r' in block:
+        buf = buf[buf != ord('\r')]
+    # trim tailing newlines and close the last line
+    nz = np.flatnonzero(buf != ord('\n'))
+    if nz.shape[0] == 0:
+        empty = np.zeros(0, dtype=np.int32)
+        return empty, empty, empty, np.zeros(0, dtype=np.int64)
+    buf = np.append(buf[:nz[-1] + 1], np.uint8(ord('\n')))
+
+    is_sep = (buf == ord(',')) | (buf == ord('\n'))
+    ends = np.flatnonzero(is_sep)
+    n_fields = ends.shape[0]
+    if n_fields % 4 != 0:
+        raise ValueError(f'Rate rows must have 4 columns, but found {n_fields} values')
+
+    digits = buf - np.uint8(ord('0'))
+    if np.any((digits > 9) & ~is_sep):
+        raise ValueError('Rate rows must consist of non-negative integers')
+
+    # accumulate each column from its last digit, one digit position at a time
+    ends = ends.reshape(-1, 4)
+    starts = np.empty_like(ends)
+    starts.flat[0] = 0
+    starts.flat[1:] = ends.flat[:-1] + 1
+    lengths = ends - starts
+    if lengths.min() == 0:
+        raise ValueError('Rate rows must not have empty value')
+    # int64 holds 18 digits without overflow
+    if lengths.max() > 18:
+        raise ValueError('Rate values must be less than 10^18')
+    values = np.zeros(ends.shape, dtype=np.int64)
+    for col in range(4):
+        end, length, value = ends[:, col], lengths[:, col], values[:, col]
+        for k in range(int(length.max())):
+            digit = digits[np.maximum(end - k - 1, 0)].astype(np.int64)
+            digit[length <= k] = 0
+            value += digit * 10 ** k
+
+    int32_max = np.iinfo(np.int32).max
+    if values[:, :3].max() > int32_max:
+        raise ValueError(f'user, movie and rate must be less than or equal to {int32_max}')
+    users = values[:, 0].astype(np.int32)
+    movies = values[:, 1].astype(np.int32)
+    rates = values[:, 2].astype(np.int32)
+    timestamps = values[:, 3].copy()
+    return users, movies, rates, timestamps
+
+def _read_rate_columns(path, block_size=1 << 22, n_jobs=1):
+    """
+    Parse rates file into (users, movies, rates, timestamps) column arrays.
+    If rates file is not extracted, parse it from zip archive directly.
+    If ``n_jobs`` > 1 and rates file is extracted, parse it with multi-processes
+    """
+    if n_jobs is not None and n_jobs < 0:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs is not None and n_jobs > 1 and os.path.isfile(path):
+        return _read_rate_columns_parallel(path, n_jobs, block_size)
+
+    columns = ([], [], [], [])
+    with open_datafile(path) as f:
+        # skip head: user,movie,rate,time
+        f.readline()
+        for block in _iter_blocks(f, block_size):
+            for column, values in zip(columns, _parse_rate_block(block)):
+                column.append(values)
+    return _concatenate_columns(columns)
+
+def _concatenate_columns(columns):
+    dtypes = (np.int32, np.int32, np.int32, np.int64)
+    return tuple(
+        np.concatenate(column) if column else np.zeros(0, dtype=dtype)
+        for column, dtype in zip(columns, dtypes)
+    )
+
+def _line_aligned_ranges(path, n_ranges):
+    """
+    Split rates file except header into ``n_ranges`` byte ranges which begin at line start
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        f.readline()
+        begin = f.tell()
+        boundaries = [begin]
+        for k in range(1, n_ranges):
+            f.seek(max(begin + k * (size - begin) // n_ranges - 1, boundaries[-1]))
+            f.readline()
+            boundaries.append(min(f.tell(), size))
+    boundaries.append(size)
+    return [(b, e) for b, e in zip(boundaries, boundaries[1:]) if b < e]
+
+def _parse_rate_range(path, begin, end, block_size):
+    """
+    Worker of parallel parsing. It parses rates[begin:end] and returns the columns
+    through shared memory to avoid pickling them
+
+    Returns
+    -------
+    name : str or None
+        Shared memory name. Main process must unlink it
+    n_rows : int
+        Number of parsed rows
+    """
+    columns = ([], [], [], [])
+    with open(path, 'rb') as f:
+        f.seek(begin)
+        for block in _iter_blocks(f, block_size, end - begin):
+            for column, values in zip(columns, _parse_rate_block(block)):
+                column.append(values)
+    columns = _concatenate_columns(columns)
+    n_rows = columns[0].shape[0]
+    if n_rows == 0:
+        return None, 0
+
+    shm = shared_memory.SharedMemory(create=True, size=sum(column.nbytes for column in columns))
+    offset = 0
+    for column in columns:
+        np.ndarray(column.shape, dtype=column.dtype, buffer=shm.buf, offset=offset)[:] = column
+        offset += column.nbytes
+    name = shm.name
+    shm.close()
+    return name, n_rows
+
+def _unlink_shared_memory(name):
+    shm = shared_memory.SharedMemory(name=name)
+    shm.close()
+    shm.unlink()
+
+def _read_rate_columns_parallel(path, n_jobs, block_size=1 << 22):
+    ranges = _line_aligned_ranges(path, n_jobs)
+    if not ranges:
+        # header only
+        return _concatenate_columns(([], [], [], []))
+    # workers share the resource tracker of main process, which unlinks the shared memories
+    resource_tracker.ensure_running()
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(ranges))) as executor:
+        futures = [executor.submit(_parse_rate_range, path, b, e, block_size) for b, e in ranges]
+        wait(futures)
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        # release the shared memories of the succeeded workers
+        for future in futures:
+            if future.exception() is None and future.result()[0] is not None:
+                _unlink_shared_memory(future.result()[0])
+        raise errors[0]
+    results = [future.result() for future in futures]
+
+    # merge in the order of byte ranges, then the row order is same with file order
+    n_total = sum(n_rows for _, n_rows in results)
+    dtypes = (np.int32, np.int32, np.int32, np.int64)
+    columns = tuple(np.empty(n_total, dtype=dtype) for dtype in dtypes)
+    begin = 0
+    for name, n_rows in results:
+        if name is None:
+            continue
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            offset = 0
+            for column, dtype in zip(columns, dtypes):
+                column[begin: begin + n_rows] = np.ndarray((n_rows,), dtype=dtype, buffer=shm.buf, offset=offset)
+                offset += n_rows * np.dtype(dtype).itemsize
+        finally:
+            shm.close()
+            shm.unlink()
+        begin += n_rows
+    return columns
+
+def _load_rate_columns(path, cache=True, cache_dir=None, n_jobs=1):
+    """
+    Load (users, movies, rates, timestamps) column arrays in file order.
+    If ``cache`` is True, they are loaded from or stored to binary cache
+    """
+    if path.endswith('.npz'):
+        return _read_rate_npz(path)
+    names = ('users', 'movies', 'rates', 'timestamps')
+    entry = open_entry(source_of(path), cache_dir) if cache else None
+    columns = load_arrays(entry, names)
+    if columns is None:
+        columns = _read_rate_columns(path, n_jobs=n_jobs)
+        save_arrays(entry, dict(zip(names, columns)))
+    return tuple(columns)
+
+def _rate_filter_mask(users, movies, timestamps, user_set=None, movie_set=None, time_range=None):
+    mask = np.ones(users.shape[0], dtype=bool)
+    if user_set is not None:
+        mask &= np.isin(users, user_set)
+    if movie_set is not None:
+        mask &= np.isin(movies, movie_set)
+    if time_range is not None:
+        begin, end = time_range
+        if begin is not None:
+            mask &= timestamps >= begin
+        if end is not None:
+            mask &= timestamps < end
+    return mask
+
+def iter_rates(directory=None, size='small', chunksize=100000,
+    users=None, movies=None, time_range=None, block_size=1 << 22, extract_dir=None):
+    """
+    Arguments
+    ---------
+    directory : str or None
+        Data directory. If None, use default directory
+    size : str
+        Dataset size, Choice one of ['small', '2m', '5m']
+    chunksize : int
+        Number of rows in a batch. The last batch may be smaller
+    users : iterable of int or None
+        If not None, yield only the rates of these users
+    movies : iterable of int or None
+        If not None, yield only the rates of these movies
+    time_range : tuple of int or None
+        (begin, end) UNIX time. Yield only the rates where begin <= time < end.
+        None of either side means unbounded
+    block_size : int
+        Number of bytes read from file at once
+    extract_dir : str or None
+        Directory where zip archives are extracted. See ``get_paths``
+
+    Yields
+    ------
+    batch : numpy.ndarray
+        Record array of which fields are `user`, `movie`, `rate` and `time`.
+        Rows are in file order and duplicated (user, movie) rows are not removed
+
+    Usage
+    -----
+        >>> from kmr_dataset import iter_rates
+        >>> for batch in iter_rates(size='5m', chunksize=100000):
+        >>>     batch['user'], batch['movie'], batch['rate'], batch['time']
+
+        >>> from datetime import datetime
+        >>> begin = datetime(2018, 1, 1).timestamp()
+        >>> for batch in iter_rates(size='5m', time_range=(begin, None)):
+        >>>     # do something
+    """
+    if chunksize <= 0:
+        raise ValueError(f'chunksize must be positive integer, but {chunksize}')
+
+    path, _ = _prepare_rate_loader(directory, size, extract_dir)
+    user_set = None if users is None else np.unique(np.asarray(list(users), dtype=np.int64))
+    movie_set = None if movies is None else np.unique(np.asarray(list(movies), dtype=np.int64))
+
+    buffer = []
+    n_buffered = 0
+    for columns in _iter_column_blocks(path, block_size):
+        mask = _rate_filter_mask(*columns[:2], columns[3], user_set, movie_set, time_range)
+        records = np.empty(int(mask.sum()), dtype=RATE_DTYPE)
+        for name, column in zip(RATE_DTYPE.names, columns):
+            records[name] = column[mask]
+        buffer.append(records)
+        n_buffered += records.shape[0]
+        if n_buffered < chunksize:
+            continue
+        records = np.concatenate(buffer)
+        n_batches = records.shape[0] // chunksize
+        for i in range(n_batches):
+            yield records[i * chunksize: (i + 1) * chunksize]
+        buffer = [records[n_batches * chunksize:].copy()]
+        n_buffered = buffer[0].shape[0]
+    if n_buffered > 0:
+        yield np.concatenate(buffer)
+
+def _iter_column_blocks(path, block_size):
+    """
+    Yield (users, movies, rates, timestamps) column arrays of about ``block_size`` bytes of file
+    """
+    if path.endswith('.npz'):
+        columns = _read_rate_npz(path)
+        n_rows = max(1, block_size // RATE_DTYPE.itemsize)
+        for begin in range(0, columns[0].shape[0], n_rows):
+            yield tuple(column[begin: begin + n_rows] for column in columns)
+        return
+    with open_datafile(path) as f:
+        # skip head: user,movie,rate,time
+        f.readline()
+        for block in _iter_blocks(f, block_size):
+            yield _parse_rate_block(block)
+
+def _deduplicate(users, movies, timestamps, keep='first'):
+    """
+    Arguments
+    ---------
+    users : numpy.ndarray
+        User index of each row
+    movies : numpy.ndarray
+        Movie index of each row
+    timestamps : numpy.ndarray
+        UNIX time of each row
+    keep : str
+        Which row to keep among the duplicated (user, movie) rows.
+        Choose one of ['first', 'last', 'latest']
+
+            - first : first occurrence in file order
+            - last : last occurrence in file order
+            - latest : the row with the largest timestamp.
+                       If tied, the last occurrence in file order
+
+    Returns
+    -------
+    index : numpy.ndarray
+        Row index of the kept rows, sorted by (user, movie)
+    n_duplicates : int
+        Number of dropped rows
+    """
+    available_keep = 'first last latest'.split()
+    if keep not in available_keep:
+        raise ValueError(f'keep must be one of {available_keep}')
+
+    n_rows = users.shape[0]
+    if n_rows == 0:
+        return np.zeros(0, dtype=np.int64), 0
+
+    # encode (user, movie) into one 64-bit key which has the same order with (user, movie)
+    keys = users.astype(np.int64) << 32
+    keys |= movies.astype(np.int64)
+
+    if keep == 'latest':
+        order = np.lexsort((timestamps, keys))
+    elif np.all(keys[1:] >= keys[:-1]):
+        # rates files are sorted by (user, movie), so sorting can be skipped
+        order = np.arange(n_rows)
+    else:
+        order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+
+    boundary = keys[1:] != keys[:-1]
+    del keys
+    if keep == 'first':
+        is_kept = np.concatenate([[True], boundary])
+    else:
+        is_kept = np.concatenate([boundary, [True]])
+    index = order[is_kept]
+    return index, n_rows - index.shape[0]
+
+def _to_csr(users, movies, rates, timestamps, shape=None):
+    """
+    Build csr_matrix directly from column arrays.
+    Rows must be sorted by (user, movie) and (user, movie) must be unique.
+    Returned timestamps are aligned with ``rates.data``
+    """
+    if shape is None:
+        n_rows = int(users.max()) + 1 if users.shape[0] else 0
+        n_cols = int(movies.max()) + 1 if movies.shape[0] else 0
+        shape = (n_rows, n_cols)
+    # indptr and indices must have same dtype, otherwise scipy copies them
+    int32_max = np.iinfo(np.int32).max
+    idx_dtype = np.int32 if max(users.shape[0], shape[1]) <= int32_max else np.int64
+    indptr = np.zeros(shape[0] + 1, dtype=idx_dtype)
+    np.cumsum(np.bincount(users, minlength=shape[0]), out=indptr[1:])
+    rates = csr_matrix((rates, movies.astype(idx_dtype, copy=False), indptr), shape=shape)
+    return rates, timestamps
+
+def _compact_csr(rates):
+    """
+    Remove empty rows and columns of csr_matrix
+
+    Returns
+    -------
+    rates : scipy.sparse.csr_matrix
+        Compacted matrix. Its ``data`` is same object with the input
+    row_map : IdMap
+        Map of row indices
+    col_map : IdMap
+        Map of column indices
+    """
+    counts = np.diff(rates.indptr)
+    row_map = IdMap(np.flatnonzero(counts).astype(np.int32))
+    col_map = IdMap(np.flatnonzero(np.bincount(rates.indices, minlength=rates.shape[1])).astype(np.int32))
+    indptr = np.concatenate([rates.indptr[:1], rates.indptr[1:][counts > 0]])
+    # the map is monotonic, so the indices of each row are still sorted
+    indices = col_map.index[rates.indices].astype(rates.indices.dtype, copy=False)
+    shape = (len(row_map), len(col_map))
+    rates = csr_matrix((rates.data, indices, indptr), shape=shape, copy=False)
+    return rates, row_map, col_map
+
+def load_rates(directory=None, size='small', keep='first', return_n_duplicates=False,
+    cache=True, cache_dir=None, mmap=False, n_jobs=1, compact=False, extract_dir=None):
     """
     Arguments
     ---------
@@ -98,6 +554,37 @@ def load_rates(directory=None, size='small'):
         Data directory. If None, use default directory
     size : str
         Dataset size, Choice one of ['small']
+    keep : str
+        Which rate to keep when a user rated same movie several times.
+        Choose one of ['first', 'last', 'latest']. Default is 'first'
+
+            - first : first occurrence in file order
+            - last : last occurrence in file order
+            - latest : the rate with the largest timestamp
+    return_n_duplicates : Boolean
+        If True, return the number of dropped duplicated (user, movie) rows
+    cache : Boolean
+        If True, the parsed rates are stored as binary cache at the first loading,
+        and are loaded from the cache after then.
+        The cache is invalidated when the size, mtime and hash of rates file are changed
+    cache_dir : str or None
+        Cache directory. If None, use environment variable ``KMRD_CACHE_DIR``
+        or ``~/.cache/kmr_dataset``
+    mmap : Boolean
+        If True, ``rates.indptr``, ``rates.indices``, ``rates.data`` and ``timestamps``
+        are read-only views of ``numpy.memmap`` over the binary cache files.
+        Processes which load same split share one physical copy through OS page cache.
+        It requires ``cache=True``
+    n_jobs : int
+        Number of processes to parse rates file. If -1, use all cores.
+        If it is not 1, the rates file of KMRD-2m and KMRD-5m is extracted from zip archive
+        (to ``extract_dir`` if it is given) because parallel parsing requires extracted file.
+        Starting processes costs more than parsing KMRD-small, so it is slower on 'small'
+    compact : Boolean
+        If True, re-index users and movies to dense 0, 1, ..., n-1 indices.
+        Then the shape of rates becomes (#users who rated, #movies which are rated)
+    extract_dir : str or None
+        Directory where zip archives are extracted. See ``get_paths``
 
     Returns
     -------
@@ -105,46 +592,68 @@ def load_rates(directory=None, size='small'):
         (user, movie) = rate
     timestamps : numpy.ndarray
         UNIX time, corresponding rates.data
+    user_map : IdMap
+        Map between user index and row index.
+        It is returned only when ``compact=True``
+    movie_map : IdMap
+        Map between movie id and column index.
+        It is returned only when ``compact=True``
+    n_duplicates : int
+        Number of dropped duplicated (user, movie) rows.
+        It is returned only when ``return_n_duplicates=True``
 
     Usage
     -----
         >>> from kmr_dataset import load_rates
         >>> rates, timestamps = load_rates(size='small')
-    """
+        >>> rates, timestamps, n_duplicates = load_rates(size='small', return_n_duplicates=True)
+        >>> rates, timestamps = load_rates(size='5m', mmap=True)
 
-    path, parser = _prepare_rate_loader(directory, size)
-
-    rows, cols, data, timestamps = [], [], [], []
-    exists = set()
-
-    n_continues = 0
-    with open(path, encoding='utf-8') as f:
-        # skip head: user,movie,rate,time
-        next(f)
-        for line in f:
-            i, j, v, t = parser(line)
-            key = (i,j)
-            if key in exists:
-                n_continues += 1
-                continue
-            rows.append(i)
-            cols.append(j)
-            data.append(v)
-            timestamps.append(t)
-            exists.add(key)
-
-    if n_continues > 0:
-        flag = len(rows) == len(cols) == len(data) == len(timestamps)
-        if flag:
-            print(f'skip {n_continues} lines which are duplicated (user, item), #uniques={len(rows)}')
-        else:
-            raise ValueError(f'There unexpected error in data {path}')
+        >>> rates, timestamps, user_map, movie_map = load_rates(size='small', compact=True)
+        >>> movie_map.ids  # column index -> movie id
+        >>> movie_map.index  # movie id -> column index
+    """
 
-    rates = csr_matrix((data, (rows, cols)))
-    timestamps = np.array(timestamps, dtype=np.int)
-    return rates, timestamps
+    if mmap and not cache:
+        raise ValueError('mmap=True requires cache=True')
+    path, _ = _prepare_rate_loader(directory, size, extract_dir, extract=_is_parallel(n_jobs))
+    return _load_rates(path, keep, return_n_duplicates, cache, cache_dir, mmap, n_jobs, compact)
 
-def load_histories(directory=None, size='small'):
+def _load_rates(path, keep, return_n_duplicates, cache, cache_dir, mmap, n_jobs, compact):
+    """
+    ``load_rates`` of the resolved rates file
+    """
+    mmap_mode = 'r' if mmap else None
+    names = [f'csr-{keep}-{name}' for name in 'indptr indices data timestamps info'.split()]
+    entry = open_entry(source_of(path), cache_dir) if cache else None
+    arrays = load_arrays(entry, names, mmap_mode)
+    if arrays is None:
+        users, movies, rates, timestamps = _load_rate_columns(path, cache, cache_dir, n_jobs)
+        index, n_duplicates = _deduplicate(users, movies, timestamps, keep)
+        rates, timestamps = _to_csr(users[index], movies[index], rates[index], timestamps[index])
+        info = np.array([rates.shape[0], rates.shape[1], n_duplicates], dtype=np.int64)
+        arrays = (rates.indptr, rates.indices, rates.data, timestamps, info)
+        flag = save_arrays(entry, dict(zip(names, arrays)))
+        if mmap:
+            arrays = load_arrays(entry, names, mmap_mode) if flag else None
+            if arrays is None:
+                raise ValueError(f'mmap=True requires writable cache directory, but failed to write cache of {path}')
+
+    indptr, indices, data, timestamps, (n_rows, n_cols, n_duplicates) = arrays
+    # csr_matrix keeps the given buffers when their dtypes are consistent
+    rates = csr_matrix((data, indices, indptr), shape=(int(n_rows), int(n_cols)), copy=False)
+    n_duplicates = int(n_duplicates)
+
+    returns = [rates, timestamps]
+    if compact:
+        rates, user_map, movie_map = _compact_csr(rates)
+        returns = [rates, timestamps, user_map, movie_map]
+    if return_n_duplicates:
+        returns.append(n_duplicates)
+    return tuple(returns)
+
+def load_histories(directory=None, size='small', cache=True, cache_dir=None, n_jobs=1, compact=False,
+    extract_dir=None):
     """
     Arguments
     ---------
@@ -152,10 +661,21 @@ def load_histories(directory=None, size='small'):
         Data directory. If None, use default directory
     size : str
         Dataset size, Choice one of ['small']
+    cache : Boolean
+        If True, use binary cache of parsed rates. See ``load_rates``
+    cache_dir : str or None
+        Cache directory. See ``load_rates``
+    n_jobs : int
+        Number of processes to parse rates file. See ``load_rates``
+    compact : Boolean
+        If True, re-index users and movies to dense 0, 1, ..., n-1 indices. See ``load_rates``
+    extract_dir : str or None
+        Directory where zip archives are extracted. See ``get_paths``
 
     Returns
     -------
-    user_item_history : dict of list
+    user_item_history : Histories
+        Array-backed read-only dict of list
 
         {
             user: [(item, rate, time), (item, rate, time), ...],
@@ -163,22 +683,261 @@ def load_histories(directory=None, size='small'):
             ...
         }
 
-        time is UNIX time format
+        time is UNIX time format. Use ``user_item_history.to_dict()``
+        to get python dict of list of tuple
+    user_map : IdMap
+        Map between user index and compact user index.
+        It is returned only when ``compact=True``
+    movie_map : IdMap
+        Map between movie id and compact movie index.
+        It is returned only when ``compact=True``
 
     Usage
     -----
-        >>> from kmr_dataset import load_history
-        >>> histories = load_history(size='small')
+        >>> from kmr_dataset import load_histories
+        >>> histories = load_histories(size='small')
+        >>> histories[0]
+        >>> histories[0].movies  # numpy.ndarray view
     """
 
-    path, parser = _prepare_rate_loader(directory, size)
+    path, _ = _prepare_rate_loader(directory, size, extract_dir, extract=_is_parallel(n_jobs))
+    users, movies, rates, timestamps = _load_rate_columns(path, cache, cache_dir, n_jobs)
+    if not compact:
+        return Histories.from_columns(users, movies, rates, timestamps)
+
+    user_map = IdMap.from_values(users)
+    movie_map = IdMap.from_values(movies)
+    users = user_map.index[users]
+    movies = movie_map.index[movies]
+    histories = Histories.from_columns(users, movies, rates, timestamps)
+    return histories, user_map, movie_map
+
+def load_history_index(directory=None, size='small', cache_dir=None, block_size=1 << 22, extract_dir=None):
+    """
+    Arguments
+    ---------
+    directory : str or None
+        Data directory. If None, use default directory
+    size : str
+        Dataset size, Choice one of ['small', '2m', '5m']
+    cache_dir : str or None
+        Directory where the index is stored. See ``load_rates``
+    block_size : int
+        Bytes of rates file which are parsed at once when the index is built
+    extract_dir : str or None
+        Directory where zip archives are extracted. See ``get_paths``
+
+    Returns
+    -------
+    index : HistoryIndex
+        Read-only dict of ``History`` which reads memory-mapped index files.
+        The index is built once when rates file is sorted by user, with memory of ``block_size``.
+        Otherwise the rates are sorted in memory once.
+        If the cache directory is not writable, the index is kept in memory
+
+    Usage
+    -----
+        >>> from kmr_dataset import load_history_index
+        >>> index = load_history_index(size='5m')
+        >>> index.get(0)
+        >>> index.get_many([0, 5, 7])
+    """
+    path, _ = _prepare_rate_loader(directory, size, extract_dir)
+    name = f'{os.path.splitext(os.path.basename(path))[0]}-history'
+    entry = open_entry(source_of(path), cache_dir, name=name)
+    index = HistoryIndex.open(entry)
+    if index is None and entry is not None:
+        index = HistoryIndex.build(_iter_column_blocks(path, block_size), entry)
+    if index is None:
+        users, movies, rates, timestamps = _load_rate_columns(path, cache_dir=cache_dir)
+        index = HistoryIndex.from_columns(users, movies, rates, timestamps)
+        if save_arrays(entry, index.arrays()):
+            index = HistoryIndex.open(entry)
+    return index
+
+def load_texts(path=None, directory=None, size='small', cache=True, cache_dir=None):
+    """
+    Arguments
+    ---------
+    path : str or None
+        Texts file path, for example `kmrd-2m/texts.txt` made by the builder.
+        If None, use `texts.txt` or `texts-{size}.txt` in the data directory
+    directory : str or None
+        Data directory. If None, use default directory
+    size : str
+        Dataset size, Choice one of ['small', '2m', '5m']
+    cache : Boolean
+        If True, the offset index is built once and stored as binary cache
+    cache_dir : str or None
+        Cache directory. See ``load_rates``
+
+    Returns
+    -------
+    store : TextStore
+        Random access store of texts. Texts are read through mmap on demand
+
+    Usage
+    -----
+        >>> from kmr_dataset import load_texts
+        >>> store = load_texts('kmrd-2m/texts.txt')
+        >>> store.get(0)            # [(movie, rate, text), ...]
+        >>> store.get(0, 10003)     # texts of (user, movie)
+        >>> store.get_many([0, 5])
+        >>> for texts in store.iter_texts(chunksize=10000):
+        >>>     # preprocess texts
+    """
+    if path is None:
+        _check_size(size)
+        directory = _initialize_dir(directory, size)
+        path = f'{directory}/texts.txt' if size == 'small' else f'{directory}/texts-{size}.txt'
+    if not os.path.isfile(path):
+        raise ValueError(f'Texts file {path} is not found. It is made by builder/make_dataset.py')
+    return TextStore.open(path, cache, cache_dir)
+
+def load_meta(directory=None, size='small', cache=True, cache_dir=None, extract_dir=None):
+    """
+    Arguments
+    ---------
+    directory : str or None
+        Data directory. If None, use default directory
+    size : str
+        Dataset size, Choice one of ['small', '2m', '5m'].
+        KMRD-2m and KMRD-5m share same metadata
+    cache : Boolean
+        If True, the parsed metadata is stored as binary cache at the first loading,
+        and is loaded from the cache after then
+    cache_dir : str or None
+        Cache directory. See ``load_rates``
+    extract_dir : str or None
+        Directory where zip archives are extracted. See ``get_paths``
+
+    Returns
+    -------
+    meta : Meta
+        Columnar metadata. Categorical codes of genre, country and grade,
+        and (movie, genre), (movie, country), (movie, people) incidence matrices.
+        (movie, director) incidence matrix is empty if `directings.csv` does not exist
+
+    Usage
+    -----
+        >>> from kmr_dataset import load_meta
+        >>> meta = load_meta(size='small')
+        >>> i = meta.movie_map.index[10001]
+        >>> meta.titles[i]
+        $ '시네마 천국'
+        >>> meta.genre_names[meta.genres[i].indices]
+        $ array(['드라마', '멜로/로맨스'], dtype=object)
+    """
+    return _load_meta(_meta_paths(directory, size, extract_dir), cache, cache_dir)
+
+def _meta_paths(directory, size, extract_dir=None):
+    """
+    Paths of castings, countries, genres, movies, peoples, and directings if it exists
+    """
+    _check_size(size)
+    directory = _initialize_dir(directory, size)
+    if size == 'small':
+        paths = _get_paths_small(directory)
+    else:
+        paths = _get_paths_large(directory, size)
+    # castings, countries, genres, movies, peoples
+    paths = _check_install(paths[:5], size, extract=False, extract_dir=extract_dir)
+    # directings.csv is optional
+    directings_path = f'{directory}/directings.csv'
+    if exists_datafile(directings_path):
+        paths += _check_install([directings_path], size, extract=False, extract_dir=extract_dir)
+    return paths
+
+def _load_meta(paths, cache, cache_dir):
+    entry = None
+    if cache:
+        sources = sorted({source_of(path) for path in paths})
+        entry = open_entry(sources, cache_dir, name='meta')
+    names = Meta.array_names()
+    arrays = load_arrays(entry, names)
+    if arrays is not None:
+        return Meta.from_arrays(dict(zip(names, arrays)))
+
+    meta = parse_meta(*paths)
+    save_arrays(entry, meta.to_arrays())
+    return meta
+
+def load_item_features(directory=None, size='small', features=('genre', 'country', 'actor'),
+    compact=False, leading_weight=1.0, order_decay=1.0, max_order=None, cache=True, cache_dir=None,
+    extract_dir=None):
+    """
+    Arguments
+    ---------
+    directory : str or None
+        Data directory. If None, use default directory
+    size : str
+        Dataset size, Choice one of ['small', '2m', '5m']
+    features : tuple of str
+        Feature names. Choose among ['genre', 'country', 'actor', 'director'].
+        'director' requires `directings.csv` in the data directory
+    compact : Boolean
+        If True, rows follow the columns of ``load_rates(compact=True)``.
+        Else, rows follow the columns of ``load_rates()``, that is movie id
+    leading_weight : float
+        Weight of leading role actors in actor feature
+    order_decay : float
+        Actor feature is multiplied by ``order_decay ** (credit order - 1)``
+    max_order : int or None
+        If not None, actors whose credit order is larger than ``max_order`` are removed
+    cache : Boolean
+        If True, the feature matrices are cached next to the rates cache
+    cache_dir : str or None
+        Cache directory. See ``load_rates``
+    extract_dir : str or None
+        Directory where zip archives are extracted. See ``get_paths``
+
+    Returns
+    -------
+    matrices : dict of scipy.sparse.csr_matrix
+        {feature name: (movie, feature) matrix}.
+        Row i corresponds column i of rate matrix
+    names : dict of numpy.ndarray
+        {feature name: column names}. Genre and country names, or people ids of actor and director
+
+    Usage
+    -----
+        >>> from kmr_dataset import load_item_features
+        >>> rates, timestamps, user_map, movie_map = load_rates(size='small', compact=True)
+        >>> matrices, names = load_item_features(size='small', compact=True, leading_weight=2.0)
+        >>> matrices['genre'].shape[0] == rates.shape[1]
+        $ True
+    """
+    # the paths are resolved once, and they are the cache sources too
+    rates_path, _ = _prepare_rate_loader(directory, size, extract_dir)
+    meta_paths = _meta_paths(directory, size, extract_dir)
+    rates, _, *maps = _load_rates(rates_path, 'first', False, cache, cache_dir, False, 1, compact)
+    movie_ids = maps[1].ids if compact else np.arange(rates.shape[1])
+    meta = _load_meta(meta_paths, cache, cache_dir)
+
+    entry = None
+    if cache:
+        sources = {source_of(path) for path in [rates_path] + meta_paths}
+        stem = os.path.splitext(os.path.basename(rates_path))[0]
+        entry = open_entry(sorted(sources), cache_dir, name=f'features-{stem}')
+
+    matrices, names = {}, {}
+    for feature in features:
+        tag = 'compact' if compact else 'full'
+        if feature == 'actor':
+            tag = f'{tag}-l{leading_weight:g}-d{order_decay:g}-m{max_order}'
+        array_names = [f'{feature}-{tag}-{name}' for name in 'indptr indices data shape'.split()]
+        arrays = load_arrays(entry, array_names)
+        if arrays is None:
+            matrix, column_names = item_features(
+                meta, movie_ids, (feature,), leading_weight, order_decay, max_order)
+            matrix = matrix[feature]
+            shape = np.array(matrix.shape, dtype=np.int64)
+            save_arrays(entry, dict(zip(array_names, (matrix.indptr, matrix.indices, matrix.data, shape))))
+        else:
+            indptr, indices, data, shape = arrays
+            matrix = csr_matrix((data, indices, indptr), shape=tuple(int(v) for v in shape))
+        matrices[feature] = matrix
+        names[feature] = meta.people_map.ids if feature in ('actor', 'director') else (
+            meta.genre_names if feature == 'genre' else meta.country_names)
+    return matrices, names
 
-    histories = defaultdict(lambda: [])
-    with open(path, encoding='utf-8') as f:
-        # skip head: user,movie,rate,time
-        next(f)
-        for line in f:
-            # user, movie, rate, time
-            u, m, r, t = parser(line)
-            histories[u].append((m, r, t))
-    return dict(histories)
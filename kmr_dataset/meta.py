@@ -0,0 +1,274 @@
+import io
+import numpy as np
+from scipy.sparse import csr_matrix
+from .cache import decode_strings
+from .cache import encode_strings
+from .idmap import IdMap
+from .install import open_datafile
+
+
+class Meta:
+    """
+    Columnar metadata of movies and peoples.
+    Movie-level arrays and the rows of incidence matrices follow ``movie_map``,
+    and the columns of ``castings`` follow ``people_map``
+
+    Attributes
+    ----------
+    movie_map : IdMap
+        Map between movie id and movie index
+    titles : numpy.ndarray
+        Korean titles. Empty str if unknown
+    titles_eng : numpy.ndarray
+        English titles. Empty str if unknown
+    years : numpy.ndarray
+        int32 first open year. -1 if unknown
+    grades : numpy.ndarray
+        int16 grade code. -1 if unknown. ``grade_names[code]`` is the grade
+    grade_names : numpy.ndarray
+        Sorted grade names
+    genres : scipy.sparse.csr_matrix
+        (movie, genre) binary incidence matrix. ``genre_names[column]`` is the genre
+    genre_names : numpy.ndarray
+        Sorted genre names
+    countries : scipy.sparse.csr_matrix
+        (movie, country) binary incidence matrix
+    country_names : numpy.ndarray
+        Sorted country names
+    castings : scipy.sparse.csr_matrix
+        (movie, people) binary incidence matrix of actors
+    casting_orders : numpy.ndarray
+        int32 credit order, corresponding ``castings.data``
+    casting_leadings : numpy.ndarray
+        int8 leading role flag, corresponding ``castings.data``
+    directings : scipy.sparse.csr_matrix
+        (movie, people) binary incidence matrix of directors.
+        It is empty if `directings.csv` does not exist
+    people_map : IdMap
+        Map between people id and people index
+    people_names : numpy.ndarray
+        Korean names of peoples
+    people_names_original : numpy.ndarray
+        Original names of peoples
+
+    Usage
+    -----
+        >>> from kmr_dataset import load_meta
+        >>> meta = load_meta(size='small')
+        >>> i = meta.movie_map.index[10001]
+        >>> meta.titles[i], meta.years[i], meta.grade_names[meta.grades[i]]
+        >>> meta.genre_names[meta.genres[i].indices]
+    """
+    _array_names = ('years', 'grades', 'casting_orders', 'casting_leadings')
+    _string_names = ('titles', 'titles_eng', 'grade_names', 'genre_names',
+                     'country_names', 'people_names', 'people_names_original')
+    _matrix_names = ('genres', 'countries', 'castings', 'directings')
+
+    def __init__(self, movie_map, titles, titles_eng, years, grades, grade_names,
+        genres, genre_names, countries, country_names, castings, casting_orders,
+        casting_leadings, directings, people_map, people_names, people_names_original):
+
+        self.movie_map = movie_map
+        self.titles = titles
+        self.titles_eng = titles_eng
+        self.years = years
+        self.grades = grades
+        self.grade_names = grade_names
+        self.genres = genres
+        self.genre_names = genre_names
+        self.countries = countries
+        self.country_names = country_names
+        self.castings = castings
+        self.casting_orders = casting_orders
+        self.casting_leadings = casting_leadings
+        self.directings = directings
+        self.people_map = people_map
+        self.people_names = people_names
+        self.people_names_original = people_names_original
+
+    def __repr__(self):
+        return (f'Meta(#movies={len(self.movie_map)}, #genres={len(self.genre_names)}, '
+                f'#countries={len(self.country_names)}, #peoples={len(self.people_map)})')
+
+    def to_arrays(self):
+        """
+        Returns
+        -------
+        arrays : dict of numpy.ndarray
+            Arrays to store in binary cache
+        """
+        arrays = {
+            'movie_ids': self.movie_map.ids,
+            'people_ids': self.people_map.ids
+        }
+        for name in self._array_names:
+            arrays[name] = getattr(self, name)
+        for name in self._string_names:
+            arrays[f'{name}-data'], arrays[f'{name}-offsets'] = encode_strings(getattr(self, name))
+        for name in self._matrix_names:
+            matrix = getattr(self, name)
+            arrays[f'{name}-indptr'] = matrix.indptr
+            arrays[f'{name}-indices'] = matrix.indices
+            arrays[f'{name}-shape'] = np.array(matrix.shape, dtype=np.int64)
+        return arrays
+
+    @classmethod
+    def array_names(cls):
+        names = ['movie_ids', 'people_ids']
+        names += list(cls._array_names)
+        names += [f'{name}-{suffix}' for name in cls._string_names for suffix in ('data', 'offsets')]
+        names += [f'{name}-{suffix}' for name in cls._matrix_names for suffix in ('indptr', 'indices', 'shape')]
+        return names
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        Inverse of ``to_arrays``
+        """
+        kwargs = {
+            'movie_map': IdMap(arrays['movie_ids']),
+            'people_map': IdMap(arrays['people_ids'])
+        }
+        for name in cls._array_names:
+            kwargs[name] = arrays[name]
+        for name in cls._string_names:
+            kwargs[name] = decode_strings(arrays[f'{name}-data'], arrays[f'{name}-offsets'])
+        for name in cls._matrix_names:
+            indptr, indices = arrays[f'{name}-indptr'], arrays[f'{name}-indices']
+            shape = tuple(int(v) for v in arrays[f'{name}-shape'])
+            data = np.ones(indices.shape[0], dtype=np.int8)
+            kwargs[name] = csr_matrix((data, indices, indptr), shape=shape)
+        return cls(**kwargs)
+
+
+def _read_table(path, delimiter):
+    """
+    Returns rows of table except header as list of list of str
+    """
+    with io.TextIOWrapper(open_datafile(path), encoding='utf-8') as f:
+        # skip header
+        next(f)
+        rows = [line.rstrip('\r\n').split(delimiter) for line in f]
+    return [row for row in rows if row != ['']]
+
+def _to_str_array(strings):
+    array = np.empty(len(strings), dtype=object)
+    array[:] = strings
+    return array
+
+def _categorize(values):
+    """
+    Returns
+    -------
+    codes : numpy.ndarray
+        int16 code of values. -1 for empty value
+    names : numpy.ndarray
+        Sorted unique non-empty values
+    """
+    names = sorted({v for v in values if v})
+    mapper = {name: code for code, name in enumerate(names)}
+    codes = np.array([mapper.get(v, -1) for v in values], dtype=np.int16)
+    return codes, _to_str_array(names)
+
+def _incidence_matrix(rows, cols, shape):
+    """
+    Binary csr_matrix of which (rows[i], cols[i]) are 1
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    if shape[1] == 0:
+        return csr_matrix(shape, dtype=np.int8)
+    keys = np.unique(rows * shape[1] + cols)
+    rows, cols = keys // shape[1], keys % shape[1]
+    indptr = np.zeros(shape[0] + 1, dtype=np.int32)
+    np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+    data = np.ones(keys.shape[0], dtype=np.int8)
+    return csr_matrix((data, cols.astype(np.int32), indptr), shape=shape)
+
+def _to_int(value, default=-1):
+    value = value.strip()
+    return int(value) if value.lstrip('-').isdigit() else default
+
+def parse_meta(castings_path, countries_path, genres_path, movies_path, peoples_path,
+    directings_path=None):
+    """
+    Arguments
+    ---------
+    castings_path, countries_path, genres_path, movies_path, peoples_path : str
+        Paths of metadata files. The files which are not extracted are read from zip archive
+    directings_path : str or None
+        Path of `directings.csv`. It is optional because it is not included in released dataset
+
+    Returns
+    -------
+    meta : Meta
+    """
+    movies = _read_table(movies_path, '\t')
+    genres = _read_table(genres_path, ',')
+    countries = _read_table(countries_path, ',')
+    castings = _read_table(castings_path, ',')
+    peoples = _read_table(peoples_path, '\t')
+    # movie, people
+    directings = _read_table(directings_path, ',') if directings_path is not None else []
+
+    # movie, title, title_eng, year, grade
+    movies = [row + [''] * (5 - len(row)) for row in movies]
+    movie_ids = [int(row[0]) for row in movies]
+    genre_movies = [int(row[0]) for row in genres]
+    country_movies = [int(row[0]) for row in countries]
+    # movie, people, order, leading
+    casting_movies = [int(row[0]) for row in castings]
+    casting_peoples = [int(row[1]) for row in castings]
+    directing_movies = [int(row[0]) for row in directings]
+    directing_peoples = [int(row[1]) for row in directings]
+    movie_map = IdMap.from_values(movie_ids + genre_movies + country_movies + casting_movies + directing_movies)
+    n_movies = len(movie_map)
+
+    people_ids = [int(row[0]) for row in peoples]
+    people_map = IdMap.from_values(people_ids + casting_peoples + directing_peoples)
+    n_peoples = len(people_map)
+
+    index = movie_map.index[np.asarray(movie_ids, dtype=np.int64)]
+    titles = [''] * n_movies
+    titles_eng = [''] * n_movies
+    years = np.full(n_movies, -1, dtype=np.int32)
+    grades = np.full(n_movies, -1, dtype=np.int16)
+    grade_codes, grade_names = _categorize([row[4].strip() for row in movies])
+    for i, row, code in zip(index.tolist(), movies, grade_codes):
+        titles[i] = row[1]
+        titles_eng[i] = row[2]
+        years[i] = _to_int(row[3])
+        grades[i] = code
+
+    genre_codes, genre_names = _categorize([row[1].strip() for row in genres])
+    genres = _incidence_matrix(movie_map.index[genre_movies], genre_codes, (n_movies, len(genre_names)))
+
+    country_codes, country_names = _categorize([row[1].strip() for row in countries])
+    countries = _incidence_matrix(movie_map.index[country_movies], country_codes, (n_movies, len(country_names)))
+
+    # keep the smallest credit order if an actor appears several times in a movie
+    rows = movie_map.index[casting_movies].astype(np.int64)
+    cols = people_map.index[casting_peoples].astype(np.int64)
+    orders = np.array([_to_int(row[2]) if len(row) > 2 else -1 for row in castings], dtype=np.int32)
+    leadings = np.array([_to_int(row[3], 0) if len(row) > 3 else 0 for row in castings], dtype=np.int8)
+    order = np.lexsort((orders, cols, rows))
+    keys = rows[order] * n_peoples + cols[order]
+    first = order[np.concatenate([[True], keys[1:] != keys[:-1]])] if keys.shape[0] else order
+    castings = _incidence_matrix(rows[first], cols[first], (n_movies, n_peoples))
+    casting_orders, casting_leadings = orders[first], leadings[first]
+
+    directings = _incidence_matrix(
+        movie_map.index[directing_movies], people_map.index[directing_peoples], (n_movies, n_peoples))
+
+    people_names = [''] * n_peoples
+    people_names_original = [''] * n_peoples
+    for row in peoples:
+        i = people_map.index[int(row[0])]
+        people_names[i] = row[1] if len(row) > 1 else ''
+        people_names_original[i] = row[2] if len(row) > 2 else ''
+
+    return Meta(
+        movie_map, _to_str_array(titles), _to_str_array(titles_eng), years, grades, grade_names,
+        genres, genre_names, countries, country_names, castings, casting_orders, casting_leadings,
+        directings, people_map, _to_str_array(people_names), _to_str_array(people_names_original)
+    )
@@ -0,0 +1,263 @@
+import queue
+import threading
+import numpy as np
+from .split import _row_indices
+
+
+def _sorted_keys(rates):
+    """
+    ``row * n_cols + col`` of each element. It is sorted when each row has sorted indices
+    """
+    if not rates.has_sorted_indices:
+        rates = rates.sorted_indices()
+    return _row_indices(rates).astype(np.int64) * rates.shape[1] + rates.indices
+
+def _contains(keys, n_cols, users, items):
+    """
+    Batched sorted search. True if (users[i], items[i]) is an element of the matrix
+    """
+    if keys.shape[0] == 0:
+        return np.zeros(np.shape(users), dtype=bool)
+    queries = users.astype(np.int64) * n_cols + items
+    positions = np.minimum(np.searchsorted(keys, queries), keys.shape[0] - 1)
+    return keys[positions] == queries
+
+def item_popularity(rates, alpha=1.0):
+    """
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, item) = rate
+    alpha : float
+        Smoothing exponent. Probability of item is proportional to count ** alpha
+
+    Returns
+    -------
+    probs : numpy.ndarray
+        Sampling probability of each item
+    """
+    counts = np.bincount(rates.indices, minlength=rates.shape[1]).astype(np.float64)
+    weights = counts ** alpha
+    weights[counts == 0] = 0
+    if weights.sum() == 0:
+        raise ValueError('rates has no element')
+    return weights / weights.sum()
+
+def sample_negatives(rates, users, n_negatives=1, probs=None, seed=None, max_trials=20, keys=None):
+    """
+    Sample items which are not rated by the users. Candidates are drawn for all users at once,
+    and only the rejected candidates are drawn again. After ``max_trials``, the remaining
+    negatives are drawn from the complement of each user's items
+
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, item) = rate. Every element is treated as observed
+    users : numpy.ndarray
+        User (row) indices
+    n_negatives : int
+        Number of negatives per user
+    probs : numpy.ndarray or None
+        Sampling probability of items. If None, sample uniformly. See ``item_popularity``
+    seed : int, numpy.random.Generator or None
+        Random seed
+    max_trials : int
+        Number of rejection rounds
+    keys : numpy.ndarray or None
+        Sorted element keys of ``rates``. It is computed if None
+
+    Returns
+    -------
+    negatives : numpy.ndarray
+        Shape is (len(users), n_negatives)
+
+    Usage
+    -----
+        >>> from kmr_dataset.sampling import sample_negatives, item_popularity
+        >>> negatives = sample_negatives(train, users, n_negatives=5, probs=item_popularity(train, 0.75), seed=0)
+    """
+    rng = np.random.default_rng(seed)
+    n_items = rates.shape[1]
+    if keys is None:
+        keys = _sorted_keys(rates)
+    cdf = None if probs is None else np.cumsum(probs)
+
+    def draw(n):
+        if cdf is None:
+            return rng.integers(0, n_items, size=n)
+        return np.minimum(np.searchsorted(cdf, rng.random(n) * cdf[-1], side='right'), n_items - 1)
+
+    users = np.repeat(np.asarray(users, dtype=np.int64), n_negatives)
+    negatives = draw(users.shape[0])
+    rejected = np.flatnonzero(_contains(keys, n_items, users, negatives))
+    for _ in range(max_trials):
+        if rejected.shape[0] == 0:
+            break
+        negatives[rejected] = draw(rejected.shape[0])
+        rejected = rejected[_contains(keys, n_items, users[rejected], negatives[rejected])]
+
+    # users who rated most of items
+    for i in rejected.tolist():
+        user = users[i]
+        row = rates.indices[rates.indptr[user]: rates.indptr[user + 1]]
+        candidates = np.setdiff1d(np.arange(n_items), row)
+        if candidates.shape[0] == 0:
+            raise ValueError(f'User {user} rated all items. There is no negative item')
+        weights = None if probs is None else probs[candidates]
+        if weights is not None:
+            weights = weights / weights.sum() if weights.sum() > 0 else None
+        negatives[i] = rng.choice(candidates, p=weights)
+    return negatives.reshape(-1, n_negatives)
+
+
+class BPRSampler:
+    """
+    Minibatch generator of (user, positive item, negative item) triples for implicit feedback models.
+    Each epoch visits every positive element once in shuffled order. Negatives are sampled with
+    ``sample_negatives`` in vectorized form.
+
+    With ``world_size`` > 1, every process shuffles the elements with same seed
+    and takes every ``world_size``-th element from ``rank``, so the processes see disjoint streams.
+    Call ``set_epoch`` before each epoch to change the shuffling.
+
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, item) = rate
+    batch_size : int
+        Number of triples of each batch
+    n_negatives : int
+        Number of negatives per positive. If it is larger than 1, negatives are 2D array
+    negative : str
+        'uniform' or 'popularity'
+    alpha : float
+        Smoothing exponent of popularity sampling. See ``item_popularity``
+    min_rate : int or None
+        If not None, only the elements of which rate >= ``min_rate`` are positives.
+        The others are still excluded from negatives
+    seed : int
+        Random seed
+    rank : int
+        Index of the process
+    world_size : int
+        Number of processes
+    prefetch : int
+        Number of batches which are prepared in a background thread. If 0, batches are made
+        in the calling thread
+    shuffle : Boolean
+        If False, positives are visited in order of (user, item)
+    drop_last : Boolean
+        If True, the last incomplete batch is dropped
+
+    Usage
+    -----
+        >>> from kmr_dataset import load_rates
+        >>> from kmr_dataset.sampling import BPRSampler
+        >>> rates, timestamps, user_map, movie_map = load_rates(size='small', compact=True)
+        >>> sampler = BPRSampler(rates, batch_size=1024, negative='popularity', seed=0, rank=0, world_size=2)
+        >>> for epoch in range(10):
+        >>>     sampler.set_epoch(epoch)
+        >>>     for users, positives, negatives in sampler:
+        >>>         # train
+    """
+    def __init__(self, rates, batch_size=1024, n_negatives=1, negative='uniform', alpha=0.75,
+        min_rate=None, seed=0, rank=0, world_size=1, prefetch=2, shuffle=True, drop_last=False):
+
+        if negative not in ('uniform', 'popularity'):
+            raise ValueError(f'negative must be one of ["uniform", "popularity"], but {negative}')
+        if not (0 <= rank < world_size):
+            raise ValueError(f'rank must be in [0, {world_size}), but {rank}')
+        if not rates.has_sorted_indices:
+            rates = rates.sorted_indices()
+        self.rates = rates
+        self.batch_size = batch_size
+        self.n_negatives = n_negatives
+        self.probs = item_popularity(rates, alpha) if negative == 'popularity' else None
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.prefetch = prefetch
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.epoch = 0
+        self.keys = _sorted_keys(rates)
+        positive = np.flatnonzero(rates.data >= min_rate) if min_rate is not None else np.arange(rates.nnz)
+        self.users = _row_indices(rates)[positive]
+        self.items = rates.indices[positive]
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    @property
+    def n_samples(self):
+        """
+        Number of positives of this rank in an epoch
+        """
+        n = self.users.shape[0]
+        return max(0, (n - self.rank + self.world_size - 1) // self.world_size)
+
+    def __len__(self):
+        if self.drop_last:
+            return self.n_samples // self.batch_size
+        return -(-self.n_samples // self.batch_size)
+
+    def _order(self):
+        if self.shuffle:
+            # same permutation in every rank
+            order = np.random.default_rng([self.seed, self.epoch]).permutation(self.users.shape[0])
+        else:
+            order = np.arange(self.users.shape[0])
+        return order[self.rank::self.world_size]
+
+    def _generate(self):
+        order = self._order()
+        rng = np.random.default_rng([self.seed, self.epoch, self.rank])
+        for b in range(len(self)):
+            batch = order[b * self.batch_size: (b + 1) * self.batch_size]
+            users, positives = self.users[batch], self.items[batch]
+            negatives = sample_negatives(self.rates, users, self.n_negatives, self.probs, rng, keys=self.keys)
+            if self.n_negatives == 1:
+                negatives = negatives[:, 0]
+            yield users, positives, negatives
+
+    def __iter__(self):
+        if self.prefetch <= 0:
+            yield from self._generate()
+            return
+
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        end = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for batch in self._generate():
+                    if not put(batch):
+                        return
+                put(end)
+            except BaseException as e:
+                put(e)
+
+        thread = threading.Thread(target=produce, daemon=True)
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is end:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                yield batch
+        finally:
+            # the consumer may break the loop early
+            stop.set()
+            thread.join()
@@ -0,0 +1,235 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import csr_matrix
+from .cache import load_arrays
+from .cache import save_arrays
+from .evaluation import top_k
+
+
+NEIGHBOR_NAMES = ('indptr', 'neighbors', 'similarities')
+MEASURES = ('cosine', 'jaccard', 'pearson')
+
+# matrices of worker process, set by _initialize_worker
+_worker_state = {}
+
+def _prepare(rates, measure):
+    """
+    Remove empty columns, and returns (user, item) csc matrix of values, binary matrix,
+    and statistics of the measure. Raw movie ids make most of the columns empty
+    """
+    rates = rates.tocsr()
+    counts = np.bincount(rates.indices, minlength=rates.shape[1])
+    items = np.flatnonzero(counts)
+    index = np.full(rates.shape[1], -1, dtype=np.int64)
+    index[items] = np.arange(items.shape[0])
+    values = rates.data.astype(np.float64)
+    if measure == 'pearson':
+        # center by item mean
+        sums = np.bincount(rates.indices, weights=values, minlength=rates.shape[1])
+        values = values - (sums / np.maximum(counts, 1))[rates.indices]
+    values = csr_matrix((values, index[rates.indices], rates.indptr), shape=(rates.shape[0], items.shape[0]))
+    values = values.tocsc()
+    binary = values.copy()
+    binary.data = np.ones_like(binary.data)
+    norms = np.sqrt(np.asarray(values.multiply(values).sum(axis=0)).ravel())
+    return items, values, binary, norms, counts[items].astype(np.float64)
+
+def _initialize_worker(state):
+    _worker_state.update(state)
+
+def _block_neighbors(begin, end, measure, n_neighbors, shrinkage, min_support, state=None):
+    """
+    Top-N neighbors of compact items [begin, end)
+
+    Returns
+    -------
+    neighbors : numpy.ndarray
+        (end - begin, n) compact item indices. -1 if there is no more neighbor
+    similarities : numpy.ndarray
+        (end - begin, n) similarities
+    """
+    if state is None:
+        state = _worker_state
+    values, binary, norms, counts = state['values'], state['binary'], state['norms'], state['counts']
+    support = None
+    if measure == 'jaccard' or shrinkage > 0 or min_support > 1:
+        support = (binary[:, begin:end].T @ binary).toarray()
+
+    if measure == 'jaccard':
+        union = counts[begin:end, None] + counts[None, :] - support
+        block = support / np.maximum(union, 1)
+    else:
+        block = (values[:, begin:end].T @ values).toarray()
+        denominator = norms[begin:end, None] * norms[None, :]
+        # dot product is 0 if the norm is 0
+        np.divide(block, denominator, out=block, where=denominator > 0)
+    if support is not None:
+        if shrinkage > 0:
+            block *= support / (support + shrinkage)
+        block[support < min_support] = 0
+
+    # items without co-rating user and the item itself are not neighbors
+    block[block == 0] = -np.inf
+    block[np.arange(end - begin), np.arange(begin, end)] = -np.inf
+    neighbors, valid = top_k(block, n_neighbors)
+    similarities = np.take_along_axis(block, neighbors, axis=1)
+    neighbors[~valid] = -1
+    similarities[~valid] = 0
+    return neighbors, similarities.astype(np.float32)
+
+def item_similarity(rates, measure='cosine', n_neighbors=50, shrinkage=0, min_support=1,
+    block_size=None, max_block_bytes=1 << 28, n_jobs=1):
+    """
+    Item-item similarity of the columns of rate matrix. Similarities are computed
+    in blocks of items with sparse matrix product, and only top ``n_neighbors`` neighbors
+    of each item are kept, therefore the dense (n_items, n_items) matrix is never made
+
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, item) = rate
+    measure : str
+        Choose one of ['cosine', 'jaccard', 'pearson']
+
+            - cosine : cosine of rate vectors
+            - jaccard : |users of i and j| / |users of i or j|
+            - pearson : cosine of rate vectors centered by item mean.
+              Item mean is computed over all users of the item, not only co-rating users
+    n_neighbors : int
+        Number of neighbors of each item
+    shrinkage : float
+        If positive, similarity is multiplied by n / (n + shrinkage)
+        where n is the number of co-rating users
+    min_support : int
+        Minimum number of co-rating users of neighbors
+    block_size : int or None
+        Number of items of a block. If None, it is set so that a dense similarity block
+        is smaller than ``max_block_bytes``
+    max_block_bytes : int
+        Memory cap of a block. Peak memory is about ``n_jobs`` blocks
+        (twice if ``shrinkage``, ``min_support`` or jaccard is used)
+    n_jobs : int
+        Number of processes
+
+    Returns
+    -------
+    index : ItemNeighbors
+        Rows are aligned with the columns of ``rates``. Empty columns have no neighbor
+
+    Usage
+    -----
+        >>> from kmr_dataset import load_rates
+        >>> from kmr_dataset.similarity import item_similarity
+        >>> rates, timestamps = load_rates(size='small')
+        >>> index = item_similarity(rates, 'pearson', n_neighbors=50, shrinkage=100, n_jobs=4)
+        >>> index.save('item-knn/')
+    """
+    if measure not in MEASURES:
+        raise ValueError(f'measure must be one of {list(MEASURES)}, but {measure}')
+    if n_neighbors < 1:
+        raise ValueError(f'n_neighbors must be positive, but {n_neighbors}')
+    items, values, binary, norms, counts = _prepare(rates, measure)
+    n_items = items.shape[0]
+    if block_size is None:
+        block_size = max(1, max_block_bytes // (8 * max(n_items, 1)))
+    state = {'values': values, 'binary': binary, 'norms': norms, 'counts': counts}
+    ranges = [(b, min(b + block_size, n_items)) for b in range(0, n_items, block_size)]
+    args = (measure, n_neighbors, shrinkage, min_support)
+
+    if n_jobs is not None and n_jobs > 1 and len(ranges) > 1:
+        # the matrices are sent to each worker once
+        with ProcessPoolExecutor(min(n_jobs, len(ranges)), initializer=_initialize_worker, initargs=(state,)) as executor:
+            futures = [executor.submit(_block_neighbors, b, e, *args) for b, e in ranges]
+            results = [future.result() for future in futures]
+    else:
+        results = [_block_neighbors(b, e, *args, state=state) for b, e in ranges]
+
+    if results:
+        neighbors = np.vstack([r[0] for r in results])
+        similarities = np.vstack([r[1] for r in results])
+    else:
+        neighbors = np.zeros((0, 1), dtype=np.int64)
+        similarities = np.zeros((0, 1), dtype=np.float32)
+    valid = neighbors >= 0
+    counts = np.zeros(rates.shape[1], dtype=np.int64)
+    counts[items] = valid.sum(axis=1)
+    indptr = np.zeros(rates.shape[1] + 1, dtype=np.int64)
+    np.cumsum(counts, out=indptr[1:])
+    # rows are in order of compact item, which is monotonic to column index
+    return ItemNeighbors(indptr, items[neighbors[valid]].astype(np.int32), similarities[valid])
+
+
+class ItemNeighbors:
+    """
+    Compact item-item neighbor index. Neighbors of item ``i`` are
+    ``neighbors[indptr[i]:indptr[i+1]]`` in descending order of similarity.
+    Items are the column indices of the rate matrix
+
+    Arguments
+    ---------
+    indptr : numpy.ndarray
+        Offsets of each item's neighbors. Its length is ``n_items + 1``
+    neighbors : numpy.ndarray
+        int32 neighbor item indices
+    similarities : numpy.ndarray
+        float32 similarities
+
+    Usage
+    -----
+        >>> index = item_similarity(rates, measure='cosine', n_neighbors=50)
+        >>> items, similarities = index[10001]
+        >>> index.save('item-knn/')
+        >>> index = ItemNeighbors.load('item-knn/')
+    """
+    def __init__(self, indptr, neighbors, similarities):
+        self.indptr = indptr
+        self.neighbors = neighbors
+        self.similarities = similarities
+
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        """
+        Load the index stored by ``save``. Arrays are memory-mapped by default
+        """
+        arrays = load_arrays(directory, NEIGHBOR_NAMES, mmap_mode=mmap_mode)
+        if arrays is None:
+            raise ValueError(f'{directory} does not have item neighbor index')
+        return cls(*arrays)
+
+    def save(self, directory):
+        """
+        Store the arrays as `.npy` files in the directory
+        """
+        os.makedirs(directory, exist_ok=True)
+        if not save_arrays(directory, {name: getattr(self, name) for name in NEIGHBOR_NAMES}):
+            raise ValueError(f'Failed to save item neighbor index to {directory}')
+
+    def __len__(self):
+        return self.indptr.shape[0] - 1
+
+    def __repr__(self):
+        return f'ItemNeighbors(#items={len(self)}, #neighbors={self.neighbors.shape[0]})'
+
+    def __getitem__(self, item):
+        """
+        Returns
+        -------
+        neighbors : numpy.ndarray
+            Neighbor items in descending order of similarity
+        similarities : numpy.ndarray
+            Corresponding similarities
+        """
+        b, e = self.indptr[item], self.indptr[item + 1]
+        return self.neighbors[b:e], self.similarities[b:e]
+
+    def to_csr(self):
+        """
+        Returns
+        -------
+        similarity : scipy.sparse.csr_matrix
+            (item, neighbor) = similarity
+        """
+        n_items = len(self)
+        return csr_matrix((self.similarities, self.neighbors, self.indptr), shape=(n_items, n_items))
+
@@ -0,0 +1,135 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+def _row_indices(rates):
+    """
+    Row index of each element of ``rates.data``
+    """
+    return np.repeat(np.arange(rates.shape[0]), np.diff(rates.indptr))
+
+def _split_by_mask(rates, timestamps, test_mask):
+    """
+    Split csr_matrix into train (~test_mask) and test (test_mask) matrices of same shape
+    """
+    rows = _row_indices(rates)
+    returns = []
+    for mask in (~test_mask, test_mask):
+        indptr = np.zeros(rates.shape[0] + 1, dtype=rates.indptr.dtype)
+        np.cumsum(np.bincount(rows[mask], minlength=rates.shape[0]), out=indptr[1:])
+        matrix = csr_matrix((rates.data[mask], rates.indices[mask], indptr), shape=rates.shape)
+        returns += [matrix, np.asarray(timestamps)[mask]]
+    return tuple(returns)
+
+def _rank_from_last(rates, timestamps, seed, by='time'):
+    """
+    Returns the rank of each element within its row counted from the end.
+    The latest element of a row (by='time') or a randomly chosen element (by='random') has rank 0.
+    Tied timestamps are broken randomly
+    """
+    rng = np.random.default_rng(seed)
+    rows = _row_indices(rates)
+    noise = rng.random(rows.shape[0])
+    if by == 'time':
+        order = np.lexsort((noise, timestamps, rows))
+    elif by == 'random':
+        order = np.lexsort((noise, rows))
+    else:
+        raise ValueError(f'by must be one of ["time", "random"], but {by}')
+    counts = np.diff(rates.indptr)
+    # position in its row after sorting
+    position = np.arange(rows.shape[0]) - rates.indptr[rows]
+    rank = np.empty(rows.shape[0], dtype=np.int64)
+    rank[order] = counts[rows] - position - 1
+    return rank, counts[rows]
+
+def split_by_time(rates, timestamps, cutoff):
+    """
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, movie) = rate
+    timestamps : numpy.ndarray
+        UNIX time, corresponding rates.data
+    cutoff : int
+        UNIX time. The rates of which time >= cutoff are test set
+
+    Returns
+    -------
+    train : scipy.sparse.csr_matrix
+        Rates before cutoff. Same shape with ``rates``
+    train_timestamps : numpy.ndarray
+        Corresponding train.data
+    test : scipy.sparse.csr_matrix
+        Rates at or after cutoff. Same shape with ``rates``
+    test_timestamps : numpy.ndarray
+        Corresponding test.data
+
+    Usage
+    -----
+        >>> from kmr_dataset import load_rates
+        >>> from kmr_dataset.split import split_by_time
+        >>> rates, timestamps = load_rates(size='small')
+        >>> train, train_ts, test, test_ts = split_by_time(rates, timestamps, 1514732400)
+    """
+    return _split_by_mask(rates, timestamps, np.asarray(timestamps) >= cutoff)
+
+def leave_last_k_out(rates, timestamps, k=1, seed=0):
+    """
+    Hold out the latest ``k`` rates of each user.
+    The users who rated ``k`` or fewer movies are kept in train set.
+
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, movie) = rate
+    timestamps : numpy.ndarray
+        UNIX time, corresponding rates.data
+    k : int
+        Number of test rates per user
+    seed : int
+        Random seed to break ties of timestamps
+
+    Returns
+    -------
+    train, train_timestamps, test, test_timestamps
+        See ``split_by_time``
+
+    Usage
+    -----
+        >>> train, train_ts, test, test_ts = leave_last_k_out(rates, timestamps, k=1)
+    """
+    rank, counts = _rank_from_last(rates, timestamps, seed, by='time')
+    return _split_by_mask(rates, timestamps, (rank < k) & (counts > k))
+
+def split_by_ratio(rates, timestamps, test_ratio=0.2, by='time', seed=0):
+    """
+    Hold out ``floor(test_ratio * n)`` rates of each user who rated n movies
+
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, movie) = rate
+    timestamps : numpy.ndarray
+        UNIX time, corresponding rates.data
+    test_ratio : float
+        Ratio of test rates per user
+    by : str
+        'time' holds out the latest rates, and 'random' holds out random rates
+    seed : int
+        Random seed
+
+    Returns
+    -------
+    train, train_timestamps, test, test_timestamps
+        See ``split_by_time``
+
+    Usage
+    -----
+        >>> train, train_ts, test, test_ts = split_by_ratio(rates, timestamps, 0.2, by='random', seed=42)
+    """
+    if not (0 <= test_ratio <= 1):
+        raise ValueError(f'test_ratio must be in [0, 1], but {test_ratio}')
+    rank, counts = _rank_from_last(rates, timestamps, seed, by=by)
+    n_tests = np.floor(counts * test_ratio)
+    return _split_by_mask(rates, timestamps, rank < n_tests)
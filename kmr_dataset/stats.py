@@ -0,0 +1,223 @@
+import numpy as np
+
+
+def gini(counts):
+    """
+    Gini coefficient of non-negative counts. 0 means uniform, and close to 1 means concentrated
+    """
+    counts = np.sort(np.asarray(counts, dtype=np.float64))
+    n = counts.shape[0]
+    total = counts.sum()
+    if n == 0 or total == 0:
+        return 0.0
+    cum = np.arange(1, n + 1, dtype=np.float64)
+    return float(2 * (cum * counts).sum() / (n * total) - (n + 1) / n)
+
+def top_share(counts, ratio=0.2):
+    """
+    Share of rates covered by the top ``ratio`` users or items
+    """
+    counts = np.sort(np.asarray(counts))[::-1]
+    total = counts.sum()
+    n_tops = int(np.ceil(ratio * counts.shape[0]))
+    if total == 0:
+        return 0.0
+    return float(counts[:n_tops].sum() / total)
+
+def _log_histogram(degrees):
+    """
+    Histogram of positive degrees with power-of-two bins. ``counts[k]`` is the number of
+    degrees in [``edges[k]``, ``edges[k+1]``), where ``edges[k] = 2 ** k``
+    """
+    # frexp returns the exponent e of d = m * 2 ** e, 0.5 <= m < 1, so e - 1 = floor(log2(d))
+    bins = np.frexp(degrees)[1] - 1
+    counts = np.bincount(bins)
+    edges = 1 << np.arange(counts.shape[0] + 1, dtype=np.int64)
+    return {'edges': edges.tolist(), 'counts': counts.tolist()}
+
+def _bincount(values, block_size=1 << 22):
+    """
+    ``np.bincount`` in blocks. It casts only a block to intp at once, not the whole array
+    """
+    counts = np.zeros(0, dtype=np.int64)
+    for begin in range(0, values.shape[0], block_size):
+        increment = np.bincount(values[begin: begin + block_size])
+        if increment.shape[0] > counts.shape[0]:
+            increment[:counts.shape[0]] += counts
+            counts = increment
+        else:
+            counts[:increment.shape[0]] += increment
+    return counts
+
+def _degree_summary(degrees):
+    """
+    Summary of degree distribution of the users or items who have at least one rate
+    """
+    nonzero = degrees[degrees > 0]
+    if nonzero.shape[0] == 0:
+        return {'min': 0, 'max': 0, 'mean': 0.0, 'median': 0.0, 'percentiles': {}, 'gini': 0.0,
+                'top20_share': 0.0, 'histogram': {'edges': [], 'counts': []}}
+    percentiles = [1, 5, 25, 50, 75, 95, 99]
+    values = np.percentile(nonzero, percentiles)
+    return {
+        'min': int(nonzero.min()),
+        'max': int(nonzero.max()),
+        'mean': float(nonzero.mean()),
+        'median': float(np.median(nonzero)),
+        'percentiles': {str(p): float(v) for p, v in zip(percentiles, values)},
+        'gini': gini(nonzero),
+        'top20_share': top_share(nonzero, 0.2),
+        'histogram': _log_histogram(nonzero)
+    }
+
+def _summarize(user_degrees, item_degrees, rate_hist, time_min, time_max, time_count, n_users, n_items):
+    nnz = int(user_degrees.sum(dtype=np.int64))
+    rated_users = np.flatnonzero(user_degrees)
+    rated_items = np.flatnonzero(item_degrees)
+    n_unique_users = rated_users.shape[0]
+    n_unique_items = rated_items.shape[0]
+    if nnz > 0:
+        # same definition with builder/data_descriptor.describe_stats
+        sparsity = 1 - nnz / ((rated_users.max() + 1) * (rated_items.max() + 1))
+        sparsity_compacted = 1 - nnz / (n_unique_users * n_unique_items)
+    else:
+        sparsity, sparsity_compacted = 1.0, 1.0
+    stats = {
+        'n_users': int(n_users),
+        'n_items': int(n_items),
+        'n_unique_users': int(n_unique_users),
+        'n_unique_items': int(n_unique_items),
+        'nnz': nnz,
+        'sparsity': float(sparsity),
+        'sparsity_compacted': float(sparsity_compacted),
+        'user_degree': _degree_summary(user_degrees),
+        'item_degree': _degree_summary(item_degrees),
+        'rate_histogram': {str(r): int(c) for r, c in enumerate(rate_hist) if c > 0},
+    }
+    if time_count > 0:
+        stats['time'] = {
+            'min': int(time_min),
+            'max': int(time_max),
+            'span_days': float((time_max - time_min) / 86400)
+        }
+    return stats
+
+def describe(rates, timestamps=None):
+    """
+    Compute dataset statistics in O(nnz) without copying the matrix.
+    Memory is proportional to the number of users and items
+
+    Arguments
+    ---------
+    rates : scipy.sparse.csr_matrix
+        (user, item) = rate
+    timestamps : numpy.ndarray or None
+        UNIX time, corresponding rates.data
+
+    Returns
+    -------
+    stats : dict
+        JSON serializable statistics. Degree distributions of users and items, sparsity,
+        rate histogram, time span and Gini / top 20% share of degrees.
+        Degree histograms have power-of-two bins: {'edges': [1, 2, 4, ...], 'counts': [...]}
+
+    Usage
+    -----
+        >>> import json
+        >>> from kmr_dataset import load_rates
+        >>> from kmr_dataset.stats import describe
+        >>> rates, timestamps = load_rates(size='small')
+        >>> stats = describe(rates, timestamps)
+        >>> stats['n_unique_items'], stats['sparsity_compacted']
+        $ (600, 0.9956968363189052)
+        >>> json.dumps(stats)
+    """
+    n_users, n_items = rates.shape
+    user_degrees = np.diff(rates.indptr)
+    item_degrees = np.bincount(rates.indices, minlength=n_items)
+    rate_hist = _bincount(rates.data)
+    if timestamps is not None and len(timestamps) > 0:
+        time_min, time_max, time_count = np.min(timestamps), np.max(timestamps), len(timestamps)
+    else:
+        time_min, time_max, time_count = 0, 0, 0
+    return _summarize(user_degrees, item_degrees, rate_hist, time_min, time_max, time_count, n_users, n_items)
+
+
+class StatsAccumulator:
+    """
+    Streaming statistics over record batches of ``iter_rates``.
+    Memory is proportional to the number of users and items, not the number of rates.
+    Duplicated (user, movie) rows are counted as they appear in the file
+
+    Usage
+    -----
+        >>> from kmr_dataset import iter_rates
+        >>> from kmr_dataset.stats import StatsAccumulator
+        >>> accumulator = StatsAccumulator()
+        >>> for batch in iter_rates(size='5m'):
+        >>>     accumulator.update(batch)
+        >>> stats = accumulator.result()
+    """
+    def __init__(self):
+        self.user_degrees = np.zeros(0, dtype=np.int64)
+        self.item_degrees = np.zeros(0, dtype=np.int64)
+        self.rate_hist = np.zeros(0, dtype=np.int64)
+        self.time_min = None
+        self.time_max = None
+        self.time_count = 0
+
+    @staticmethod
+    def _add(counts, values):
+        if values.shape[0] == 0:
+            return counts
+        increment = np.bincount(values, minlength=counts.shape[0])
+        if increment.shape[0] > counts.shape[0]:
+            counts = np.concatenate([counts, np.zeros(increment.shape[0] - counts.shape[0], dtype=np.int64)])
+        counts += increment
+        return counts
+
+    def update(self, batch):
+        """
+        Arguments
+        ---------
+        batch : numpy.ndarray
+            Record array of which fields are `user`, `movie`, `rate` and `time`
+        """
+        self.user_degrees = self._add(self.user_degrees, batch['user'])
+        self.item_degrees = self._add(self.item_degrees, batch['movie'])
+        self.rate_hist = self._add(self.rate_hist, batch['rate'])
+        if batch.shape[0] > 0:
+            tmin, tmax = int(batch['time'].min()), int(batch['time'].max())
+            self.time_min = tmin if self.time_min is None else min(self.time_min, tmin)
+            self.time_max = tmax if self.time_max is None else max(self.time_max, tmax)
+            self.time_count += batch.shape[0]
+        return self
+
+    def result(self):
+        """
+        Returns
+        -------
+        stats : dict
+            Same format with ``describe``
+        """
+        return _summarize(self.user_degrees, self.item_degrees, self.rate_hist,
+            self.time_min, self.time_max, self.time_count,
+            self.user_degrees.shape[0], self.item_degrees.shape[0])
+
+
+def describe_stream(batches):
+    """
+    Arguments
+    ---------
+    batches : iterable of numpy.ndarray
+        Record batches, for example ``iter_rates(size='5m')``
+
+    Returns
+    -------
+    stats : dict
+        Same format with ``describe``
+    """
+    accumulator = StatsAccumulator()
+    for batch in batches:
+        accumulator.update(batch)
+    return accumulator.result()
@@ -0,0 +1,409 @@
+import mmap
+import numpy as np
+from .blocks import _iter_blocks
+from .cache import load_arrays
+from .cache import open_entry
+from .cache import save_arrays
+
+
+INDEX_NAMES = ('users', 'indptr', 'movies', 'rates', 'offsets', 'lengths')
+
+def _parse_int_fields(buf, begins, ends):
+    """
+    Parse non-negative integer fields ``buf[begins[i]:ends[i]]`` at once
+    """
+    lengths = ends - begins
+    values = np.zeros(begins.shape[0], dtype=np.int64)
+    if begins.shape[0] == 0:
+        return values
+    if lengths.min() <= 0 or lengths.max() > 18:
+        raise ValueError('user, movie and rate columns of texts file must be non-negative integer')
+    for k in range(int(lengths.max())):
+        valid = lengths > k
+        digit = buf[np.where(valid, begins + k, 0)].astype(np.int64) - ord('0')
+        if np.any(valid & ((digit < 0) | (digit > 9))):
+            raise ValueError('user, movie and rate columns of texts file must be non-negative integer')
+        values = np.where(valid, values * 10 + digit, values)
+    return values
+
+def _index_block(buf, offset):
+    """
+    Arguments
+    ---------
+    buf : numpy.ndarray
+        uint8 array of `user\\tmovie\\trate\\ttext` lines. The last line may not have newline
+    offset : int
+        Byte offset of ``buf`` in the file
+
+    Returns
+    -------
+    users, movies, rates : numpy.ndarray
+        int64 arrays
+    text_begins, text_ends : numpy.ndarray
+        Byte offsets of text column in the file
+    """
+    line_ends = np.flatnonzero(buf == ord('\n'))
+    if line_ends.shape[0] == 0 or line_ends[-1] != buf.shape[0] - 1:
+        line_ends = np.append(line_ends, buf.shape[0])
+    line_begins = np.empty_like(line_ends)
+    line_begins[0] = 0
+    line_begins[1:] = line_ends[:-1] + 1
+    is_cr = (line_ends > line_begins) & (buf[np.maximum(line_ends - 1, 0)] == ord('\r'))
+    line_ends = line_ends - is_cr
+    nonblank = line_ends > line_begins
+    line_begins, line_ends = line_begins[nonblank], line_ends[nonblank]
+
+    # texts may have tab, so only the first three tabs of each line are separators
+    tabs = np.flatnonzero(buf == ord('\t'))
+    first = np.searchsorted(tabs, line_begins)
+    if np.any(first + 3 > tabs.shape[0]) or np.any(tabs[np.minimum(first + 2, tabs.shape[0] - 1)] >= line_ends):
+        raise ValueError('Rows of texts file must have 4 columns: user, movie, rate, text')
+    seps = tabs[first[:, None] + np.arange(3)]
+    users = _parse_int_fields(buf, line_begins, seps[:, 0])
+    movies = _parse_int_fields(buf, seps[:, 0] + 1, seps[:, 1])
+    rates = _parse_int_fields(buf, seps[:, 1] + 1, seps[:, 2])
+    return users, movies, rates, seps[:, 2] + 1 + offset, line_ends + offset
+
+def _lower_bound(values, lo, hi, queries):
+    """
+    Vectorized binary search. For each i, it returns the first position p in [lo[i], hi[i])
+    of which ``values[p] >= queries[i]``, or hi[i] if there is no such position
+    """
+    lo, hi = lo.copy(), hi.copy()
+    while True:
+        active = lo < hi
+        if not active.any():
+            return lo
+        mid = (lo + hi) // 2
+        go_right = active & (values[np.where(active, mid, 0)] < queries)
+        lo = np.where(go_right, mid + 1, lo)
+        hi = np.where(active & ~go_right, mid, hi)
+
+
+class TextStore:
+    """
+    Random access store of review texts, `texts.txt` made by the builder
+
+        user    movie    rate    text
+        0       10003    7       ...
+
+    The file is indexed once: the rows are sorted by (user, movie), and only the keys
+    and the byte range of each text are stored. Texts are read through ``mmap`` on demand,
+    so memory usage does not depend on the size of texts.
+    Text of ``users[i]`` are stored in ``offsets[indptr[i]:indptr[i+1]]``, in order of movie
+
+    Arguments
+    ---------
+    path : str
+        Texts file path
+    users : numpy.ndarray
+        Sorted unique user indices
+    indptr : numpy.ndarray
+        Offsets of each user's rows. Its length is ``len(users) + 1``
+    movies : numpy.ndarray
+        Movie indices
+    rates : numpy.ndarray
+        Rates
+    offsets : numpy.ndarray
+        Byte offset of each text in the file
+    lengths : numpy.ndarray
+        Byte length of each text
+
+    Usage
+    -----
+        >>> store = TextStore.build('kmrd-2m/texts.txt')
+        >>> store.get(0)
+        $ [(10003, 7, '...'), (10004, 7, '...'), ...]
+        >>> store.get(0, 10003)
+        $ ['...']
+        >>> store.get_many([0, 5, 7])
+        >>> store.get_pairs([0, 5], [10003, 10004])
+        >>> for texts in store.iter_texts(chunksize=10000):
+        >>>     # preprocess texts
+    """
+    def __init__(self, path, users, indptr, movies, rates, offsets, lengths):
+        self.path = path
+        self.users = users
+        self.indptr = indptr
+        self.movies = movies
+        self.rates = rates
+        self.offsets = offsets
+        self.lengths = lengths
+        n_users = users.shape[0]
+        self._contiguous = (n_users == 0) or (users[0] == 0 and users[-1] == n_users - 1)
+        self._file = None
+        self._mm = None
+
+    @classmethod
+    def build(cls, path, block_size=1 << 24):
+        """
+        Index texts file. It scans the file in blocks of ``block_size`` bytes
+
+        Arguments
+        ---------
+        path : str
+            Texts file path. The first line is header
+        block_size : int
+            Bytes of block to index at once
+
+        Returns
+        -------
+        store : TextStore
+        """
+        columns = ([], [], [], [], [])
+        with open(path, 'rb') as f:
+            f.readline()
+            begin = f.tell()
+            size = f.seek(0, 2)
+            if size > begin:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    buf = np.frombuffer(mm, dtype=np.uint8)
+                    while begin < size:
+                        end = min(begin + block_size, size)
+                        if end < size:
+                            newline = mm.rfind(b'\n', begin, end)
+                            end = newline + 1 if newline >= 0 else mm.find(b'\n', end) + 1 or size
+                        for column, values in zip(columns, _index_block(buf[begin:end], begin)):
+                            column.append(values)
+                        begin = end
+                    del buf
+        users, movies, rates, begins, ends = (
+            np.concatenate(column) if column else np.zeros(0, dtype=np.int64) for column in columns)
+
+        order = np.lexsort((movies, users))
+        users, movies, rates = users[order], movies[order], rates[order]
+        unique_users, counts = np.unique(users, return_counts=True)
+        indptr = np.zeros(unique_users.shape[0] + 1, dtype=np.int64)
+        np.cumsum(counts, out=indptr[1:])
+        return cls(path, unique_users, indptr, movies.astype(np.int32), rates.astype(np.int32),
+                   begins[order], (ends - begins)[order].astype(np.int32))
+
+    @classmethod
+    def open(cls, path, cache=True, cache_dir=None):
+        """
+        Load the index from cache, or build and cache it.
+        The cached index is loaded as ``numpy.memmap``
+
+        Arguments
+        ---------
+        path : str
+            Texts file path
+        cache : Boolean
+            If True, use binary cache of the index. See ``kmr_dataset.cache``
+        cache_dir : str or None
+            Cache directory
+
+        Returns
+        -------
+        store : TextStore
+        """
+        entry = open_entry(path, cache_dir) if cache else None
+        arrays = load_arrays(entry, INDEX_NAMES, mmap_mode='r')
+        if arrays is not None:
+            return cls(path, *arrays)
+        store = cls.build(path)
+        save_arrays(entry, store.arrays())
+        return store
+
+    def arrays(self):
+        """
+        Returns
+        -------
+        arrays : dict of numpy.ndarray
+            Index arrays
+        """
+        return {name: getattr(self, name) for name in INDEX_NAMES}
+
+    def __len__(self):
+        return self.offsets.shape[0]
+
+    def __repr__(self):
+        return f'TextStore(#users={self.users.shape[0]}, #texts={len(self)})'
+
+    def __contains__(self, user):
+        return self._position(user) >= 0
+
+    def __getstate__(self):
+        # mmap is not picklable. It is reopened in the other process
+        state = self.__dict__.copy()
+        state['_file'], state['_mm'] = None, None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._file.close()
+        self._file, self._mm = None, None
+
+    @property
+    def _buffer(self):
+        if self._mm is None:
+            self._file = open(self.path, 'rb')
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mm
+
+    def _position(self, user):
+        try:
+            user = int(user)
+        except (TypeError, ValueError):
+            return -1
+        if self._contiguous:
+            return user if 0 <= user < self.users.shape[0] else -1
+        i = np.searchsorted(self.users, user)
+        if i < self.users.shape[0] and self.users[i] == user:
+            return int(i)
+        return -1
+
+    def _positions(self, users):
+        users = np.asarray(users, dtype=np.int64)
+        n_users = self.users.shape[0]
+        if self._contiguous:
+            return np.where((users >= 0) & (users < n_users), users, -1)
+        positions = np.minimum(np.searchsorted(self.users, users), max(n_users - 1, 0))
+        found = (n_users > 0) & (self.users[positions] == users)
+        return np.where(found, positions, -1)
+
+    def _read(self, rows):
+        """
+        Read texts of rows. Rows are read in order of file offset to access mmap sequentially
+        """
+        mm = self._buffer
+        rows = np.asarray(rows, dtype=np.int64)
+        offsets, lengths = self.offsets[rows], self.lengths[rows]
+        order = np.argsort(offsets, kind='stable')
+        texts = [None] * rows.shape[0]
+        for i, begin, length in zip(order.tolist(), offsets[order].tolist(), lengths[order].tolist()):
+            texts[i] = mm[begin: begin + length].decode('utf-8')
+        return texts
+
+    def get(self, user, movie=None):
+        """
+        Arguments
+        ---------
+        user : int
+            User index
+        movie : int or None
+            Movie index
+
+        Returns
+        -------
+        rows : list
+            If ``movie`` is None, [(movie, rate, text), ...] of the user in order of movie.
+            Else, texts of the (user, movie) pair. A user may comment to a movie more than once.
+            It returns empty list if there is no text
+        """
+        i = self._position(user)
+        if i < 0:
+            return []
+        b, e = int(self.indptr[i]), int(self.indptr[i + 1])
+        if movie is not None:
+            movies = self.movies[b:e]
+            b, e = b + np.searchsorted(movies, movie, side='left'), b + np.searchsorted(movies, movie, side='right')
+        rows = np.arange(b, e)
+        if movie is not None:
+            return self._read(rows)
+        return list(zip(self.movies[rows].tolist(), self.rates[rows].tolist(), self._read(rows)))
+
+    def get_many(self, users):
+        """
+        Arguments
+        ---------
+        users : list of int
+            User indices
+
+        Returns
+        -------
+        rows : list of list
+            [(movie, rate, text), ...] of each user. See ``get``
+        """
+        positions = self._positions(users)
+        found = positions >= 0
+        begins = np.where(found, self.indptr[np.maximum(positions, 0)], 0)
+        counts = np.where(found, self.indptr[np.maximum(positions, 0) + 1] - begins, 0)
+        total = int(counts.sum())
+        ends = np.cumsum(counts)
+        rows = np.repeat(begins - ends + counts, counts) + np.arange(total)
+        texts = self._read(rows)
+        movies, rates = self.movies[rows].tolist(), self.rates[rows].tolist()
+        triples = list(zip(movies, rates, texts))
+        return [triples[e - c: e] for e, c in zip(ends.tolist(), counts.tolist())]
+
+    def get_pairs(self, users, movies):
+        """
+        Arguments
+        ---------
+        users : list of int
+            User indices
+        movies : list of int
+            Movie indices of same length with ``users``
+
+        Returns
+        -------
+        texts : list of str or None
+            First text of each (user, movie) pair. None if the pair does not exist
+        """
+        movies = np.asarray(movies, dtype=np.int64)
+        positions = self._positions(users)
+        found = positions >= 0
+        lo = np.where(found, self.indptr[np.maximum(positions, 0)], 0)
+        hi = np.where(found, self.indptr[np.maximum(positions, 0) + 1], 0)
+        rows = _lower_bound(self.movies, lo, hi, movies)
+        found = (rows < hi) & (self.movies[np.minimum(rows, max(len(self) - 1, 0))] == movies)
+        texts = [None] * movies.shape[0]
+        found_idxs = np.flatnonzero(found)
+        for i, text in zip(found_idxs.tolist(), self._read(rows[found_idxs])):
+            texts[i] = text
+        return texts
+
+    def iter_texts(self, chunksize=10000, keys=False, block_size=1 << 22):
+        """
+        Stream texts in file order without index nor mmap
+
+        Arguments
+        ---------
+        chunksize : int
+            Number of texts of each chunk
+        keys : Boolean
+            If True, yield (users, movies, rates, texts) of which first three are numpy.ndarray
+        block_size : int
+            Bytes to read at once
+
+        Yields
+        ------
+        texts : list of str
+        """
+        columns = ([], [], [], [])
+
+        def flush():
+            texts = columns[3][:]
+            if not keys:
+                chunk = texts
+            else:
+                chunk = tuple(np.asarray(c, dtype=np.int64) for c in columns[:3]) + (texts,)
+            for column in columns:
+                column.clear()
+            return chunk
+
+        with open(self.path, 'rb') as f:
+            f.readline()
+            for block in _iter_blocks(f, block_size):
+                for line in block.split(b'\n'):
+                    line = line.rstrip(b'\r')
+                    if not line:
+                        continue
+                    user, movie, rate, text = line.split(b'\t', 3)
+                    if keys:
+                        columns[0].append(int(user))
+                        columns[1].append(int(movie))
+                        columns[2].append(int(rate))
+                    columns[3].append(text.decode('utf-8'))
+                    if len(columns[3]) >= chunksize:
+                        yield flush()
+        if columns[3]:
+            yield flush()
@@ -0,0 +1,29 @@
+import os
+import shutil
+import sys
+import zipfile
+import pytest
+
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# builder scripts import each other as flat modules
+sys.path.insert(0, f'{root}/builder')
+sys.path.insert(0, root)
+
+small_dir = f'{root}/kmr_dataset/datafile/kmrd-small'
+
+@pytest.fixture
+def zipped_directory(tmp_path):
+    """
+    Data directory of which `kmrd` has only zip archives, made from KMRD-small
+    """
+    directory = tmp_path / 'data'
+    large_dir = directory / 'datafile/kmrd'
+    large_dir.mkdir(parents=True)
+    shutil.copytree(small_dir, directory / 'datafile/kmrd-small')
+    with zipfile.ZipFile(large_dir / 'rates-2m.zip', 'w') as zf:
+        zf.write(f'{small_dir}/rates.csv', 'rates-2m.csv')
+    with zipfile.ZipFile(large_dir / 'meta.zip', 'w') as zf:
+        for name in 'castings.csv countries.csv genres.csv movies.txt peoples.txt'.split():
+            zf.write(f'{small_dir}/{name}', name)
+    return directory
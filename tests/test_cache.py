@@ -0,0 +1,32 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from kmr_dataset.cache import load_arrays
+from kmr_dataset.cache import open_entry
+from kmr_dataset.cache import save_arrays
+
+
+def _open_and_save(source, cache_dir, value):
+    entry = open_entry(source, cache_dir)
+    saved = save_arrays(entry, {'values': np.full(1000, value)})
+    return entry, saved, load_arrays(entry, ['values']) is not None
+
+def test_open_entry_reuses_valid_entry(tmp_path):
+    source = tmp_path / 'rates.csv'
+    source.write_text('user,movie,rate,time\n0,1,2,3\n')
+    entry = open_entry(str(source), str(tmp_path / 'cache'))
+    save_arrays(entry, {'values': np.arange(3)})
+    assert open_entry(str(source), str(tmp_path / 'cache')) == entry
+    assert load_arrays(entry, ['values'])[0].tolist() == [0, 1, 2]
+
+    source.write_text('user,movie,rate,time\n0,1,2,4\n')
+    assert open_entry(str(source), str(tmp_path / 'cache')) == entry
+    assert load_arrays(entry, ['values']) is None
+
+def test_open_entry_concurrently(tmp_path):
+    source = tmp_path / 'rates.csv'
+    source.write_text('user,movie,rate,time\n0,1,2,3\n')
+    cache_dir = str(tmp_path / 'cache')
+    with ProcessPoolExecutor(4) as executor:
+        results = list(executor.map(_open_and_save, [str(source)] * 16, [cache_dir] * 16, range(16)))
+    assert len({entry for entry, _, _ in results}) == 1
+    assert all(saved and loaded for _, saved, loaded in results)
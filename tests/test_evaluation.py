@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from scipy.sparse import random as sparse_random
+from kmr_dataset.evaluation import evaluate
+from kmr_dataset.evaluation import top_k
+
+
+def test_top_k():
+    rng = np.random.default_rng(0)
+    block = rng.random((30, 50))
+    block[block < 0.3] = -np.inf
+    items, valid = top_k(block, 10)
+    for row, row_items, row_valid in zip(block, items, valid):
+        expected = np.argsort(-row, kind='stable')[:10]
+        assert np.array_equal(row[row_items][row_valid], row[expected][row[expected] > -np.inf])
+        assert np.array_equal(row_valid, row[expected] > -np.inf)
+    # k larger than the number of items
+    items, valid = top_k(block[:2, :5], 10)
+    assert items.shape == (2, 5)
+
+def brute_force(train, test, scores, k, mask_seen):
+    metrics = {'recall': [], 'precision': [], 'ndcg': [], 'map': []}
+    recommended = np.zeros(train.shape[1], dtype=np.int64)
+    users = np.flatnonzero(np.diff(test.indptr))
+    for user in users:
+        row = scores[user].astype(np.float64).copy()
+        if mask_seen:
+            row[train[user].indices] = -np.inf
+        ranked = [item for item in np.argsort(-row, kind='stable')[:k] if row[item] > -np.inf]
+        recommended[ranked] += 1
+        relevant = set(test[user].indices.tolist())
+        hits = [item in relevant for item in ranked]
+        n_hits = sum(hits)
+        length = min(k, train.shape[1])
+        ideal = sum(1 / np.log2(i + 2) for i in range(min(len(relevant), length)))
+        metrics['recall'].append(n_hits / len(relevant))
+        metrics['precision'].append(n_hits / k)
+        metrics['ndcg'].append(sum(1 / np.log2(i + 2) for i, hit in enumerate(hits) if hit) / ideal)
+        precisions = np.cumsum(hits) / np.arange(1, len(hits) + 1)
+        metrics['map'].append(sum(p for p, hit in zip(precisions, hits) if hit) / min(len(relevant), k))
+    return {name: float(np.mean(values)) for name, values in metrics.items()}, recommended
+
+@pytest.mark.parametrize('mask_seen', [True, False])
+def test_evaluate_against_brute_force(mask_seen):
+    rng = np.random.default_rng(1)
+    train = sparse_random(40, 60, density=0.2, format='csr', random_state=2)
+    test = sparse_random(40, 60, density=0.05, format='csr', random_state=3)
+    test = test - test.multiply(train != 0)
+    test.eliminate_zeros()
+    scores = rng.random((40, 60))
+    expected, recommended = brute_force(train, test, scores, 10, mask_seen)
+
+    for n_jobs, block_size in [(1, None), (2, 7)]:
+        result, per_user = evaluate(train, test, lambda users: scores[users], k=10, mask_seen=mask_seen,
+            block_size=block_size, n_jobs=n_jobs, return_per_user=True)
+        for name, value in expected.items():
+            assert result[name] == pytest.approx(value)
+        assert result['n_users'] == np.count_nonzero(np.diff(test.indptr))
+        assert np.array_equal(per_user['user'], np.flatnonzero(np.diff(test.indptr)))
+        assert result['coverage'] == pytest.approx((recommended > 0).mean())
+        popularity = np.bincount(train.indices, minlength=60)
+        assert result['popularity'] == pytest.approx(recommended @ popularity / recommended.sum() / popularity.mean())
+
+    # score matrix instead of callable
+    assert evaluate(train, test, scores, k=10, mask_seen=mask_seen)['ndcg'] == pytest.approx(expected['ndcg'])
+
+def test_evaluate_errors():
+    train = sparse_random(4, 6, density=0.5, format='csr', random_state=0)
+    with pytest.raises(ValueError):
+        evaluate(train, train[:3], np.zeros((4, 6)))
+    with pytest.raises(ValueError):
+        evaluate(train, train, np.zeros((4, 5)))
+    with pytest.raises(ValueError):
+        evaluate(train, train, np.zeros((4, 6)), k=0)
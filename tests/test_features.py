@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+from kmr_dataset import load_item_features
+from kmr_dataset import load_meta
+from kmr_dataset import load_rates
+from kmr_dataset.features import item_features
+
+
+def test_item_features_follow_rate_columns(tmp_path):
+    cache_dir = str(tmp_path)
+    meta = load_meta(cache_dir=cache_dir)
+    for compact in [False, True]:
+        rates, _, *maps = load_rates(cache_dir=cache_dir, compact=compact)
+        movie_ids = maps[1].ids if compact else np.arange(rates.shape[1])
+        matrices, names = load_item_features(compact=compact, features=('genre', 'country', 'actor'), cache_dir=cache_dir)
+        index = meta.movie_map.transform(movie_ids)
+        known = np.flatnonzero(index >= 0)
+        assert known.shape[0] > 0
+        for name, attribute in [('genre', 'genres'), ('country', 'countries'), ('actor', 'castings')]:
+            matrix, source = matrices[name], getattr(meta, attribute)
+            assert matrix.shape == (rates.shape[1], source.shape[1])
+            # unknown movies have no feature
+            assert matrix[index < 0].nnz == 0
+            assert ((matrix[known] != 0) != (source[index[known]] != 0)).nnz == 0
+        assert list(names['genre']) == list(meta.genre_names)
+        assert np.array_equal(names['actor'], meta.people_map.ids)
+
+def test_actor_weights():
+    meta = load_meta()
+    i = meta.movie_map.index[10001]
+    matrices, _ = item_features(meta, [10001, -1], ('actor',), leading_weight=2.0, order_decay=0.5, max_order=3)
+    actor = matrices['actor']
+    assert actor.shape[0] == 2 and actor[1].nnz == 0
+
+    begin, end = meta.castings.indptr[i], meta.castings.indptr[i + 1]
+    expected = {}
+    for people, order, leading in zip(meta.castings.indices[begin:end], meta.casting_orders[begin:end],
+                                      meta.casting_leadings[begin:end]):
+        if order > 3:
+            continue
+        weight = (2.0 if leading else 1.0) * (0.5 ** (order - 1) if order > 0 else 1.0)
+        expected[int(people)] = weight
+    row = actor[0]
+    assert dict(zip(row.indices.tolist(), row.data.tolist())) == pytest.approx(expected)
+
+def test_item_features_errors():
+    meta = load_meta()
+    with pytest.raises(ValueError):
+        item_features(meta, [10001], ('director',))
+    with pytest.raises(ValueError):
+        item_features(meta, [10001], ('writer',))
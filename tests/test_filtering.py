@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from collections import Counter
+from kmr_dataset import load_rates
+from kmr_dataset.filtering import filter_heavy_users
+from kmr_dataset.filtering import filter_min_count
+from kmr_dataset.filtering import filter_time_window
+from kmr_dataset.filtering import k_core
+
+
+@pytest.fixture(scope='module')
+def small():
+    return load_rates(cache=False)
+
+def elements(rates, timestamps, user_map=None, item_map=None):
+    """
+    {(user id, item id): (rate, timestamp)}
+    """
+    coo = rates.tocoo()
+    order = np.lexsort((coo.col, coo.row))
+    # csr elements are in (row, col) order, same with timestamps
+    assert np.array_equal(order, np.arange(coo.nnz))
+    users = coo.row if user_map is None else user_map.ids[coo.row]
+    items = coo.col if item_map is None else item_map.ids[coo.col]
+    return {(int(u), int(i)): (int(r), int(t)) for u, i, r, t in zip(users, items, coo.data, timestamps)}
+
+def brute_force_k_core(pairs, k_user, k_item):
+    pairs = set(pairs)
+    while True:
+        users = Counter(u for u, _ in pairs)
+        items = Counter(i for _, i in pairs)
+        kept = {(u, i) for u, i in pairs if users[u] >= k_user and items[i] >= k_item}
+        if kept == pairs:
+            return pairs
+        pairs = kept
+
+def test_k_core_fixed_point(small):
+    rates, timestamps = small
+    original = elements(rates, timestamps)
+    filtered, filtered_ts, user_map, item_map = k_core(rates, timestamps, 20, 30)
+    assert np.diff(filtered.indptr).min() >= 20
+    assert np.bincount(filtered.indices).min() >= 30
+    assert filtered.shape == (len(user_map), len(item_map))
+    result = elements(filtered, filtered_ts, user_map, item_map)
+    assert set(result) == brute_force_k_core(original, 20, 30)
+    assert all(original[key] == value for key, value in result.items())
+
+    # a k-core is a fixed point
+    again = k_core(filtered, filtered_ts, 20, 30, user_map=user_map, item_map=item_map)
+    assert elements(*again) == result
+
+def test_filter_min_count_is_one_pass(small):
+    rates, timestamps = small
+    users = np.diff(rates.indptr)
+    items = np.bincount(rates.indices, minlength=rates.shape[1])
+    filtered, filtered_ts, user_map, item_map = filter_min_count(rates, timestamps, 20, 30)
+    expected = {key: value for key, value in elements(rates, timestamps).items()
+                if users[key[0]] >= 20 and items[key[1]] >= 30}
+    assert elements(filtered, filtered_ts, user_map, item_map) == expected
+
+def test_filter_heavy_users_and_time_window(small):
+    rates, timestamps = small
+    counts = np.diff(rates.indptr)
+    filtered, _, user_map, _ = filter_heavy_users(rates, timestamps, max_count=100)
+    assert set(user_map.ids.tolist()) == set(np.flatnonzero((counts > 0) & (counts <= 100)).tolist())
+
+    n_users = np.count_nonzero(counts)
+    filtered, _, user_map, _ = filter_heavy_users(rates, timestamps, top_ratio=0.1)
+    assert len(user_map) == n_users - int(0.1 * n_users)
+    assert np.diff(filtered.indptr).max() <= np.sort(counts)[::-1][int(0.1 * n_users)]
+
+    begin, end = np.percentile(timestamps, [25, 75]).astype(np.int64)
+    filtered, filtered_ts, user_map, item_map = filter_time_window(rates, timestamps, begin, end)
+    expected = {key: value for key, value in elements(rates, timestamps).items() if begin <= value[1] < end}
+    assert elements(filtered, filtered_ts, user_map, item_map) == expected
@@ -0,0 +1,46 @@
+import numpy as np
+from kmr_dataset import load_histories
+from kmr_dataset import load_history_index
+from kmr_dataset.histories import HistoryIndex
+
+
+def test_history_index_matches_histories(tmp_path):
+    histories = load_histories(cache=False)
+    # small block size makes users continue over the boundary of blocks
+    index = load_history_index(cache_dir=str(tmp_path), block_size=1 << 12)
+    assert isinstance(index, HistoryIndex)
+    assert len(index) == len(histories) and list(index) == list(histories)
+    for user in histories:
+        assert index.get(user) == histories[user].tolist()
+
+    users = [0, -1, 5, len(histories) + 10, 5]
+    found = index.get_many(users)
+    assert found[1] is None and found[3] is None
+    for user, history in zip(users, found):
+        if history is not None:
+            assert history == histories[user]
+    assert index.get(-1) is None
+
+    # reopened from the stored arrays
+    reopened = load_history_index(cache_dir=str(tmp_path))
+    assert np.array_equal(reopened.indptr, index.indptr) and np.array_equal(reopened.movies, index.movies)
+
+def test_history_index_build(tmp_path):
+    # users 3 and 7 continue over the boundary of blocks, and users are not contiguous
+    blocks = [
+        (np.array([1, 3, 3]), np.array([10, 11, 12]), np.array([1, 2, 3]), np.array([100, 101, 102])),
+        (np.array([3, 7]), np.array([13, 14]), np.array([4, 5]), np.array([103, 104])),
+        (np.array([], dtype=np.int64),) * 4,
+        (np.array([7, 9]), np.array([15, 16]), np.array([6, 7]), np.array([105, 106])),
+    ]
+    for name in ('sorted', 'unsorted'):
+        (tmp_path / name).mkdir()
+    index = HistoryIndex.build(blocks, str(tmp_path / 'sorted'))
+    assert list(index) == [1, 3, 7, 9]
+    assert index.get(3) == [(11, 2, 101), (12, 3, 102), (13, 4, 103)]
+    assert index.get(7) == [(14, 5, 104), (15, 6, 105)]
+    assert index.get_many([2, 9]) == [None, [(16, 7, 106)]]
+
+    unsorted = [(np.array([3, 1]), np.array([10, 11]), np.array([1, 2]), np.array([100, 101]))]
+    assert HistoryIndex.build(unsorted, str(tmp_path / 'unsorted')) is None
+    assert HistoryIndex.open(str(tmp_path / 'unsorted')) is None
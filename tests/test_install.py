@@ -0,0 +1,29 @@
+import os
+from kmr_dataset import get_paths
+from kmr_dataset import load_meta
+from kmr_dataset import load_rates
+from kmr_dataset.install import unzip
+
+
+def test_unzip_returns_number_of_extracted_files(zipped_directory, tmp_path):
+    archive = str(zipped_directory / 'datafile/kmrd/meta.zip')
+    assert unzip(archive, str(tmp_path / 'out')) == 5
+    assert unzip(archive, str(tmp_path / 'out')) == 0
+
+def test_loaders_read_files_in_extract_dir(zipped_directory, tmp_path, capsys):
+    extract_dir = str(tmp_path / 'extracted')
+    paths = get_paths(str(zipped_directory), '2m', extract_dir=extract_dir)
+    assert all(path.startswith(extract_dir) for path in paths)
+    assert 'Unzipped' in capsys.readouterr().out
+    get_paths(str(zipped_directory), '2m', extract_dir=extract_dir)
+    assert 'Unzipped' not in capsys.readouterr().out
+
+    # remove the archive, then the loaders must read the extracted files
+    os.remove(zipped_directory / 'datafile/kmrd/rates-2m.zip')
+    os.remove(zipped_directory / 'datafile/kmrd/meta.zip')
+    cache_dir = str(tmp_path / 'cache')
+    rates, timestamps = load_rates(str(zipped_directory), '2m', cache_dir=cache_dir, extract_dir=extract_dir)
+    expected, _ = load_rates(str(zipped_directory), 'small', cache=False)
+    assert (rates != expected).nnz == 0
+    meta = load_meta(str(zipped_directory), '2m', cache_dir=cache_dir, extract_dir=extract_dir)
+    assert meta.titles.shape[0] > 0
@@ -0,0 +1,67 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from kmr_dataset import load_item_features
+from kmr_dataset import load_rates
+from kmr_dataset.io import _parse_rate_block
+from kmr_dataset.io import _read_rate_columns
+
+small_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'kmr_dataset/datafile/kmrd-small')
+
+
+def test_parse_rate_block():
+    users, movies, rates, timestamps = _parse_rate_block(b'0,10003,7,1494128040\r\n1,10004,10,1467529800\n\n')
+    assert users.tolist() == [0, 1]
+    assert movies.tolist() == [10003, 10004]
+    assert rates.tolist() == [7, 10]
+    assert timestamps.tolist() == [1494128040, 1467529800]
+    assert users.dtype == np.int32 and timestamps.dtype == np.int64
+
+@pytest.mark.parametrize('block', [
+    b'1,,3,4\n',
+    b'1,2,3,\n',
+    b'3000000000,2,3,4\n',
+    b'1,2,3,99999999999999999999\n',
+    b'1,2,a,4\n',
+    b'1,2,3\n',
+])
+def test_parse_rate_block_rejects_invalid_rows(block):
+    with pytest.raises(ValueError):
+        _parse_rate_block(block)
+
+def test_parallel_parsing_of_header_only_file(tmp_path):
+    path = tmp_path / 'rates.csv'
+    path.write_text('user,movie,rate,time\n')
+    serial = _read_rate_columns(str(path), n_jobs=1)
+    parallel = _read_rate_columns(str(path), n_jobs=2)
+    assert all(a.shape[0] == 0 and a.dtype == b.dtype for a, b in zip(serial, parallel))
+
+def test_parallel_loading_extracts_zip(zipped_directory, tmp_path):
+    extract_dir = tmp_path / 'extracted'
+    rates, timestamps = load_rates(str(zipped_directory), '2m', cache=False, n_jobs=2, extract_dir=str(extract_dir))
+    assert (extract_dir / 'rates-2m.csv').exists()
+    expected, expected_timestamps = load_rates(str(zipped_directory), 'small', cache=False)
+    assert (rates != expected).nnz == 0
+    assert np.array_equal(timestamps, expected_timestamps)
+
+def test_item_features_cache_follows_directings(tmp_path):
+    directory = tmp_path / 'datafile/kmrd-small'
+    shutil.copytree(small_dir, directory)
+    cache_dir = str(tmp_path / 'cache')
+    (directory / 'directings.csv').write_text('movie,people\n10001,4374\n')
+    matrices, _ = load_item_features(str(tmp_path), features=('director',), cache_dir=cache_dir)
+    assert matrices['director'].nnz == 1
+
+    (directory / 'directings.csv').write_text('movie,people\n10001,4374\n10002,178\n')
+    matrices, _ = load_item_features(str(tmp_path), features=('director',), cache_dir=cache_dir)
+    assert matrices['director'].nnz == 2
+
+def test_stale_columnar_rates_are_ignored(tmp_path):
+    directory = tmp_path / 'datafile/kmrd-small'
+    shutil.copytree(small_dir, directory)
+    np.savez(directory / 'rates.npz', user=np.array([0]), movie=np.array([10001]), rate=np.array([5]), time=np.array([1]))
+    assert load_rates(str(tmp_path), cache=False)[0].nnz == 1
+
+    os.utime(directory / 'rates.npz', (0, 0))
+    assert load_rates(str(tmp_path), cache=False)[0].nnz > 1
@@ -0,0 +1,139 @@
+import json
+import os
+import pytest
+from maker import DatasetWriter
+from maker import iter_parsed_shards
+from maker import load_comments
+from maker import load_comments_incremental
+from maker import make_rates
+
+
+def write_user_file(directory, user, n_comments, source=None):
+    # the file of a duplicated user has the comments of ``source``
+    source = user if source is None else source
+    comments = [{'idx': 100 * source + i, 'movie_idx': 10001 + i, 'score': (source + i) % 10 + 1,
+                 'written_at': f'17.0{i + 1}.1{source}', 'text': f'comment {source} {i}'}
+                for i in range(n_comments)]
+    path = directory / f'{1000 + user}'
+    path.write_text(''.join(json.dumps(comment) + '\n' for comment in comments))
+    return str(path)
+
+@pytest.fixture
+def user_paths(tmp_path):
+    directory = tmp_path / 'user_comments'
+    directory.mkdir()
+    return [write_user_file(directory, user, user % 3 + 1) for user in range(9)]
+
+def test_parallel_parsing_with_resume(user_paths, tmp_path):
+    serial = list(iter_parsed_shards(user_paths, n_jobs=1, shard_size=2))
+    assert len(serial) == 5
+    assert serial[0][0][0] == 1000 and serial[0][0][1][0][4] == 'comment 0 0'
+    assert list(iter_parsed_shards(user_paths, n_jobs=2, shard_size=2)) == serial
+
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    assert list(iter_parsed_shards(user_paths, n_jobs=2, checkpoint_dir=checkpoint_dir, shard_size=2)) == serial
+    assert sorted(os.listdir(checkpoint_dir)) == [f'shard-{i:06}.pkl' for i in range(5)]
+
+    # resume with a missing and a stale checkpoint
+    os.remove(f'{checkpoint_dir}/shard-000001.pkl')
+    list(iter_parsed_shards(user_paths[:3], n_jobs=1, checkpoint_dir=checkpoint_dir, shard_size=2))
+    assert list(iter_parsed_shards(user_paths, n_jobs=2, checkpoint_dir=checkpoint_dir, shard_size=2)) == serial
+    assert list(iter_parsed_shards(user_paths, n_jobs=1, checkpoint_dir=checkpoint_dir, shard_size=2)) == serial
+
+def test_resume_after_file_change(user_paths, tmp_path):
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    list(iter_parsed_shards(user_paths, n_jobs=-1, checkpoint_dir=checkpoint_dir, shard_size=2))
+    # same size, different content
+    path = write_user_file(tmp_path / 'user_comments', 2, 3, source=5)
+    os.utime(path, ns=(0, 0))
+    expected = list(iter_parsed_shards(user_paths, n_jobs=1, shard_size=2))
+    assert expected[1][0][1][0][4] == 'comment 5 0'
+    assert list(iter_parsed_shards(user_paths, n_jobs=0, checkpoint_dir=checkpoint_dir, shard_size=2)) == expected
+    assert list(iter_parsed_shards(user_paths, n_jobs=1, checkpoint_dir=checkpoint_dir, shard_size=2)) == expected
+
+def test_incremental_loading(user_paths, tmp_path):
+    data_dir, state_dir = str(tmp_path), str(tmp_path / 'state')
+    expected = load_comments(data_dir, False)
+    assert load_comments_incremental(data_dir, False, state_dir, shard_size=2)[:2] == expected[:2]
+    assert len(os.listdir(f'{state_dir}/comments/run-000000')) == 5
+    # nothing changed
+    assert load_comments_incremental(data_dir, False, state_dir, n_jobs=2, shard_size=2)[:2] == expected[:2]
+    assert os.listdir(f'{state_dir}/comments') == ['run-000000']
+
+    # user 1000 has one more comment, user 1009 is new and user 1008 is removed
+    write_user_file(tmp_path / 'user_comments', 0, 4)
+    write_user_file(tmp_path / 'user_comments', 9, 2)
+    os.remove(user_paths[8])
+    data, users, _ = load_comments_incremental(data_dir, False, state_dir, shard_size=2)
+    assert users == [1000 + user for user in range(10)]
+    # user 1009 is the 9th user of a fresh build
+    fresh = [(9 if row[0] == 8 else row[0],) + row[1:] for row in load_comments(data_dir, False)[0]]
+    assert sorted(data) == sorted(fresh)
+    # shard of user 1000 and 1001 is referenced by user 1001 only. Shard of user 1008 is removed
+    assert sorted(os.listdir(f'{state_dir}/comments/run-000000')) == [f'shard-{i:06}.pkl' for i in range(4)]
+    assert os.listdir(f'{state_dir}/comments/run-000001') == ['shard-000000.pkl']
+
+def named_rows(data, users):
+    return sorted((users[row[0]],) + row[1:] for row in data)
+
+def test_incremental_loading_rechecks_duplicates(user_paths, tmp_path):
+    data_dir, state_dir = str(tmp_path), str(tmp_path / 'state')
+    directory = tmp_path / 'user_comments'
+    # user 1009 and 1010 are duplicates of user 1002
+    write_user_file(directory, 9, 3, source=2)
+    write_user_file(directory, 10, 3, source=2)
+    data, users, _ = load_comments_incremental(data_dir, False, state_dir, shard_size=2)
+    assert named_rows(data, users) == named_rows(*load_comments(data_dir, False)[:2])
+    assert {row[0] for row in data} == set(range(9))
+
+    # user 1009 is not a duplicate any more, and user 1010 becomes a duplicate of user 1009
+    write_user_file(directory, 2, 2)
+    data, users, _ = load_comments_incremental(data_dir, False, state_dir, shard_size=2)
+    assert named_rows(data, users) == named_rows(*load_comments(data_dir, False)[:2])
+    assert users[9] == 1009 and 9 in {row[0] for row in data}
+
+    # user 1010 is checked again when user 1009 is removed, and user 1003 becomes a duplicate of user 1001
+    os.remove(f'{directory}/1009')
+    write_user_file(directory, 3, 2, source=1)
+    data, users, _ = load_comments_incremental(data_dir, False, state_dir, shard_size=2)
+    assert named_rows(data, users) == named_rows(*load_comments(data_dir, False)[:2])
+    assert 1010 in users and 1003 not in {users[row[0]] for row in data}
+
+def read_dataset(directory):
+    with open(f'{directory}/userlist') as f:
+        userlist = [int(user) for user in f]
+    with open(f'{directory}/rates.csv') as f:
+        rows = [tuple(int(v) for v in line.split(',')) for line in f.read().splitlines()[1:]]
+    return userlist, rows
+
+@pytest.mark.parametrize('memory_budget', [None, 256])
+def test_incremental_build_keeps_published_users(user_paths, tmp_path, memory_budget):
+    data_dir, dataset_dir, state_dir = str(tmp_path), str(tmp_path / 'dataset'), str(tmp_path / 'state')
+    # user u has u % 3 + 1 rates. kmrd-0m is the filtered dataset of users with 3 rates
+    make_rates(data_dir, False, 3, dataset_dir, volume=10, state_dir=state_dir, memory_budget=memory_budget)
+    userlist, rows = read_dataset(f'{dataset_dir}/kmrd-1m')
+    assert sorted(userlist[:3]) == [2, 5, 8] and sorted(userlist) == list(range(9))
+    assert read_dataset(f'{dataset_dir}/kmrd-0m')[0] == userlist[:3]
+
+    # user 1000 has 5 rates, user 1009 is new, and user 1001 is removed
+    write_user_file(tmp_path / 'user_comments', 0, 5)
+    write_user_file(tmp_path / 'user_comments', 9, 1)
+    os.remove(user_paths[1])
+    make_rates(data_dir, False, 3, dataset_dir, volume=10, state_dir=state_dir, memory_budget=memory_budget)
+    new_userlist, new_rows = read_dataset(f'{dataset_dir}/kmrd-2m')
+    assert new_userlist == [u for u in userlist if u != 1] + [9]
+    assert len([row for row in new_rows if row[0] == new_userlist.index(0)]) == 5
+
+    # filtered users are in the order of full dataset
+    filtered_userlist, filtered_rows = read_dataset(f'{dataset_dir}/kmrd-1m')
+    assert filtered_userlist == [u for u in new_userlist if u in (0, 2, 5, 8)]
+    full = {(new_userlist[row[0]],) + row[1:] for row in new_rows}
+    filtered = {(filtered_userlist[row[0]],) + row[1:] for row in filtered_rows}
+    assert filtered == {row for row in full if row[0] in (0, 2, 5, 8)}
+    assert [row[0] for row in filtered_rows] == sorted(row[0] for row in filtered_rows)
+
+def test_dataset_writer_removes_stale_npz(tmp_path):
+    for columnar in [True, False]:
+        with DatasetWriter(str(tmp_path), 'kmrd-0m', [1000], columnar=columnar) as writer:
+            writer.write([0], [10001], [0], [10], [1500000000], ['text'])
+        assert os.path.exists(tmp_path / 'kmrd-0m/rates.npz') == columnar
@@ -0,0 +1,54 @@
+import csv
+import os
+import numpy as np
+from kmr_dataset import load_meta
+
+
+small_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'kmr_dataset/datafile/kmrd-small')
+
+
+def read_pairs(name):
+    with open(f'{small_dir}/{name}', encoding='utf-8') as f:
+        return [row for row in csv.reader(f)][1:]
+
+def matrix_pairs(matrix, row_names, col_names):
+    rows, cols = matrix.nonzero()
+    return {(int(row_names[r]), col_names[c]) for r, c in zip(rows, cols)}
+
+def test_meta_matrices_are_aligned(tmp_path):
+    meta = load_meta(cache_dir=str(tmp_path))
+    n_movies, n_peoples = len(meta.movie_map), len(meta.people_map)
+    assert meta.titles.shape == meta.years.shape == meta.grades.shape == (n_movies,)
+    assert meta.genres.shape == (n_movies, len(meta.genre_names))
+    assert meta.countries.shape == (n_movies, len(meta.country_names))
+    assert meta.castings.shape == meta.directings.shape == (n_movies, n_peoples)
+    assert meta.directings.nnz == 0
+    assert meta.casting_orders.shape == meta.casting_leadings.shape == (meta.castings.nnz,)
+
+    movie_ids = meta.movie_map.ids
+    assert matrix_pairs(meta.genres, movie_ids, meta.genre_names) == {(int(m), g) for m, g in read_pairs('genres.csv')}
+    assert matrix_pairs(meta.countries, movie_ids, meta.country_names) == {(int(m), c) for m, c in read_pairs('countries.csv')}
+
+    # credit order of each (movie, people) is the smallest one
+    orders = {}
+    for movie, people, order, leading in read_pairs('castings.csv'):
+        key = (int(movie), int(people))
+        orders[key] = min(orders.get(key, int(order)), int(order))
+    castings = meta.castings.tocoo()
+    found = {(int(movie_ids[r]), int(meta.people_map.ids[c])): int(o)
+             for r, c, o in zip(castings.row, castings.col, meta.casting_orders)}
+    assert found == orders
+
+    i = meta.movie_map.index[10001]
+    assert meta.titles[i] == '시네마 천국' and meta.years[i] == 2013
+    assert meta.grade_names[meta.grades[i]] == '전체 관람가'
+
+def test_meta_cache(tmp_path):
+    meta = load_meta(cache_dir=str(tmp_path))
+    cached = load_meta(cache_dir=str(tmp_path))
+    assert os.listdir(tmp_path)
+    for name in ('genres', 'countries', 'castings', 'directings'):
+        assert (getattr(meta, name) != getattr(cached, name)).nnz == 0
+    assert np.array_equal(meta.casting_orders, cached.casting_orders)
+    assert list(meta.titles) == list(cached.titles)
+    assert np.array_equal(meta.people_map.ids, cached.people_map.ids)
@@ -0,0 +1,32 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from kmr_dataset.sampling import BPRSampler
+from kmr_dataset.sampling import sample_negatives
+
+
+def make_rates():
+    rng = np.random.default_rng(0)
+    dense = (rng.random((20, 30)) < 0.3) * rng.integers(1, 11, size=(20, 30))
+    # user 0 rated all items but one
+    dense[0] = 5
+    dense[0, 7] = 0
+    return csr_matrix(dense)
+
+def test_sample_negatives_are_not_rated():
+    rates = make_rates()
+    users = np.arange(rates.shape[0])
+    negatives = sample_negatives(rates, users, n_negatives=4, seed=0)
+    assert negatives.shape == (20, 4)
+    assert (rates[np.repeat(users, 4), negatives.ravel()].A1 == 0).all()
+    assert (negatives[0] == 7).all()
+
+def test_bpr_sampler_ranks_cover_positives():
+    rates = make_rates()
+    pairs = []
+    for rank in range(2):
+        sampler = BPRSampler(rates, batch_size=16, seed=1, rank=rank, world_size=2)
+        for users, positives, negatives in sampler:
+            assert (rates[users, positives].A1 > 0).all()
+            assert (rates[users, negatives].A1 == 0).all()
+            pairs += list(zip(users.tolist(), positives.tolist()))
+    assert sorted(pairs) == sorted(zip(*rates.nonzero()))
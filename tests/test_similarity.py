@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+from scipy.sparse import random as sparse_random
+from kmr_dataset.similarity import ItemNeighbors
+from kmr_dataset.similarity import item_similarity
+
+
+def make_rates():
+    rates = sparse_random(60, 40, density=0.15, format='csr', random_state=0,
+        data_rvs=lambda n: np.random.default_rng(1).uniform(1, 10, n))
+    # empty columns have no neighbors
+    rates = rates.tolil()
+    rates[:, [3, 17]] = 0
+    return rates.tocsr()
+
+def dense_similarity(rates, measure, shrinkage, min_support):
+    dense = rates.toarray()
+    binary = (dense != 0).astype(np.float64)
+    support = binary.T @ binary
+    if measure == 'jaccard':
+        counts = binary.sum(axis=0)
+        union = counts[:, None] + counts[None, :] - support
+        similarity = np.divide(support, union, out=np.zeros_like(support), where=union > 0)
+    else:
+        if measure == 'pearson':
+            means = dense.sum(axis=0) / np.maximum(binary.sum(axis=0), 1)
+            dense = (dense - means) * binary
+        norms = np.linalg.norm(dense, axis=0)
+        similarity = dense.T @ dense
+        denominator = np.outer(norms, norms)
+        similarity = np.divide(similarity, denominator, out=np.zeros_like(similarity), where=denominator > 0)
+    if shrinkage > 0:
+        similarity *= support / (support + shrinkage)
+    similarity[support < min_support] = 0
+    np.fill_diagonal(similarity, 0)
+    return similarity
+
+@pytest.mark.parametrize('measure', ['cosine', 'jaccard', 'pearson'])
+@pytest.mark.parametrize('shrinkage, min_support', [(0, 1), (5, 1), (0, 3)])
+def test_item_similarity_against_dense(measure, shrinkage, min_support):
+    rates = make_rates()
+    expected = dense_similarity(rates, measure, shrinkage, min_support)
+    n_neighbors = 5
+    index = item_similarity(rates, measure, n_neighbors=n_neighbors, shrinkage=shrinkage, min_support=min_support)
+    assert len(index) == rates.shape[1]
+    assert index.neighbors.dtype == np.int32 and index.similarities.dtype == np.float32
+    for item in range(rates.shape[1]):
+        neighbors, similarities = index[item]
+        row = expected[item]
+        # ties may be broken in any order, so compare the similarity values
+        top = np.sort(row[row != 0])[::-1][:n_neighbors]
+        assert np.allclose(similarities, top, rtol=1e-5, atol=1e-6)
+        assert np.allclose(similarities, row[neighbors], rtol=1e-5, atol=1e-6)
+        assert item not in neighbors
+    assert len(index[3][0]) == len(index[17][0]) == 0
+
+def test_item_similarity_blocks_and_jobs():
+    rates = make_rates()
+    index = item_similarity(rates, 'pearson', n_neighbors=7, shrinkage=2)
+    for block_size, n_jobs in [(1, 1), (6, 2)]:
+        other = item_similarity(rates, 'pearson', n_neighbors=7, shrinkage=2, block_size=block_size, n_jobs=n_jobs)
+        assert np.array_equal(index.indptr, other.indptr)
+        assert np.array_equal(index.neighbors, other.neighbors)
+        assert np.array_equal(index.similarities, other.similarities)
+
+def test_item_neighbors_save_load(tmp_path):
+    rates = make_rates()
+    index = item_similarity(rates, 'cosine', n_neighbors=4)
+    index.save(str(tmp_path / 'item-knn'))
+    loaded = ItemNeighbors.load(str(tmp_path / 'item-knn'))
+    for name in ['indptr', 'neighbors', 'similarities']:
+        assert np.array_equal(getattr(index, name), getattr(loaded, name))
+    assert (index.to_csr() != loaded.to_csr()).nnz == 0
+    similarity = loaded.to_csr()
+    assert similarity.shape == (rates.shape[1], rates.shape[1])
+    neighbors, similarities = loaded[5]
+    row = np.zeros(rates.shape[1], dtype=np.float32)
+    row[neighbors] = similarities
+    assert np.array_equal(similarity[5].toarray().ravel(), row)
+    with pytest.raises(ValueError):
+        ItemNeighbors.load(str(tmp_path / 'missing'))
+
+def test_item_similarity_errors():
+    rates = make_rates()
+    with pytest.raises(ValueError):
+        item_similarity(rates, 'euclidean')
+    with pytest.raises(ValueError):
+        item_similarity(rates, n_neighbors=0)
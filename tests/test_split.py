@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from kmr_dataset import load_rates
+from kmr_dataset.split import leave_last_k_out
+from kmr_dataset.split import split_by_ratio
+from kmr_dataset.split import split_by_time
+
+
+@pytest.fixture(scope='module')
+def small():
+    return load_rates(cache=False)
+
+def timestamp_matrix(rates, timestamps):
+    return csr_matrix((np.asarray(timestamps, dtype=np.float64), rates.indices, rates.indptr), shape=rates.shape)
+
+def check_partition(rates, timestamps, train, train_ts, test, test_ts):
+    assert train.shape == test.shape == rates.shape
+    assert train.nnz + test.nnz == rates.nnz
+    # disjoint, and they cover the rates
+    assert train.multiply(test).nnz == 0
+    assert (train + test != rates).nnz == 0
+    # timestamps follow the elements
+    expected = timestamp_matrix(rates, timestamps)
+    assert (timestamp_matrix(train, train_ts) + timestamp_matrix(test, test_ts) != expected).nnz == 0
+
+def test_split_by_time(small):
+    rates, timestamps = small
+    cutoff = int(np.median(timestamps))
+    train, train_ts, test, test_ts = split_by_time(rates, timestamps, cutoff)
+    check_partition(rates, timestamps, train, train_ts, test, test_ts)
+    assert (train_ts < cutoff).all() and (test_ts >= cutoff).all()
+
+@pytest.mark.parametrize('k', [1, 3])
+def test_leave_last_k_out(small, k):
+    rates, timestamps = small
+    train, train_ts, test, test_ts = leave_last_k_out(rates, timestamps, k=k)
+    check_partition(rates, timestamps, train, train_ts, test, test_ts)
+    counts = np.diff(rates.indptr)
+    assert np.array_equal(np.diff(test.indptr), np.where(counts > k, k, 0))
+    # test rates are the latest rates of each user
+    latest_train = timestamp_matrix(train, train_ts).max(axis=1).toarray().ravel()
+    for user in np.flatnonzero(counts > k)[:200]:
+        assert test_ts[test.indptr[user]: test.indptr[user + 1]].min() >= latest_train[user]
+
+@pytest.mark.parametrize('by', ['time', 'random'])
+def test_split_by_ratio(small, by):
+    rates, timestamps = small
+    train, train_ts, test, test_ts = split_by_ratio(rates, timestamps, 0.3, by=by, seed=1)
+    check_partition(rates, timestamps, train, train_ts, test, test_ts)
+    assert np.array_equal(np.diff(test.indptr), np.floor(np.diff(rates.indptr) * 0.3))
+    again = split_by_ratio(rates, timestamps, 0.3, by=by, seed=1)
+    assert (again[2] != test).nnz == 0
+
+def test_split_errors(small):
+    rates, timestamps = small
+    with pytest.raises(ValueError):
+        split_by_ratio(rates, timestamps, 1.5)
+    with pytest.raises(ValueError):
+        split_by_ratio(rates, timestamps, 0.2, by='user')
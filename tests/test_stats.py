@@ -0,0 +1,26 @@
+import json
+import numpy as np
+from scipy.sparse import csr_matrix
+from kmr_dataset.stats import _bincount
+from kmr_dataset.stats import describe
+from kmr_dataset.stats import describe_stream
+
+
+def test_bincount_in_blocks():
+    values = np.random.default_rng(0).integers(0, 11, size=10001).astype(np.int8)
+    assert _bincount(values, block_size=100).tolist() == np.bincount(values).tolist()
+    assert _bincount(values[:0]).shape == (0,)
+
+def test_describe_degree_histogram():
+    # user degrees are 1, 2, 3 and 9
+    users = np.repeat(np.arange(4), [1, 2, 3, 9])
+    items = np.concatenate([np.arange(n) for n in [1, 2, 3, 9]])
+    rates = csr_matrix((np.full(users.shape[0], 10, dtype=np.int32), (users, items)))
+    timestamps = np.arange(users.shape[0])
+    stats = describe(rates, timestamps)
+    assert stats['user_degree']['histogram'] == {'edges': [1, 2, 4, 8, 16], 'counts': [1, 2, 0, 1]}
+    assert stats['rate_histogram'] == {'10': 15}
+    json.dumps(stats)
+
+    batch = np.rec.fromarrays([users, items, rates.data, timestamps], names='user,movie,rate,time')
+    assert describe_stream([batch[:7], batch[7:]]) == stats
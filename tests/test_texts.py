@@ -0,0 +1,23 @@
+import io
+from kmr_dataset.blocks import _iter_blocks
+from kmr_dataset.texts import TextStore
+
+
+def test_iter_blocks_end_at_line_boundary():
+    data = b'a,1\nbb,22\nccc,333\nlast'
+    blocks = list(_iter_blocks(io.BytesIO(data), block_size=5))
+    assert b''.join(blocks) == data
+    assert all(block.endswith(b'\n') for block in blocks[:-1])
+    assert list(_iter_blocks(io.BytesIO(data), block_size=5, n_bytes=10)) == [b'a,1\n', b'bb,22\n']
+
+def test_text_store(tmp_path):
+    path = tmp_path / 'texts.txt'
+    path.write_text('user\tmovie\trate\ttext\n0\t10001\t10\t최고\n0\t10003\t7\tgood\n2\t10001\t1\tbad\tworse\n',
+        encoding='utf-8')
+    with TextStore.build(str(path), block_size=8) as store:
+        assert store.get(0) == [(10001, 10, '최고'), (10003, 7, 'good')]
+        assert store.get(2, 10001) == ['bad\tworse']
+        assert store.get(1) == []
+        assert list(store.iter_texts(chunksize=2, block_size=8)) == [['최고', 'good'], ['bad\tworse']]
+        users, movies, rates, texts = next(store.iter_texts(keys=True))
+        assert users.tolist() == [0, 0, 2] and movies.tolist() == [10001, 10003, 10001]
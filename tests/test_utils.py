@@ -0,0 +1,25 @@
+import os
+import numpy as np
+from utils import BulkWriter
+
+
+def test_bulk_writer_npz(tmp_path):
+    path, npz_path = str(tmp_path / 'rates.csv'), str(tmp_path / 'rates.npz')
+    with BulkWriter(path, 'user,movie,rate,time', ',', npz_path=npz_path, buffer_size=16) as writer:
+        writer.write_columns([np.arange(3, dtype=np.int32), [10001, 10002, 10003], [1, 2, 3], ['a', 'b', 'c']])
+        writer.write_rows([(3, 10004, 4, 'd'), (4, 10005, 5, 'e')], block_rows=1)
+    assert sorted(os.listdir(tmp_path)) == ['rates.csv', 'rates.npz']
+    with np.load(npz_path) as arrays:
+        assert sorted(arrays.files) == ['movie', 'rate', 'user']
+        assert arrays['user'].tolist() == [0, 1, 2, 3, 4]
+        assert arrays['movie'].tolist() == [10001, 10002, 10003, 10004, 10005]
+        assert arrays['rate'].dtype == np.int64
+    with open(path) as f:
+        assert f.read().splitlines()[-1] == '4,10005,5,e'
+
+def test_bulk_writer_empty_npz(tmp_path):
+    npz_path = str(tmp_path / 'rates.npz')
+    with BulkWriter(None, 'user,movie', ',', npz_path=npz_path):
+        pass
+    with np.load(npz_path) as arrays:
+        assert arrays['user'].shape == (0,) and arrays['movie'].dtype == np.int64